@@ -0,0 +1,119 @@
+'''
+Compares cart line item writes committed one per request with LEDGER_BUFFER write-behind.
+
+For each mode, starts the app against a scratch database (never POSTGRES_URI), resets the shop,
+delivers --stock of every catalog potion, then has --carts carts add --items line items each at
+the same moment and check out. Reports line item and checkout throughput and p50/p99 latency,
+and exits 1 if checkout totals disagree with the ledger or any potion was sold past its stock.
+
+    BENCHMARK_POSTGRES_URI=postgresql+psycopg://... API_KEY=... python -m benchmarks.cart_burst --carts 200
+'''
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+import httpx
+
+os.environ["POSTGRES_URI"] = os.environ["BENCHMARK_POSTGRES_URI"]
+
+from benchmarks.concurrency import wait_until_up  # noqa: E402
+from benchmarks.game_day import run_server  # noqa: E402
+from benchmarks.stock_contention import get_potions, get_stock, open_carts  # noqa: E402
+from src import database as db  # noqa: E402
+
+MODES = {"direct": "0", "buffered": "1"}
+
+
+async def timed_all(calls):
+    latencies = []
+
+    async def one(call):
+        started = time.perf_counter()
+        response = await call()
+        latencies.append(time.perf_counter() - started)
+        response.raise_for_status()
+        return response
+
+    started = time.perf_counter()
+    responses = await asyncio.gather(*(one(call) for call in calls))
+    return responses, time.perf_counter() - started, latencies
+
+
+async def run(port: int, carts: int, items: int, stock: int):
+    headers = {"access_token": os.environ.get("API_KEY", "")}
+    limits = httpx.Limits(max_connections=carts, max_keepalive_connections=carts)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", headers=headers, timeout=120, limits=limits) as client:
+        await wait_until_up(client)
+
+        with db.engine.begin() as connection:
+            potions = connection.execute(get_potions).all()
+
+        (await client.post("/admin/reset")).raise_for_status()
+        order_id = int(time.time() * 1000)
+        delivery = [{"potion_type": list(potion.potion_type), "quantity": stock} for potion in potions]
+        (await client.post(f"/bottler/deliver/{order_id}", json=delivery)).raise_for_status()
+
+        skus = [potion.name for potion in potions]
+        cart_ids = await open_carts(client, carts, visit_id=order_id + 1)
+
+        add = [lambda cart_id=cart_id, sku=skus[(i + j) % len(skus)]:
+               client.post(f"/carts/{cart_id}/items/{sku}", json={"quantity": 1})
+               for i, cart_id in enumerate(cart_ids) for j in range(items)]
+        _, add_elapsed, add_latencies = await timed_all(add)
+
+        checkout = [lambda cart_id=cart_id: client.post(f"/carts/{cart_id}/checkout", json={"payment": "gold"})
+                    for cart_id in cart_ids]
+        totals, checkout_elapsed, checkout_latencies = await timed_all(checkout)
+
+        buffer = (await client.get("/admin/cache")).json().get("ledger_buffer", {})
+
+    return {"add": (add_elapsed, add_latencies), "checkout": (checkout_elapsed, checkout_latencies),
+            "bought": sum(total.json()["total_potions_bought"] for total in totals), "buffer": buffer}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--carts", type=int, default=200, help="carts buying at the same time")
+    parser.add_argument("--items", type=int, default=5, help="line items each cart adds")
+    parser.add_argument("--stock", type=int, default=1000, help="potions of each type bottled before the burst")
+    parser.add_argument("--port", type=int, default=3400)
+    args = parser.parse_args()
+
+    failed = False
+    print(f"{'mode':>9} {'phase':>9} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9}")
+
+    for mode, setting in MODES.items():
+        os.environ["LEDGER_BUFFER"] = setting
+        server = run_server(args.port)
+        try:
+            result = asyncio.run(run(args.port, args.carts, args.items, args.stock))
+        finally:
+            server.terminate()
+            server.wait()
+
+        for phase in ("add", "checkout"):
+            elapsed, latencies = result[phase]
+            cuts = statistics.quantiles(latencies, n=100, method="inclusive")
+            print(f"{mode:>9} {phase:>9} {len(latencies) / elapsed:>9.1f} {cuts[49] * 1000:>9.2f} {cuts[98] * 1000:>9.2f}")
+
+        with db.engine.begin() as connection:
+            stock = connection.execute(get_stock).all()
+
+        # Every potion checked out must be in the ledger, and no stock row may go below zero
+        sold = sum(args.stock - ledger_qty for _, _, ledger_qty in stock)
+        if result["bought"] != sold:
+            print(f"FAIL {mode}: checkouts bought {result['bought']}, ledger sold {sold}")
+            failed = True
+        for name, available, ledger_qty in stock:
+            if available is not None and (available < 0 or available != ledger_qty):
+                print(f"FAIL {mode} {name}: stock row {available}, ledger {ledger_qty}")
+                failed = True
+
+        if setting == "1":
+            print(f"{'':>9} {result['buffer'].get('flushes', 0)} flushes for {result['buffer'].get('written', 0)} items, "
+                  f"{result['buffer'].get('dropped', 0)} dropped")
+
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,118 @@
+'''
+Load test for the sync (threadpool + psycopg) and async (asyncpg) database layers.
+
+Starts the app once per mode against a scratch database (never POSTGRES_URI), resets the shop
+and bottles --stock of every catalog potion, then fires concurrent requests at the hot endpoints
+and reports throughput and p50/p99 latency. The catalog and inventory caches are disabled so
+every request reaches the database.
+
+    BENCHMARK_POSTGRES_URI=postgresql+psycopg://... API_KEY=... python -m benchmarks.concurrency
+'''
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+os.environ["POSTGRES_URI"] = os.environ["BENCHMARK_POSTGRES_URI"]
+
+from sqlalchemy import text  # noqa: E402
+from src import database as db  # noqa: E402
+
+get_potion_types =  text('''SELECT ARRAY[r, g, b, d] AS potion_type
+                            FROM catalog
+                            ORDER BY id''')
+
+ENDPOINTS = {
+    "catalog": ("GET", "/catalog/"),
+    "audit": ("GET", "/inventory/audit"),
+}
+
+
+async def wait_until_up(client: httpx.AsyncClient, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            await client.get("/")
+            return
+        except httpx.TransportError:
+            await asyncio.sleep(0.2)
+    raise RuntimeError("server did not start")
+
+
+async def hammer(client: httpx.AsyncClient, method: str, path: str, requests: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    samples = []
+
+    async def one():
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.request(method, path)
+            response.raise_for_status()
+            samples.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - started
+
+    cuts = statistics.quantiles(samples, n=100, method="inclusive")
+    return requests / elapsed, cuts[49] * 1000, cuts[98] * 1000
+
+
+async def stock_shop(client: httpx.AsyncClient, stock: int):
+    '''
+    Resets the shop and bottles stock of every catalog potion, so the endpoints have an epoch and
+    rows to read.
+    '''
+    with db.engine.begin() as connection:
+        potion_types = connection.execute(get_potion_types).scalars().all()
+
+    (await client.post("/admin/reset")).raise_for_status()
+    delivery = [{"potion_type": list(potion_type), "quantity": stock} for potion_type in potion_types]
+    (await client.post(f"/bottler/deliver/{int(time.time() * 1000)}", json=delivery)).raise_for_status()
+
+
+async def measure(port: int, requests: int, concurrency: int, stock: int):
+    headers = {"access_token": os.environ.get("API_KEY", "")}
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", headers=headers, timeout=60) as client:
+        await wait_until_up(client)
+        await stock_shop(client, stock)
+        return {name: await hammer(client, method, path, requests, concurrency)
+                for name, (method, path) in ENDPOINTS.items()}
+
+
+def run_mode(mode: str, port: int, requests: int, concurrency: int, stock: int):
+    environment = os.environ | {
+        "POSTGRES_URI": os.environ["BENCHMARK_POSTGRES_URI"],
+        "ASYNC_DATABASE": "1" if mode == "async" else "0",
+        "CATALOG_CACHE_TTL": "0",
+        "INVENTORY_CACHE_TTL": "0",
+    }
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "src.api.server:app", "--port", str(port),
+                               "--log-level", "warning"], env=environment)
+    try:
+        return asyncio.run(measure(port, requests, concurrency, stock))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--stock", type=int, default=100, help="potions of each type bottled before measuring")
+    parser.add_argument("--port", type=int, default=3100)
+    args = parser.parse_args()
+
+    results = {mode: run_mode(mode, args.port, args.requests, args.concurrency, args.stock) for mode in ("sync", "async")}
+
+    print(f"{'endpoint':>10} {'mode':>6} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9}")
+    for name in ENDPOINTS:
+        for mode, endpoints in results.items():
+            throughput, p50, p99 = endpoints[name]
+            print(f"{name:>10} {mode:>6} {throughput:>9.1f} {p50:>9.2f} {p99:>9.2f}")
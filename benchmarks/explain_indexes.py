@@ -0,0 +1,102 @@
+'''
+EXPLAIN ANALYZE regression check: runs each router's read queries against a scratch database
+(never POSTGRES_URI), captures the SQL they send, and re-runs every statement under
+EXPLAIN (ANALYZE, FORMAT JSON) with sequential scans disabled. Any Seq Scan left on a ledger,
+cart or customer table means the query no longer has an index to use, and the script exits 1.
+
+Seed the database first (e.g. python -m benchmarks.search_orders --seed 100000) so plans
+reflect real row counts.
+
+    BENCHMARK_POSTGRES_URI=postgresql+psycopg://... python -m benchmarks.explain_indexes
+'''
+import argparse
+import json
+import os
+import sys
+
+os.environ["POSTGRES_URI"] = os.environ["BENCHMARK_POSTGRES_URI"]
+
+from sqlalchemy import event  # noqa: E402
+from src import database as db  # noqa: E402
+from src.api import barrels, bottler, carts, catalog, inventory  # noqa: E402
+
+# Partitions show up under their own names, so tables are matched by prefix
+INDEXED_TABLES = ("potion_ledger", "barrel_ledger", "capacity_ledger", "carts", "customers", "visits")
+
+
+def routes(cart_id: int):
+    '''
+    The read paths to check, as (name, call) pairs. Calls that need a connection run inside a
+    transaction that is rolled back.
+    '''
+    wholesale = [barrels.Barrel(sku="SMALL_RED_BARREL", ml_per_barrel=500, potion_type=[1, 0, 0, 0], price=100, quantity=10)]
+
+    return [
+        ("catalog", lambda connection: catalog.read_catalog(connection)),
+        ("inventory audit", lambda connection: inventory.load_inventory()),
+        ("capacity plan", lambda connection: inventory.get_capacity_plan()),
+        ("barrel plan", lambda connection: barrels.get_wholesale_purchase_plan(wholesale)),
+        ("bottle plan", lambda connection: bottler.get_bottle_plan()),
+        ("order search", lambda connection: carts.search_orders()),
+        ("order search by name", lambda connection: carts.search_orders(customer_name="bench", potion_sku="potion")),
+        ("checkout totals", lambda connection: carts.checkout_totals(connection, cart_id)),
+    ]
+
+
+def capture(call):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(("SELECT", "WITH")):
+            statements.append((statement, parameters))
+
+    event.listen(db.engine, "before_cursor_execute", record)
+    try:
+        with db.engine.connect() as connection:
+            call(connection)
+            connection.rollback()
+    finally:
+        event.remove(db.engine, "before_cursor_execute", record)
+
+    return statements
+
+
+def seq_scans(node: dict):
+    if node.get("Node Type") == "Seq Scan" and node.get("Relation Name", "").startswith(INDEXED_TABLES):
+        yield node["Relation Name"]
+    for child in node.get("Plans", []):
+        yield from seq_scans(child)
+
+
+def explain(statement: str, parameters):
+    with db.engine.connect() as connection:
+        connection.exec_driver_sql("SET LOCAL enable_seqscan = off")
+        cursor = connection.connection.cursor()
+        cursor.execute("EXPLAIN (ANALYZE, FORMAT JSON) " + statement, parameters)
+        plan = cursor.fetchone()[0]
+        connection.rollback()
+
+    plan = plan if isinstance(plan, list) else json.loads(plan)
+    return plan[0]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cart-id", type=int, default=1, help="cart to total for the checkout query")
+    parser.add_argument("--verbose", action="store_true", help="print each statement's execution time")
+    args = parser.parse_args()
+
+    failures = 0
+    for name, call in routes(args.cart_id):
+        for statement, parameters in capture(call):
+            plan = explain(statement, parameters)
+            scanned = sorted(set(seq_scans(plan["Plan"])))
+            if scanned:
+                failures += 1
+                print(f"FAIL {name}: seq scan on {', '.join(scanned)}")
+                print(statement.strip())
+            elif args.verbose:
+                print(f"ok   {name}: {plan['Execution Time']:.2f}ms")
+
+    print(f"{failures} statement(s) without an index" if failures else "every router query stays on an index")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,194 @@
+'''
+Replays a recorded Potion Exchange day against the app and checks it against a stored baseline.
+
+Seeds a scratch database (never POSTGRES_URI) with ledger history, starts the app, resets the
+shop and replays benchmarks/data/game_day.json tick by tick: current time, catalog, visits,
+carts, barrel, bottler and capacity plans, and their deliveries. Reports per-endpoint
+throughput, p50/p95/p99 latency and stockouts (cart items refused with a 409 because the SKU
+sold out after the tick's catalog was read), then exits 1 if any endpoint's p95 regressed past the
+baseline by more than --tolerance. Baselines are machine-specific; save one before tuning.
+
+    BENCHMARK_POSTGRES_URI=postgresql+psycopg://... API_KEY=... python -m benchmarks.game_day --seed 100000 --save-baseline
+    BENCHMARK_POSTGRES_URI=postgresql+psycopg://... API_KEY=... python -m benchmarks.game_day --days 3
+'''
+import argparse
+import asyncio
+import collections
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+from benchmarks.concurrency import wait_until_up
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+
+class Recorder:
+    '''
+    Times every call by endpoint name and counts the accepted refusals; any other non-2xx
+    response fails the replay.
+    '''
+
+    def __init__(self, client: httpx.AsyncClient):
+        self.client = client
+        self.samples = collections.defaultdict(list)
+        self.refused = collections.Counter()
+
+    async def call(self, name: str, method: str, path: str, body = None, accept: tuple = ()):
+        started = time.perf_counter()
+        response = await self.client.request(method, path, json=body)
+        self.samples[name].append(time.perf_counter() - started)
+        if response.status_code in accept:
+            self.refused[name] += 1
+            return None
+        response.raise_for_status()
+        return response.json()
+
+
+async def replay_cart(recorder: Recorder, customer: dict, items: list[dict], listed: list[dict]):
+    cart_id = (await recorder.call("carts/create", "POST", "/carts/", customer))["cart_id"]
+    for item in items:
+        if listed:
+            sku = listed[item["pick"] % len(listed)]["sku"]
+            # Other carts in the tick can sell the SKU out after the catalog was read
+            await recorder.call("carts/items", "POST", f"/carts/{cart_id}/items/{sku}", {"quantity": item["quantity"]},
+                                accept=(409,))
+    await recorder.call("carts/checkout", "POST", f"/carts/{cart_id}/checkout", {"payment": "gold"})
+
+
+async def replay_tick(recorder: Recorder, tick: dict, wholesale: list[dict], order_ids, concurrency: int):
+    await recorder.call("info/current_time", "POST", "/info/current_time", {"day": tick["day"], "hour": tick["hour"]})
+    listed = await recorder.call("catalog", "GET", "/catalog/")
+    await recorder.call("carts/visits", "POST", f"/carts/visits/{tick['visit_id']}", tick["customers"])
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def cart(recorded: dict):
+        async with semaphore:
+            await replay_cart(recorder, tick["customers"][recorded["customer"]], recorded["items"], listed)
+
+    await asyncio.gather(*(cart(recorded) for recorded in tick["carts"]))
+
+    if tick["barrels"]:
+        plan = await recorder.call("barrels/plan", "POST", "/barrels/plan", wholesale)
+        if plan:
+            await recorder.call("barrels/deliver", "POST", f"/barrels/deliver/{next(order_ids)}", plan)
+
+    if tick["bottler"]:
+        plan = await recorder.call("bottler/plan", "POST", "/bottler/plan")
+        if plan:
+            await recorder.call("bottler/deliver", "POST", f"/bottler/deliver/{next(order_ids)}", plan)
+
+    if tick["inventory"]:
+        plan = await recorder.call("inventory/plan", "POST", "/inventory/plan")
+        if any(plan.values()):
+            await recorder.call("inventory/deliver", "POST", f"/inventory/deliver/{next(order_ids)}", plan)
+
+
+async def replay(port: int, day: dict, days: int, concurrency: int):
+    headers = {"access_token": os.environ.get("API_KEY", "")}
+    # Order ids only need to be unique across runs against the same database
+    order_ids = iter(range(int(time.time()) * 1000, sys.maxsize))
+
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", headers=headers, timeout=60) as client:
+        await wait_until_up(client)
+        recorder = Recorder(client)
+        (await client.post("/admin/reset")).raise_for_status()
+
+        started = time.perf_counter()
+        for _ in range(days):
+            for tick in day["ticks"]:
+                await replay_tick(recorder, tick, day["wholesale_catalog"], order_ids, concurrency)
+        elapsed = time.perf_counter() - started
+
+    return recorder.samples, recorder.refused, elapsed
+
+
+def summarize(samples: dict, stockouts: dict):
+    '''
+    Per endpoint: calls, throughput (calls per second of time spent in that endpoint),
+    p50/p95/p99 latency in milliseconds and stockouts.
+    '''
+    summary = {}
+    for name, seconds in sorted(samples.items()):
+        cuts = statistics.quantiles(seconds, n=100, method="inclusive") if len(seconds) > 1 else [seconds[0]] * 99
+        summary[name] = {"calls": len(seconds), "throughput": len(seconds) / sum(seconds),
+                         "p50": cuts[49] * 1000, "p95": cuts[94] * 1000, "p99": cuts[98] * 1000,
+                         "stockouts": stockouts.get(name, 0)}
+    return summary
+
+
+def regressions(summary: dict, baseline: dict, tolerance: float, floor_ms: float):
+    '''
+    Endpoints whose p95 exceeds the baseline by more than tolerance, ignoring differences under
+    floor_ms that are within timer noise.
+    '''
+    for name, current in summary.items():
+        previous = baseline.get(name)
+        if previous and current["p95"] > previous["p95"] * (1 + tolerance) and current["p95"] - previous["p95"] > floor_ms:
+            yield name, previous["p95"], current["p95"]
+
+
+def run_server(port: int):
+    environment = os.environ | {"POSTGRES_URI": os.environ["BENCHMARK_POSTGRES_URI"]}
+    return subprocess.Popen([sys.executable, "-m", "uvicorn", "src.api.server:app", "--port", str(port),
+                             "--log-level", "warning"], env=environment)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--day", default=os.path.join(DATA_DIR, "game_day.json"), help="recorded day to replay")
+    parser.add_argument("--days", type=int, default=1, help="times to replay the day after one reset")
+    parser.add_argument("--seed", type=int, default=0, help="potion ledger history rows to insert first")
+    parser.add_argument("--customers", type=int, default=10000, help="customers to spread seeded history over")
+    parser.add_argument("--concurrency", type=int, default=4, help="carts replayed at once within a tick")
+    parser.add_argument("--port", type=int, default=3200)
+    parser.add_argument("--baseline", default=os.path.join(DATA_DIR, "game_day_baseline.json"))
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p95 slowdown, as a fraction")
+    parser.add_argument("--floor-ms", type=float, default=2.0, help="p95 differences below this never fail")
+    args = parser.parse_args()
+
+    if args.seed:
+        # Seeding runs in-process on the scratch database before the server starts
+        from benchmarks import search_orders
+        search_orders.seed(args.seed, args.customers, batch=100000)
+
+    with open(args.day) as recorded:
+        day = json.load(recorded)
+
+    server = run_server(args.port)
+    try:
+        samples, stockouts, elapsed = asyncio.run(replay(args.port, day, args.days, args.concurrency))
+    finally:
+        server.terminate()
+        server.wait()
+
+    summary = summarize(samples, stockouts)
+    ticks = len(day["ticks"]) * args.days
+    print(f"{ticks} ticks in {elapsed:.2f}s ({elapsed / ticks * 1000:.1f} ms/tick)")
+    print(f"{'endpoint':>18} {'calls':>6} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'stockouts':>9}")
+    for name, row in summary.items():
+        print(f"{name:>18} {row['calls']:>6} {row['throughput']:>9.1f} {row['p50']:>9.2f} {row['p95']:>9.2f} {row['p99']:>9.2f} {row['stockouts']:>9}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as baseline:
+            json.dump(summary, baseline, indent=2)
+        print(f"saved baseline to {args.baseline}")
+        sys.exit(0)
+
+    if not os.path.exists(args.baseline):
+        print("no baseline to compare against; rerun with --save-baseline")
+        sys.exit(0)
+
+    with open(args.baseline) as baseline:
+        slower = list(regressions(summary, json.load(baseline), args.tolerance, args.floor_ms))
+
+    for name, before, after in slower:
+        print(f"REGRESSION {name}: p95 {before:.2f}ms -> {after:.2f}ms")
+    sys.exit(1 if slower else 0)
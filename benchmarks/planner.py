@@ -0,0 +1,75 @@
+'''
+Compares barrel and bottle planning latency for the in-process exact solver, PuLP's CBC
+subprocess, and memoized repeats of the same tick, plus every recorded state planned as one
+what-if batch. Needs no database.
+
+    python -m benchmarks.planner --ticks benchmarks/data/planning_ticks.json
+'''
+import argparse
+import json
+import os
+import statistics
+import time
+
+from src.planning import plans
+from src.planning.state import ShopStates, Strategy
+
+
+def timed(call, repeat: int):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        call()
+        samples.append(time.perf_counter() - started)
+    cuts = statistics.quantiles(samples, n=100, method="inclusive")
+    return cuts[49] * 1000, cuts[98] * 1000
+
+
+def problems(ticks: dict):
+    for catalog_name, catalog in ticks["catalogs"].items():
+        for index, state in enumerate(ticks["states"]):
+            yield f"barrels {catalog_name}/{index}", lambda catalog=catalog, state=state: plans.barrel_plan(catalog, **state)
+    for index, bottles in enumerate(ticks["bottles"]):
+        yield f"bottles {index}", lambda bottles=bottles: plans.bottle_plan(**bottles)
+    # Joint barrel + bottle plans for each state, bottling the first recorded potion set
+    potions, available_space = ticks["bottles"][0]["potions"], ticks["bottles"][0]["available_space"]
+    for index, state in enumerate(ticks["states"]):
+        yield f"tick full/{index}", lambda state=state: plans.tick_plan(ticks["catalogs"]["full"], **state, potions=potions,
+                                                                          available_space=available_space)
+
+    states = ShopStates([state["gold"] for state in ticks["states"]], [state["volumes"] for state in ticks["states"]], 0,
+                        available_space, [state["vol_capacity"] for state in ticks["states"]])
+    strategy = Strategy.from_potions(potions, ticks["states"][0]["tolerance"], ticks["states"][0]["target"])
+    yield f"tick batch/{len(states)}", lambda: plans.tick_plans(ticks["catalogs"]["full"], states, strategy)
+
+
+def cold(plan):
+    def call():
+        plans.memo._plans.clear()
+        return plan()
+    return call
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ticks", default=os.path.join(os.path.dirname(__file__), "data", "planning_ticks.json"))
+    parser.add_argument("--repeat", type=int, default=30)
+    args = parser.parse_args()
+
+    with open(args.ticks) as ticks_file:
+        ticks = json.load(ticks_file)
+
+    print(f"{'problem':>22} {'exact p50':>10} {'exact p99':>10} {'cbc p50':>10} {'cbc p99':>10} {'memo p50':>10}")
+    for name, plan in problems(ticks):
+        os.environ["PLANNER_SOLVER"] = "cbc"
+        cbc = timed(cold(plan), args.repeat)
+        cbc_plan = cold(plan)()
+
+        os.environ["PLANNER_SOLVER"] = "exact"
+        exact = timed(cold(plan), args.repeat)
+        exact_plan = cold(plan)()
+
+        memoized = timed(plan, args.repeat)
+
+        agrees = "" if exact_plan == cbc_plan else "  (plans differ; check objective ties)"
+        print(f"{name:>22} {exact[0]:>10.2f} {exact[1]:>10.2f} {cbc[0]:>10.2f} {cbc[1]:>10.2f} {memoized[0]:>10.3f}{agrees}")
@@ -0,0 +1,68 @@
+'''
+Checks read routing against a scratch database (never POSTGRES_URI): the read pool refuses
+writes, a search carrying the caller's fresh cart write token reads the primary, and searches
+without a token, or with one older than READ_YOUR_WRITES_SECONDS, use the read pool. Works with
+one instance (two pools) or with a replica given as BENCHMARK_REPLICA_URI.
+
+    BENCHMARK_POSTGRES_URI=postgresql+psycopg://... python -m benchmarks.read_routing
+'''
+import os
+import sys
+import time
+
+os.environ["POSTGRES_URI"] = os.environ["BENCHMARK_POSTGRES_URI"]
+if os.environ.get("BENCHMARK_REPLICA_URI"):
+    os.environ["POSTGRES_REPLICA_URI"] = os.environ["BENCHMARK_REPLICA_URI"]
+
+from sqlalchemy import event, exc, text  # noqa: E402
+from src import database as db  # noqa: E402
+from src.api import carts  # noqa: E402
+
+
+def engines_used(call):
+    '''
+    Runs call() and returns which engines ("primary", "reads") executed statements.
+    '''
+    used = set()
+    listeners = {db.engine: "primary", db.reads: "reads"}
+    hooks = {engine: (lambda name: lambda *args: used.add(name))(name) for engine, name in listeners.items()}
+    for engine, hook in hooks.items():
+        event.listen(engine, "before_cursor_execute", hook)
+    try:
+        call()
+    finally:
+        for engine, hook in hooks.items():
+            event.remove(engine, "before_cursor_execute", hook)
+    return used
+
+
+def check(description: str, passed: bool):
+    print(f"{'ok  ' if passed else 'FAIL'} {description}")
+    return passed
+
+
+if __name__ == "__main__":
+    if db.reads is db.engine:
+        sys.exit("DB_READ_POOL_SIZE=0 disables read routing; nothing to check")
+
+    results = []
+
+    try:
+        with db.reads.begin() as connection:
+            connection.execute(text("UPDATE resets SET timestamp = timestamp WHERE FALSE"))
+        refused = False
+    except exc.DBAPIError:
+        refused = True
+    results.append(check("read pool refuses writes", refused))
+
+    def search(token):
+        return engines_used(lambda: carts.search_orders(x_cart_written_at = token))
+
+    results.append(check("search without a write token uses the read pool", search(None) == {"reads"}))
+    results.append(check("search right after the caller's cart write reads the primary",
+                         search(db.written_at()) == {"primary"}))
+    results.append(check("search with a write token past the window uses the read pool",
+                         search(f"{time.time() - db.READ_YOUR_WRITES_SECONDS - 1:.3f}") == {"reads"}))
+    results.append(check("search with a malformed write token uses the read pool", search("soon") == {"reads"}))
+
+    sys.exit(0 if all(results) else 1)
@@ -0,0 +1,144 @@
+'''
+Compares /carts/search/ keyset pagination against the previous LIMIT/OFFSET query.
+
+Seeds a scratch database (never POSTGRES_URI) with ledger rows for existing catalog potions,
+then times page 1 through deep pages for both approaches and reports p50/p99 in milliseconds.
+
+    BENCHMARK_POSTGRES_URI=postgresql+psycopg://... python -m benchmarks.search_orders --seed 1000000
+'''
+import argparse
+import os
+import statistics
+import time
+
+os.environ["POSTGRES_URI"] = os.environ["BENCHMARK_POSTGRES_URI"]
+
+from sqlalchemy import text  # noqa: E402
+from src import database as db  # noqa: E402
+from src.api import carts  # noqa: E402
+
+seed_customers =    text('''INSERT INTO customers (name, class, level)
+                            SELECT 'bench_customer_' || i, 'Benchmark', 1 + i % 20
+                            FROM generate_series(1, :customers) AS i
+                            ON CONFLICT DO NOTHING''')
+
+seed_carts =    text('''INSERT INTO carts (customer_id)
+                        SELECT id
+                        FROM customers
+                        WHERE class = 'Benchmark' ''')
+
+seed_ledger =   text('''WITH potions AS (SELECT array_agg(ARRAY[r, g, b, d]) AS types, array_agg(id) AS ids,
+                                                count(*)::INT AS n
+                                         FROM catalog),
+                             cart_ids AS (SELECT array_agg(carts.cart_id) AS ids, count(*)::INT AS n
+                                          FROM carts
+                                          JOIN customers ON customers.id = carts.customer_id
+                                          WHERE customers.class = 'Benchmark'),
+                             rows AS (SELECT i, 1 + i % potions.n AS potion, 1 + i % cart_ids.n AS cart
+                                      FROM generate_series(:start, :stop - 1) AS i, potions, cart_ids),
+                             new_ledger AS (INSERT INTO potion_ledger (potion_id, red, green, blue, dark, qty, timestamp)
+                                            SELECT potions.ids[rows.potion], potions.types[rows.potion][1], potions.types[rows.potion][2],
+                                                   potions.types[rows.potion][3], potions.types[rows.potion][4],
+                                                   -(1 + rows.i % 3), now() - rows.i * INTERVAL '1 second'
+                                            FROM rows, potions
+                                            RETURNING ledger_id, potion_id)
+                        INSERT INTO potion_ledger_carts (cart_id, potion_ledger_id, price)
+                        SELECT cart_ids.ids[1 + new_ledger.ledger_id % cart_ids.n], new_ledger.ledger_id, catalog.price
+                        FROM new_ledger
+                        JOIN catalog ON catalog.id = new_ledger.potion_id,
+                             cart_ids''')
+
+# The search query as it stood before keyset pagination, kept here as the comparison baseline
+offset_query =  text('''SELECT customers.id AS line_item_id,
+                               customers.name AS customer_name,
+                               catalog.name AS item_sku,
+                               COALESCE(SUM(-potion_ledger.qty * potion_ledger_carts.price), 0)::INT AS line_item_total,
+                               potion_ledger.timestamp AS timestamp,
+                               COUNT(potion_ledger.ledger_id) AS row_count
+                        FROM potion_ledger
+                        JOIN catalog ON (catalog.r, catalog.g, catalog.b, catalog.d) IN ((potion_ledger.red,
+                                                                                        potion_ledger.green,
+                                                                                        potion_ledger.blue,
+                                                                                        potion_ledger.dark))
+                        JOIN potion_ledger_carts ON potion_ledger_carts.potion_ledger_id = potion_ledger.ledger_id
+                        JOIN carts ON carts.cart_id = potion_ledger_carts.cart_id
+                        JOIN customers ON customers.id = carts.customer_id
+                        GROUP BY customers.id, catalog.name, potion_ledger.ledger_id
+                        HAVING (:customer_name = '' OR customers.name ILIKE :customer_name)
+                            AND (:potion_sku = '' OR catalog.name ILIKE :potion_sku)
+                        ORDER BY timestamp DESC
+                        LIMIT 5 OFFSET :search_page * 5''')
+
+page_start =    text('''SELECT potion_ledger.timestamp, potion_ledger.ledger_id
+                        FROM potion_ledger
+                        JOIN potion_ledger_carts ON potion_ledger_carts.potion_ledger_id = potion_ledger.ledger_id
+                        ORDER BY potion_ledger.timestamp DESC, potion_ledger.ledger_id DESC
+                        OFFSET :offset
+                        LIMIT 1''')
+
+
+def seed(rows: int, customers: int, batch: int):
+    with db.engine.begin() as connection:
+        connection.execute(seed_customers, {"customers": customers})
+        connection.execute(seed_carts)
+
+    for start in range(0, rows, batch):
+        with db.engine.begin() as connection:
+            connection.execute(seed_ledger, {"start": start, "stop": min(start + batch, rows)})
+        print(f"seeded {min(start + batch, rows)}/{rows} ledger rows")
+
+    with db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.execute(text("ANALYZE potion_ledger, potion_ledger_carts, carts, customers"))
+
+
+def percentiles(samples: list[float]):
+    cuts = statistics.quantiles(samples, n=100, method="inclusive")
+    return cuts[49] * 1000, cuts[98] * 1000
+
+
+def timed(call, repeat: int):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        call()
+        samples.append(time.perf_counter() - started)
+    return percentiles(samples)
+
+
+def run(pages: list[int], repeat: int, customer_name: str):
+    print(f"{'page':>8} {'offset p50':>11} {'offset p99':>11} {'keyset p50':>11} {'keyset p99':>11}")
+
+    for page in pages:
+        token = ""
+        if page:
+            with db.engine.begin() as connection:
+                timestamp, ledger_id = connection.execute(page_start, {"offset": page * carts.SEARCH_PAGE_SIZE - 1}).one()
+            token = carts.encode_search_page("next", timestamp, ledger_id)
+
+        def offset_page():
+            with db.engine.begin() as connection:
+                connection.execute(offset_query, {"customer_name": f"%{customer_name}%" if customer_name else "",
+                                                  "potion_sku": "", "search_page": page}).all()
+
+        def keyset_page():
+            carts.search_orders(customer_name=customer_name, search_page=token)
+
+        offset_p50, offset_p99 = timed(offset_page, repeat)
+        keyset_p50, keyset_p99 = timed(keyset_page, repeat)
+        print(f"{page:>8} {offset_p50:>11.2f} {offset_p99:>11.2f} {keyset_p50:>11.2f} {keyset_p99:>11.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seed", type=int, default=0, help="ledger rows to insert before timing")
+    parser.add_argument("--customers", type=int, default=10000)
+    parser.add_argument("--batch", type=int, default=100000)
+    parser.add_argument("--pages", type=int, nargs="+", default=[0, 10, 1000, 50000])
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--customer-name", default="", help="optional name filter applied to both approaches")
+    args = parser.parse_args()
+
+    if args.seed:
+        seed(args.seed, args.customers, args.batch)
+
+    run(args.pages, args.repeat, args.customer_name)
@@ -0,0 +1,101 @@
+'''
+Measures a cold start of the app the way a fresh serverless instance pays for it: importing
+src.api.server in a new interpreter (timed per module with -X importtime), then running the
+lifespan startup and answering a first request. Needs no database unless --prewarm is given;
+a placeholder POSTGRES_URI is used when none is set, since engines only connect on first use.
+
+    python -m benchmarks.startup --runs 5 --top 15
+'''
+import argparse
+import collections
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Runs in the child interpreter: lifespan startup and one request against the in-process app
+FIRST_REQUEST = '''
+import asyncio, json, sys, time
+import httpx
+sys.stderr.write("%s\\n" % "{marker}")
+started = time.perf_counter()
+from src.api import server
+imported = time.perf_counter()
+sys.stderr.write("%s\\n" % "{marker}")
+
+async def main():
+    async with server.app.router.lifespan_context(server.app):
+        started_up = time.perf_counter()
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://startup") as client:
+            (await client.get("/")).raise_for_status()
+        return started_up
+
+started_up = asyncio.run(main())
+print(json.dumps({"import": imported - started, "lifespan": started_up - imported, "first request": time.perf_counter() - started_up}))
+'''.replace("{marker}", "-- server import --")
+
+
+def parse_importtime(stderr: str):
+    '''
+    {module: (self seconds, cumulative seconds)} from -X importtime output, for the modules the
+    server import itself loaded (the lines between the child's markers).
+    '''
+    modules = {}
+    for line in stderr.split("-- server import --")[1].splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        own, cumulative, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        modules[name.strip()] = (int(own) / 1e6, int(cumulative) / 1e6)
+    return modules
+
+
+def cold_start(environment: dict):
+    child = subprocess.run([sys.executable, "-X", "importtime", "-c", FIRST_REQUEST], env=environment,
+                           capture_output=True, text=True, check=True)
+    return json.loads(child.stdout.strip().splitlines()[-1]), parse_importtime(child.stderr)
+
+
+def by_package(modules: dict):
+    '''
+    Self time summed per top-level package, with src split by module.
+    '''
+    totals = collections.Counter()
+    for name, (own, _) in modules.items():
+        parts = name.split(".")
+        totals[".".join(parts[:3]) if parts[0] == "src" else parts[0]] += own
+    return totals
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters to time")
+    parser.add_argument("--top", type=int, default=15, help="modules and packages to list")
+    parser.add_argument("--prewarm", type=int, default=0, help="DB_PREWARM_CONNECTIONS for the lifespan (needs a database)")
+    args = parser.parse_args()
+
+    environment = os.environ | {"DB_PREWARM_CONNECTIONS": str(args.prewarm)}
+    environment.setdefault("POSTGRES_URI", "postgresql://startup@localhost/startup")
+
+    phases, runs = collections.defaultdict(list), []
+    for _ in range(args.runs):
+        timings, modules = cold_start(environment)
+        for phase, seconds in timings.items():
+            phases[phase].append(seconds)
+        runs.append(modules)
+
+    print(f"{'phase':>14} {'p50 ms':>9} {'max ms':>9}")
+    for phase, samples in phases.items():
+        print(f"{phase:>14} {statistics.median(samples) * 1000:>9.1f} {max(samples) * 1000:>9.1f}")
+
+    # Medians across runs, so one slow interpreter doesn't skew the ranking
+    names = set.intersection(*(set(modules) for modules in runs))
+    modules = {name: tuple(statistics.median(run[name][i] for run in runs) for i in (0, 1)) for name in names}
+
+    print(f"\n{'module':>40} {'self ms':>9} {'cumulative ms':>14}")
+    for name, (own, cumulative) in sorted(modules.items(), key=lambda item: -item[1][1])[:args.top]:
+        print(f"{name:>40} {own * 1000:>9.1f} {cumulative * 1000:>14.1f}")
+
+    print(f"\n{'package':>40} {'self ms':>9}")
+    for package, own in by_package(modules).most_common(args.top):
+        print(f"{package:>40} {own * 1000:>9.1f}")
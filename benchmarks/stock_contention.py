@@ -0,0 +1,145 @@
+'''
+Stress test for stock reservation: many carts at once buying more potions than were bottled.
+
+Starts the app against a scratch database (never POSTGRES_URI), resets the shop and delivers
+--stock of every catalog potion. Then --carts carts each add --quantity of a potion at the same
+moment, first all on one SKU (every cart queues on the same stock row), then spread over every
+SKU. Reports throughput and p50/p99 latency per phase, and exits 1 if any potion was sold past
+its stock, its stock row disagrees with the ledger, or the inventory balances (snapshot plus
+per-SKU sales) disagree with a full ledger recompute.
+
+    BENCHMARK_POSTGRES_URI=postgresql+psycopg://... API_KEY=... python -m benchmarks.stock_contention --carts 200
+'''
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+import httpx
+
+os.environ["POSTGRES_URI"] = os.environ["BENCHMARK_POSTGRES_URI"]
+
+from sqlalchemy import text  # noqa: E402
+from benchmarks.concurrency import wait_until_up  # noqa: E402
+from benchmarks.game_day import run_server  # noqa: E402
+from src import database as db  # noqa: E402
+from src import snapshot  # noqa: E402
+
+get_potions =   text('''SELECT name, ARRAY[r, g, b, d] AS potion_type
+                        FROM catalog
+                        ORDER BY id''')
+
+get_stock = text('''SELECT catalog.name, stock.available, COALESCE(ledger.qty, 0) AS ledger_qty
+                    FROM catalog
+                    LEFT JOIN potion_stock stock ON stock.potion_id = catalog.id AND stock.epoch = current_epoch()
+                    LEFT JOIN (SELECT potion_id, SUM(qty) AS qty
+                               FROM potion_ledger
+                               WHERE epoch = current_epoch()
+                               GROUP BY potion_id) AS ledger ON ledger.potion_id = catalog.id''')
+
+
+async def open_carts(client: httpx.AsyncClient, carts: int, visit_id: int):
+    customers = [{"customer_name": f"stock_customer_{i}", "character_class": "Benchmark", "level": 1} for i in range(carts)]
+    (await client.post(f"/carts/visits/{visit_id}", json=customers)).raise_for_status()
+
+    async def create(customer):
+        response = await client.post("/carts/", json=customer)
+        response.raise_for_status()
+        return response.json()["cart_id"]
+
+    return await asyncio.gather(*(create(customer) for customer in customers))
+
+
+async def buy_at_once(client: httpx.AsyncClient, cart_ids: list, skus: list, quantity: int):
+    '''
+    Adds quantity of a SKU to every cart concurrently. Returns (sold, rejected, elapsed, latencies).
+    '''
+    start = asyncio.Event()
+    latencies = []
+
+    async def buy(cart_id, sku):
+        await start.wait()
+        started = time.perf_counter()
+        response = await client.post(f"/carts/{cart_id}/items/{sku}", json={"quantity": quantity})
+        latencies.append(time.perf_counter() - started)
+        if response.status_code not in (200, 409):
+            response.raise_for_status()
+        return response.status_code == 200
+
+    tasks = [asyncio.create_task(buy(cart_id, skus[i % len(skus)])) for i, cart_id in enumerate(cart_ids)]
+    await asyncio.sleep(0)
+    started = time.perf_counter()
+    start.set()
+    results = await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+
+    return sum(results), len(results) - sum(results), elapsed, latencies
+
+
+async def run(port: int, carts: int, stock: int, quantity: int):
+    headers = {"access_token": os.environ.get("API_KEY", "")}
+    limits = httpx.Limits(max_connections=carts, max_keepalive_connections=carts)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", headers=headers, timeout=120, limits=limits) as client:
+        await wait_until_up(client)
+
+        with db.engine.begin() as connection:
+            potions = connection.execute(get_potions).all()
+
+        (await client.post("/admin/reset")).raise_for_status()
+        order_id = int(time.time() * 1000)
+        delivery = [{"potion_type": list(potion.potion_type), "quantity": stock} for potion in potions]
+        (await client.post(f"/bottler/deliver/{order_id}", json=delivery)).raise_for_status()
+
+        skus = [potion.name for potion in potions]
+        phases = {}
+        for phase, phase_skus in (("one sku", skus[:1]), ("every sku", skus)):
+            cart_ids = await open_carts(client, carts, visit_id=order_id + len(phases) + 1)
+            phases[phase] = await buy_at_once(client, cart_ids, phase_skus, quantity)
+
+    return phases
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--carts", type=int, default=200, help="carts buying at the same time")
+    parser.add_argument("--stock", type=int, default=50, help="potions of each type bottled before the rush")
+    parser.add_argument("--quantity", type=int, default=1, help="potions each cart asks for")
+    parser.add_argument("--port", type=int, default=3300)
+    args = parser.parse_args()
+
+    server = run_server(args.port)
+    try:
+        phases = asyncio.run(run(args.port, args.carts, args.stock, args.quantity))
+    finally:
+        server.terminate()
+        server.wait()
+
+    print(f"{'phase':>10} {'sold':>6} {'409s':>6} {'carts/s':>9} {'p50 ms':>9} {'p99 ms':>9}")
+    for phase, (sold, rejected, elapsed, latencies) in phases.items():
+        cuts = statistics.quantiles(latencies, n=100, method="inclusive")
+        print(f"{phase:>10} {sold:>6} {rejected:>6} {len(latencies) / elapsed:>9.1f} {cuts[49] * 1000:>9.2f} {cuts[98] * 1000:>9.2f}")
+
+    with db.engine.begin() as connection:
+        stock = connection.execute(get_stock).all()
+        mismatches = snapshot.verify(connection)
+
+    failed = False
+
+    # Only one SKU's stock was on offer in the first phase, so exactly that much should have sold
+    sold = phases["one sku"][0]
+    if sold != min(args.carts, args.stock // args.quantity):
+        print(f"FAIL one sku: sold to {sold} carts, expected {min(args.carts, args.stock // args.quantity)}")
+        failed = True
+
+    for name, available, ledger_qty in stock:
+        if available is not None and (available < 0 or available != ledger_qty):
+            print(f"FAIL {name}: stock row {available}, ledger {ledger_qty}")
+            failed = True
+
+    if mismatches:
+        print(f"FAIL inventory balances: {mismatches}")
+        failed = True
+
+    sys.exit(1 if failed else 0)
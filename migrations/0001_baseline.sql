@@ -0,0 +1,196 @@
+-- Baseline: the ledger model the routers actually use. Safe to apply over an existing database;
+-- every object is created only if it is missing.
+
+create table if not exists
+  public.resets (
+    id bigint generated by default as identity not null,
+    timestamp timestamp with time zone not null default now(),
+    constraint resets_pkey primary key (id)
+  ) tablespace pg_default;
+
+alter table public.resets add column if not exists id bigint generated by default as identity;
+
+create table if not exists
+  public.catalog (
+    name text not null,
+    price integer not null default 50,
+    r integer not null,
+    g integer not null,
+    b integer not null,
+    d integer not null,
+    listed boolean not null default false,
+    constraint catalog_pkey primary key (r, g, b, d),
+    constraint catalog_name_key unique (name)
+  ) tablespace pg_default;
+
+create table if not exists
+  public.customers (
+    id bigint generated by default as identity not null,
+    name text not null,
+    class text not null,
+    level bigint not null,
+    constraint customers_pkey primary key (id),
+    constraint customers_name_class_level_key unique (name, class, level)
+  ) tablespace pg_default;
+
+create table if not exists
+  public.visits (
+    id bigint generated by default as identity not null,
+    visit_id bigint not null,
+    customer_id bigint not null,
+    created_at timestamp with time zone not null default now(),
+    constraint visits_pkey primary key (id),
+    constraint visits_customer_id_fkey foreign key (customer_id) references customers (id)
+  ) tablespace pg_default;
+
+create table if not exists
+  public.carts (
+    cart_id bigint generated by default as identity not null,
+    customer_id bigint not null,
+    created_at timestamp with time zone not null default now(),
+    constraint carts_pkey primary key (cart_id),
+    constraint carts_customer_id_fkey foreign key (customer_id) references customers (id)
+  ) tablespace pg_default;
+
+create table if not exists
+  public.strategy (
+    day integer not null,
+    day_name text not null,
+    is_today boolean null,
+    tolerance double precision not null default '0.1'::double precision,
+    red_ratio double precision null,
+    green_ratio double precision null,
+    blue_ratio double precision null,
+    dark_ratio double precision null,
+    deviation integer null,
+    constraint strategy_pkey primary key (day)
+  ) tablespace pg_default;
+
+create table if not exists
+  public.strategy_potions (
+    day integer not null,
+    r integer not null,
+    g integer not null,
+    b integer not null,
+    d integer not null,
+    constraint strategy_potions_pkey primary key (day, r, g, b, d),
+    constraint strategy_potions_day_fkey foreign key (day) references strategy (day),
+    constraint strategy_potions_r_g_b_d_fkey foreign key (r, g, b, d) references catalog (r, g, b, d)
+  ) tablespace pg_default;
+
+create table if not exists
+  public.potion_ledger (
+    ledger_id bigint generated by default as identity not null,
+    timestamp timestamp with time zone not null default now(),
+    red integer not null,
+    green integer not null,
+    blue integer not null,
+    dark integer not null,
+    qty integer not null,
+    constraint potion_ledger_pkey primary key (ledger_id)
+  ) tablespace pg_default;
+
+create table if not exists
+  public.potion_ledger_carts (
+    potion_ledger_id bigint not null,
+    cart_id bigint not null,
+    price integer not null,
+    constraint potion_ledger_carts_pkey primary key (potion_ledger_id),
+    constraint potion_ledger_carts_cart_id_fkey foreign key (cart_id) references carts (cart_id)
+  ) tablespace pg_default;
+
+create table if not exists
+  public.potion_ledger_deliveries (
+    ledger_id bigint not null,
+    order_id bigint not null,
+    constraint potion_ledger_deliveries_pkey primary key (ledger_id)
+  ) tablespace pg_default;
+
+create table if not exists
+  public.barrel_purchase (
+    id bigint generated by default as identity not null,
+    order_id bigint not null,
+    size integer not null,
+    quantity integer not null,
+    cost integer not null,
+    created_at timestamp with time zone not null default now(),
+    constraint barrel_purchase_pkey primary key (id)
+  ) tablespace pg_default;
+
+create table if not exists
+  public.barrel_ledger (
+    id bigint generated by default as identity not null,
+    barrel_id bigint null,
+    timestamp timestamp with time zone not null default now(),
+    red integer not null default 0,
+    green integer not null default 0,
+    blue integer not null default 0,
+    dark integer not null default 0,
+    constraint barrel_ledger_pkey primary key (id),
+    constraint barrel_ledger_barrel_id_fkey foreign key (barrel_id) references barrel_purchase (id)
+  ) tablespace pg_default;
+
+-- A reset inserts a default row: starting capacity, and a -100 cost that seeds 100 gold
+create table if not exists
+  public.capacity_ledger (
+    id bigint generated by default as identity not null,
+    timestamp timestamp with time zone not null default now(),
+    potion integer not null default 50,
+    volume integer not null default 10000,
+    cost integer not null default '-100'::integer,
+    constraint capacity_ledger_pkey primary key (id)
+  ) tablespace pg_default;
+
+create table if not exists
+  public.capacity_ledger_deliveries (
+    capacity_id bigint not null,
+    order_id bigint not null,
+    constraint capacity_ledger_deliveries_pkey primary key (capacity_id)
+  ) tablespace pg_default;
+
+create table if not exists
+  public.inventory_snapshot (
+    reset_time timestamp with time zone not null,
+    gold bigint not null default '0'::bigint,
+    num_potions bigint not null default '0'::bigint,
+    red bigint not null default '0'::bigint,
+    green bigint not null default '0'::bigint,
+    blue bigint not null default '0'::bigint,
+    dark bigint not null default '0'::bigint,
+    potion_capacity bigint not null default '0'::bigint,
+    volume_capacity bigint not null default '0'::bigint,
+    updated_at timestamp with time zone not null default now(),
+    constraint inventory_snapshot_pkey primary key (reset_time)
+  ) tablespace pg_default;
+
+-- Full ledger recompute of the current epoch's inventory; the snapshot is verified against it
+drop view if exists public.global;
+
+create view public.global as
+  with reset as (select timestamp as time
+                 from resets
+                 order by timestamp desc
+                 limit 1),
+       potions as (select coalesce(sum(potion_ledger.qty), 0)::bigint as num_potions
+                   from potion_ledger, reset
+                   where potion_ledger.timestamp >= reset.time),
+       sales as (select coalesce(sum(-potion_ledger.qty * potion_ledger_carts.price), 0)::bigint as gold
+                 from potion_ledger
+                 join potion_ledger_carts on potion_ledger_carts.potion_ledger_id = potion_ledger.ledger_id, reset
+                 where potion_ledger.timestamp >= reset.time),
+       barrels as (select coalesce(sum(red), 0)::bigint as red, coalesce(sum(green), 0)::bigint as green,
+                          coalesce(sum(blue), 0)::bigint as blue, coalesce(sum(dark), 0)::bigint as dark
+                   from barrel_ledger, reset
+                   where barrel_ledger.timestamp >= reset.time),
+       purchases as (select coalesce(sum(barrel_purchase.cost * barrel_purchase.quantity), 0)::bigint as gold
+                     from barrel_purchase
+                     join barrel_ledger on barrel_ledger.barrel_id = barrel_purchase.id, reset
+                     where barrel_ledger.timestamp >= reset.time),
+       capacity as (select coalesce(sum(cost), 0)::bigint as gold
+                    from capacity_ledger, reset
+                    where capacity_ledger.timestamp >= reset.time)
+  select potions.num_potions,
+         (barrels.red + barrels.green + barrels.blue + barrels.dark) as ml_in_barrels,
+         (sales.gold - purchases.gold - capacity.gold) as gold,
+         barrels.red, barrels.green, barrels.blue, barrels.dark
+  from potions, sales, barrels, purchases, capacity;
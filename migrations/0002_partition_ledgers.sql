@@ -0,0 +1,146 @@
+-- Range-partitions potion_ledger, barrel_ledger and capacity_ledger by reset epoch (resets.id),
+-- so a closed epoch is a partition that can be detached or dropped without touching hot rows.
+-- Rows are stamped with the epoch current at insert time; inserting into resets opens the new
+-- epoch's partitions. Rows from before the first reset land in the default partitions.
+--
+-- The partition key has to be part of every unique constraint, so the ledgers' primary keys
+-- become (epoch, id) and the foreign keys that referenced ledger ids alone are dropped.
+
+create or replace function public.current_epoch() returns bigint
+  language sql stable as $$
+    select coalesce(max(id), 0) from resets
+  $$;
+
+create or replace function public.create_epoch_partitions(epoch bigint) returns void
+  language plpgsql as $$
+    declare
+      ledger text;
+    begin
+      foreach ledger in array array['potion_ledger', 'barrel_ledger', 'capacity_ledger'] loop
+        execute format('create table if not exists public.%I partition of public.%I for values from (%s) to (%s)',
+                       ledger || '_e' || epoch, ledger, epoch, epoch + 1);
+      end loop;
+    end
+  $$;
+
+create or replace function public.open_epoch() returns trigger
+  language plpgsql as $$
+    begin
+      perform create_epoch_partitions(new.id);
+      return new;
+    end
+  $$;
+
+drop view if exists public.global;
+
+alter table public.potion_ledger rename to potion_ledger_unpartitioned;
+alter table public.barrel_ledger rename to barrel_ledger_unpartitioned;
+alter table public.capacity_ledger rename to capacity_ledger_unpartitioned;
+
+create table
+  public.potion_ledger (
+    ledger_id bigint generated by default as identity not null,
+    epoch bigint not null default current_epoch(),
+    timestamp timestamp with time zone not null default now(),
+    red integer not null,
+    green integer not null,
+    blue integer not null,
+    dark integer not null,
+    qty integer not null,
+    primary key (epoch, ledger_id)
+  ) partition by range (epoch);
+
+create table
+  public.barrel_ledger (
+    id bigint generated by default as identity not null,
+    epoch bigint not null default current_epoch(),
+    barrel_id bigint null,
+    timestamp timestamp with time zone not null default now(),
+    red integer not null default 0,
+    green integer not null default 0,
+    blue integer not null default 0,
+    dark integer not null default 0,
+    primary key (epoch, id),
+    constraint barrel_ledger_barrel_id_fkey foreign key (barrel_id) references barrel_purchase (id)
+  ) partition by range (epoch);
+
+create table
+  public.capacity_ledger (
+    id bigint generated by default as identity not null,
+    epoch bigint not null default current_epoch(),
+    timestamp timestamp with time zone not null default now(),
+    potion integer not null default 50,
+    volume integer not null default 10000,
+    cost integer not null default '-100'::integer,
+    primary key (epoch, id)
+  ) partition by range (epoch);
+
+create table public.potion_ledger_default partition of public.potion_ledger default;
+create table public.barrel_ledger_default partition of public.barrel_ledger default;
+create table public.capacity_ledger_default partition of public.capacity_ledger default;
+
+select create_epoch_partitions(id) from resets order by id;
+
+create trigger resets_open_epoch
+  after insert on public.resets
+  for each row execute function open_epoch();
+
+-- Each existing row belongs to the latest reset at or before it
+insert into public.potion_ledger (ledger_id, epoch, timestamp, red, green, blue, dark, qty)
+select ledger.ledger_id,
+       coalesce((select max(resets.id) from resets where resets.timestamp <= ledger.timestamp), 0),
+       ledger.timestamp, ledger.red, ledger.green, ledger.blue, ledger.dark, ledger.qty
+from potion_ledger_unpartitioned ledger;
+
+insert into public.barrel_ledger (id, epoch, barrel_id, timestamp, red, green, blue, dark)
+select ledger.id,
+       coalesce((select max(resets.id) from resets where resets.timestamp <= ledger.timestamp), 0),
+       ledger.barrel_id, ledger.timestamp, ledger.red, ledger.green, ledger.blue, ledger.dark
+from barrel_ledger_unpartitioned ledger;
+
+insert into public.capacity_ledger (id, epoch, timestamp, potion, volume, cost)
+select ledger.id,
+       coalesce((select max(resets.id) from resets where resets.timestamp <= ledger.timestamp), 0),
+       ledger.timestamp, ledger.potion, ledger.volume, ledger.cost
+from capacity_ledger_unpartitioned ledger;
+
+select setval(pg_get_serial_sequence('public.potion_ledger', 'ledger_id'), coalesce(max(ledger_id), 0) + 1, false)
+from public.potion_ledger;
+
+select setval(pg_get_serial_sequence('public.barrel_ledger', 'id'), coalesce(max(id), 0) + 1, false)
+from public.barrel_ledger;
+
+select setval(pg_get_serial_sequence('public.capacity_ledger', 'id'), coalesce(max(id), 0) + 1, false)
+from public.capacity_ledger;
+
+-- Drops the foreign keys that pointed at the old ledger ids along with the old tables
+drop table potion_ledger_unpartitioned, barrel_ledger_unpartitioned, capacity_ledger_unpartitioned cascade;
+
+create view public.global as
+  with reset as (select timestamp as time
+                 from resets
+                 order by timestamp desc
+                 limit 1),
+       potions as (select coalesce(sum(potion_ledger.qty), 0)::bigint as num_potions
+                   from potion_ledger, reset
+                   where potion_ledger.timestamp >= reset.time),
+       sales as (select coalesce(sum(-potion_ledger.qty * potion_ledger_carts.price), 0)::bigint as gold
+                 from potion_ledger
+                 join potion_ledger_carts on potion_ledger_carts.potion_ledger_id = potion_ledger.ledger_id, reset
+                 where potion_ledger.timestamp >= reset.time),
+       barrels as (select coalesce(sum(red), 0)::bigint as red, coalesce(sum(green), 0)::bigint as green,
+                          coalesce(sum(blue), 0)::bigint as blue, coalesce(sum(dark), 0)::bigint as dark
+                   from barrel_ledger, reset
+                   where barrel_ledger.timestamp >= reset.time),
+       purchases as (select coalesce(sum(barrel_purchase.cost * barrel_purchase.quantity), 0)::bigint as gold
+                     from barrel_purchase
+                     join barrel_ledger on barrel_ledger.barrel_id = barrel_purchase.id, reset
+                     where barrel_ledger.timestamp >= reset.time),
+       capacity as (select coalesce(sum(cost), 0)::bigint as gold
+                    from capacity_ledger, reset
+                    where capacity_ledger.timestamp >= reset.time)
+  select potions.num_potions,
+         (barrels.red + barrels.green + barrels.blue + barrels.dark) as ml_in_barrels,
+         (sales.gold - purchases.gold - capacity.gold) as gold,
+         barrels.red, barrels.green, barrels.blue, barrels.dark
+  from potions, sales, barrels, purchases, capacity;
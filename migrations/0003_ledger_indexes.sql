@@ -0,0 +1,32 @@
+-- Indexes for the routers' filter and join patterns. Indexes on the partitioned ledgers cascade
+-- to every epoch partition, including ones opened by later resets.
+
+-- Every epoch-scoped query looks up the latest reset
+create index if not exists resets_timestamp_idx on public.resets (timestamp);
+
+-- Ledger scans filter on timestamp >= reset.time; INCLUDE columns keep the sums index-only
+create index if not exists potion_ledger_timestamp_idx
+  on public.potion_ledger (timestamp, ledger_id) include (red, green, blue, dark, qty);
+
+create index if not exists barrel_ledger_timestamp_idx
+  on public.barrel_ledger (timestamp) include (red, green, blue, dark, barrel_id);
+
+create index if not exists capacity_ledger_timestamp_idx
+  on public.capacity_ledger (timestamp) include (potion, volume, cost);
+
+-- The catalog aggregation joins potion_ledger to catalog on the (red, green, blue, dark) tuple
+create index if not exists potion_ledger_type_timestamp_idx
+  on public.potion_ledger (red, green, blue, dark, timestamp) include (qty);
+
+-- Checkout and order search go from carts to their line items and back
+create index if not exists potion_ledger_carts_cart_id_idx on public.potion_ledger_carts (cart_id) include (price);
+create index if not exists carts_customer_id_idx on public.carts (customer_id);
+create index if not exists visits_customer_id_idx on public.visits (customer_id);
+create index if not exists barrel_ledger_barrel_id_idx on public.barrel_ledger (barrel_id);
+create index if not exists strategy_potions_day_idx on public.strategy_potions (day);
+
+-- Order search: trigram indexes serve the ILIKE '%...%' name filters
+create extension if not exists pg_trgm;
+
+create index if not exists customers_name_trgm_idx on public.customers using gin (name gin_trgm_ops);
+create index if not exists catalog_name_trgm_idx on public.catalog using gin (name gin_trgm_ops);
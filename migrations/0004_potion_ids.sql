@@ -0,0 +1,40 @@
+-- Compact integer potion ids: catalog.id identifies a potion type, and potion_ledger and
+-- strategy_potions carry it so hot joins are a single integer equality instead of matching the
+-- (r, g, b, d) tuple. The color columns stay on potion_ledger as the audit record.
+
+alter table public.catalog add column if not exists id integer generated by default as identity;
+alter table public.catalog add constraint catalog_id_key unique (id);
+
+alter table public.potion_ledger add column if not exists potion_id integer;
+
+update public.potion_ledger
+set potion_id = catalog.id
+from public.catalog
+where (catalog.r, catalog.g, catalog.b, catalog.d) = (potion_ledger.red, potion_ledger.green, potion_ledger.blue, potion_ledger.dark)
+  and potion_ledger.potion_id is null;
+
+alter table public.potion_ledger alter column potion_id set not null;
+alter table public.potion_ledger
+  add constraint potion_ledger_potion_id_fkey foreign key (potion_id) references catalog (id);
+
+alter table public.strategy_potions add column if not exists potion_id integer;
+
+update public.strategy_potions
+set potion_id = catalog.id
+from public.catalog
+where (catalog.r, catalog.g, catalog.b, catalog.d) = (strategy_potions.r, strategy_potions.g, strategy_potions.b, strategy_potions.d)
+  and strategy_potions.potion_id is null;
+
+alter table public.strategy_potions alter column potion_id set not null;
+alter table public.strategy_potions
+  add constraint strategy_potions_potion_id_fkey foreign key (potion_id) references catalog (id);
+
+-- The catalog aggregation now joins on potion_id
+drop index if exists potion_ledger_type_timestamp_idx;
+
+create index if not exists potion_ledger_potion_id_timestamp_idx
+  on public.potion_ledger (potion_id, timestamp) include (qty);
+
+drop index if exists strategy_potions_day_idx;
+
+create index if not exists strategy_potions_day_potion_id_idx on public.strategy_potions (day, potion_id);
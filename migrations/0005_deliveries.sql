@@ -0,0 +1,11 @@
+-- One row per delivered order: the primary key makes barrel, bottle and capacity deliveries
+-- idempotent when the game server retries, and result is what a replay returns.
+
+create table if not exists
+  public.deliveries (
+    kind text not null,
+    order_id bigint not null,
+    result jsonb null,
+    delivered_at timestamp with time zone not null default now(),
+    constraint deliveries_pkey primary key (kind, order_id)
+  ) tablespace pg_default;
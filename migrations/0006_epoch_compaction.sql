@@ -0,0 +1,34 @@
+-- Closed reset epochs are rolled up into summary rows, and their raw ledger rows move out of the
+-- hot tables into the archive schema (see src/compaction.py).
+
+create schema if not exists archive;
+
+-- Net stock change and sales gold per potion for a closed epoch
+create table if not exists
+  public.epoch_potion_totals (
+    epoch bigint not null,
+    potion_id integer not null,
+    qty bigint not null,
+    gold bigint not null,
+    entries bigint not null,
+    constraint epoch_potion_totals_pkey primary key (epoch, potion_id)
+  ) tablespace pg_default;
+
+-- Net ml per color, barrel and capacity spend, and capacity bought for a closed epoch
+create table if not exists
+  public.epoch_totals (
+    epoch bigint not null,
+    red bigint not null,
+    green bigint not null,
+    blue bigint not null,
+    dark bigint not null,
+    barrel_gold bigint not null,
+    capacity_gold bigint not null,
+    potion_capacity bigint not null,
+    volume_capacity bigint not null,
+    barrel_entries bigint not null,
+    capacity_entries bigint not null,
+    archived boolean not null default false,
+    compacted_at timestamp with time zone not null default now(),
+    constraint epoch_totals_pkey primary key (epoch)
+  ) tablespace pg_default;
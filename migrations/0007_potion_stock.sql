@@ -0,0 +1,20 @@
+-- Sellable stock per potion for each reset epoch. Bottle deliveries add to it and cart items
+-- take from it with a conditional update, so concurrent carts can't sell more than was bottled;
+-- each SKU's row is locked only for the length of one cart write.
+
+create table if not exists
+  public.potion_stock (
+    epoch bigint not null,
+    potion_id integer not null,
+    available bigint not null default 0,
+    constraint potion_stock_pkey primary key (epoch, potion_id),
+    constraint potion_stock_potion_id_fkey foreign key (potion_id) references catalog (id)
+  ) tablespace pg_default;
+
+-- Seed the open epoch from its ledger; later epochs start empty and fill as bottles are delivered
+insert into public.potion_stock (epoch, potion_id, available)
+select epoch, potion_id, sum(qty)
+from public.potion_ledger
+where epoch = current_epoch()
+group by epoch, potion_id
+on conflict (epoch, potion_id) do nothing;
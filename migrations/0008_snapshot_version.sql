@@ -0,0 +1,5 @@
+-- Counts writes to each epoch's snapshot. Every ledger write already updates the snapshot row in
+-- its own transaction, so the version moves exactly when the ledgers do and names one state of
+-- them; read endpoints use it as their ETag.
+
+alter table public.inventory_snapshot add column if not exists version bigint not null default 1;
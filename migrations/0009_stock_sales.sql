@@ -0,0 +1,34 @@
+-- Cart sales accumulate per SKU on potion_stock, the row a cart write already locks to reserve
+-- stock, instead of on the epoch's single inventory_snapshot row, which every concurrent cart had
+-- to queue on. inventory_snapshot keeps every other balance; its gold and num_potions now leave out
+-- cart sales, and reads add each stock row's sold and gold back. Each stock row counts its own
+-- writes in version, so the snapshot's version plus its stock rows' still moves with every write.
+
+alter table public.potion_stock
+  add column if not exists sold bigint not null default 0,
+  add column if not exists gold bigint not null default 0,
+  add column if not exists version bigint not null default 0;
+
+-- Move the open epoch's cart sales so far onto its stock rows. Every potion a cart bought in it
+-- has one: 0007 seeded them from the ledger, and carts since could only buy reserved stock.
+update public.potion_stock
+set sold = sales.sold,
+    gold = sales.gold
+from (select ledger.potion_id,
+             -sum(ledger.qty) as sold,
+             -sum(ledger.qty::bigint * carts.price) as gold
+      from public.potion_ledger ledger
+      join public.potion_ledger_carts carts on carts.potion_ledger_id = ledger.ledger_id
+      where ledger.epoch = current_epoch()
+      group by ledger.potion_id) as sales
+where potion_stock.epoch = current_epoch()
+  and potion_stock.potion_id = sales.potion_id;
+
+-- ...and take them out of its snapshot, so the sum of both still matches the ledgers
+update public.inventory_snapshot
+set gold = inventory_snapshot.gold - stock.gold,
+    num_potions = inventory_snapshot.num_potions + stock.sold
+from (select coalesce(sum(gold), 0) as gold, coalesce(sum(sold), 0) as sold
+      from public.potion_stock
+      where epoch = current_epoch()) as stock
+where inventory_snapshot.reset_time = (select max(timestamp) from public.resets);
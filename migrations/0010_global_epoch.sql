@@ -0,0 +1,29 @@
+-- The global view summed every ledger row stamped at or after the latest reset, which Postgres
+-- can only answer by checking every epoch's partition. It now filters on epoch, the partition
+-- key, so the recompute reads the open epoch's partitions alone; rows are stamped with the epoch
+-- current when they were written, so it selects the same rows.
+
+create or replace view public.global as
+  with potions as (select coalesce(sum(potion_ledger.qty), 0)::bigint as num_potions
+                   from potion_ledger
+                   where potion_ledger.epoch = current_epoch()),
+       sales as (select coalesce(sum(-potion_ledger.qty * potion_ledger_carts.price), 0)::bigint as gold
+                 from potion_ledger
+                 join potion_ledger_carts on potion_ledger_carts.potion_ledger_id = potion_ledger.ledger_id
+                 where potion_ledger.epoch = current_epoch()),
+       barrels as (select coalesce(sum(red), 0)::bigint as red, coalesce(sum(green), 0)::bigint as green,
+                          coalesce(sum(blue), 0)::bigint as blue, coalesce(sum(dark), 0)::bigint as dark
+                   from barrel_ledger
+                   where barrel_ledger.epoch = current_epoch()),
+       purchases as (select coalesce(sum(barrel_purchase.cost * barrel_purchase.quantity), 0)::bigint as gold
+                     from barrel_purchase
+                     join barrel_ledger on barrel_ledger.barrel_id = barrel_purchase.id
+                     where barrel_ledger.epoch = current_epoch()),
+       capacity as (select coalesce(sum(cost), 0)::bigint as gold
+                    from capacity_ledger
+                    where capacity_ledger.epoch = current_epoch())
+  select potions.num_potions,
+         (barrels.red + barrels.green + barrels.blue + barrels.dark) as ml_in_barrels,
+         (sales.gold - purchases.gold - capacity.gold) as gold,
+         barrels.red, barrels.green, barrels.blue, barrels.dark
+  from potions, sales, barrels, purchases, capacity;
@@ -1,87 +1,68 @@
+-- Current schema: the end state of migrations/ (apply those with `python -m src.migrate`).
+
 create table
-  public.global_inventory (
-    gold bigint not null,
-    num_capacity bigint not null,
-    vol_capacity bigint not null,
-    red bigint null,
-    green bigint null,
-    blue bigint null,
-    dark bigint null,
-    constraint global_inventory_pkey primary key (gold)
+  public.resets (
+    id bigint generated by default as identity not null,
+    timestamp timestamp with time zone not null default now(),
+    constraint resets_pkey primary key (id)
   ) tablespace pg_default;
 
 create table
   public.catalog (
-    price integer not null default 50,
+    id integer generated by default as identity not null,
     name text not null,
-    qty integer not null,
+    price integer not null default 50,
     r integer not null,
     g integer not null,
     b integer not null,
     d integer not null,
     listed boolean not null default false,
-    cost_per_vol double precision not null default '0'::double precision,
     constraint catalog_pkey primary key (r, g, b, d),
+    constraint catalog_id_key unique (id),
     constraint catalog_name_key unique (name)
   ) tablespace pg_default;
 
 create table
   public.customers (
+    id bigint generated by default as identity not null,
     name text not null,
     class text not null,
     level bigint not null,
-    constraint customers_pkey primary key (name),
-    constraint customers_name_key unique (name)
+    constraint customers_pkey primary key (id),
+    constraint customers_name_class_level_key unique (name, class, level)
   ) tablespace pg_default;
 
 create table
   public.visits (
-    name text not null,
-    visit_time timestamp with time zone not null default now(),
+    id bigint generated by default as identity not null,
     visit_id bigint not null,
-    constraint visits_pkey primary key (name, visit_id),
-    constraint visits_name_fkey foreign key (name) references customers (name)
+    customer_id bigint not null,
+    created_at timestamp with time zone not null default now(),
+    constraint visits_pkey primary key (id),
+    constraint visits_customer_id_fkey foreign key (customer_id) references customers (id)
   ) tablespace pg_default;
 
 create table
   public.carts (
     cart_id bigint generated by default as identity not null,
+    customer_id bigint not null,
     created_at timestamp with time zone not null default now(),
-    name text not null,
-    purchased boolean not null default false,
-    constraint shopping_cart_pkey primary key (cart_id),
-    constraint shopping_cart_cart_id_key unique (cart_id),
-    constraint cart_name_fkey foreign key (name) references customers (name)
-  ) tablespace pg_default;
-
-create table
-  public.ledger (
-    cart_id bigint not null,
-    r integer not null,
-    g integer not null,
-    b integer not null,
-    d integer not null,
-    sold bigint not null default '0'::bigint,
-    ledger_id bigint generated by default as identity not null,
-    price bigint not null default '0'::bigint,
-    ordered bigint not null default '0'::bigint,
-    constraint cart_items_pkey primary key (ledger_id),
-    constraint cart_items_cart_id_fkey foreign key (cart_id) references carts (cart_id),
-    constraint cart_items_r_g_b_d_fkey foreign key (r, g, b, d) references catalog (r, g, b, d)
+    constraint carts_pkey primary key (cart_id),
+    constraint carts_customer_id_fkey foreign key (customer_id) references customers (id)
   ) tablespace pg_default;
 
 create table
   public.strategy (
     day integer not null,
-    red_ratio double precision not null,
-    green_ratio double precision not null,
-    blue_ratio double precision not null,
-    dark_ratio double precision not null,
     day_name text not null,
-    deviation integer null,
     is_today boolean null,
-    constraint strategy_pkey primary key (day),
-    constraint strategy_day_key unique (day)
+    tolerance double precision not null default '0.1'::double precision,
+    red_ratio double precision null,
+    green_ratio double precision null,
+    blue_ratio double precision null,
+    dark_ratio double precision null,
+    deviation integer null,
+    constraint strategy_pkey primary key (day)
   ) tablespace pg_default;
 
 create table
@@ -91,7 +72,249 @@ create table
     g integer not null,
     b integer not null,
     d integer not null,
+    potion_id integer not null,
     constraint strategy_potions_pkey primary key (day, r, g, b, d),
     constraint strategy_potions_day_fkey foreign key (day) references strategy (day),
-    constraint strategy_potions_r_g_b_d_fkey foreign key (r, g, b, d) references catalog (r, g, b, d)
-  ) tablespace pg_default;
\ No newline at end of file
+    constraint strategy_potions_r_g_b_d_fkey foreign key (r, g, b, d) references catalog (r, g, b, d),
+    constraint strategy_potions_potion_id_fkey foreign key (potion_id) references catalog (id)
+  ) tablespace pg_default;
+
+create table
+  public.potion_ledger_carts (
+    potion_ledger_id bigint not null,
+    cart_id bigint not null,
+    price integer not null,
+    constraint potion_ledger_carts_pkey primary key (potion_ledger_id),
+    constraint potion_ledger_carts_cart_id_fkey foreign key (cart_id) references carts (cart_id)
+  ) tablespace pg_default;
+
+create table
+  public.potion_ledger_deliveries (
+    ledger_id bigint not null,
+    order_id bigint not null,
+    constraint potion_ledger_deliveries_pkey primary key (ledger_id)
+  ) tablespace pg_default;
+
+create table
+  public.barrel_purchase (
+    id bigint generated by default as identity not null,
+    order_id bigint not null,
+    size integer not null,
+    quantity integer not null,
+    cost integer not null,
+    created_at timestamp with time zone not null default now(),
+    constraint barrel_purchase_pkey primary key (id)
+  ) tablespace pg_default;
+
+create table
+  public.capacity_ledger_deliveries (
+    capacity_id bigint not null,
+    order_id bigint not null,
+    constraint capacity_ledger_deliveries_pkey primary key (capacity_id)
+  ) tablespace pg_default;
+
+-- One row per delivered order; replays of a (kind, order_id) return the stored result
+create table
+  public.deliveries (
+    kind text not null,
+    order_id bigint not null,
+    result jsonb null,
+    delivered_at timestamp with time zone not null default now(),
+    constraint deliveries_pkey primary key (kind, order_id)
+  ) tablespace pg_default;
+
+-- Sellable stock per potion and epoch: deliveries add, cart items take only what is available.
+-- Cart sales are counted here rather than in inventory_snapshot, so carts only lock their SKU's row.
+create table
+  public.potion_stock (
+    epoch bigint not null,
+    potion_id integer not null,
+    available bigint not null default 0,
+    sold bigint not null default 0,
+    gold bigint not null default 0,
+    version bigint not null default 0,
+    constraint potion_stock_pkey primary key (epoch, potion_id),
+    constraint potion_stock_potion_id_fkey foreign key (potion_id) references catalog (id)
+  ) tablespace pg_default;
+
+-- The epoch's balances except cart sales, which potion_stock adds per SKU
+create table
+  public.inventory_snapshot (
+    reset_time timestamp with time zone not null,
+    gold bigint not null default '0'::bigint,
+    num_potions bigint not null default '0'::bigint,
+    red bigint not null default '0'::bigint,
+    green bigint not null default '0'::bigint,
+    blue bigint not null default '0'::bigint,
+    dark bigint not null default '0'::bigint,
+    potion_capacity bigint not null default '0'::bigint,
+    volume_capacity bigint not null default '0'::bigint,
+    updated_at timestamp with time zone not null default now(),
+    version bigint not null default 1,
+    constraint inventory_snapshot_pkey primary key (reset_time)
+  ) tablespace pg_default;
+
+create schema if not exists archive;
+
+-- Net stock change and sales gold per potion for a closed epoch
+create table
+  public.epoch_potion_totals (
+    epoch bigint not null,
+    potion_id integer not null,
+    qty bigint not null,
+    gold bigint not null,
+    entries bigint not null,
+    constraint epoch_potion_totals_pkey primary key (epoch, potion_id)
+  ) tablespace pg_default;
+
+-- Net ml per color, barrel and capacity spend, and capacity bought for a closed epoch
+create table
+  public.epoch_totals (
+    epoch bigint not null,
+    red bigint not null,
+    green bigint not null,
+    blue bigint not null,
+    dark bigint not null,
+    barrel_gold bigint not null,
+    capacity_gold bigint not null,
+    potion_capacity bigint not null,
+    volume_capacity bigint not null,
+    barrel_entries bigint not null,
+    capacity_entries bigint not null,
+    archived boolean not null default false,
+    compacted_at timestamp with time zone not null default now(),
+    constraint epoch_totals_pkey primary key (epoch)
+  ) tablespace pg_default;
+
+create or replace function public.current_epoch() returns bigint
+  language sql stable as $$
+    select coalesce(max(id), 0) from resets
+  $$;
+
+create or replace function public.create_epoch_partitions(epoch bigint) returns void
+  language plpgsql as $$
+    declare
+      ledger text;
+    begin
+      foreach ledger in array array['potion_ledger', 'barrel_ledger', 'capacity_ledger'] loop
+        execute format('create table if not exists public.%I partition of public.%I for values from (%s) to (%s)',
+                       ledger || '_e' || epoch, ledger, epoch, epoch + 1);
+      end loop;
+    end
+  $$;
+
+create or replace function public.open_epoch() returns trigger
+  language plpgsql as $$
+    begin
+      perform create_epoch_partitions(new.id);
+      return new;
+    end
+  $$;
+
+-- Ledgers are range-partitioned by reset epoch; inserting into resets opens the epoch's partitions
+create table
+  public.potion_ledger (
+    ledger_id bigint generated by default as identity not null,
+    epoch bigint not null default current_epoch(),
+    timestamp timestamp with time zone not null default now(),
+    red integer not null,
+    green integer not null,
+    blue integer not null,
+    dark integer not null,
+    qty integer not null,
+    potion_id integer not null,
+    primary key (epoch, ledger_id),
+    constraint potion_ledger_potion_id_fkey foreign key (potion_id) references catalog (id)
+  ) partition by range (epoch);
+
+create table
+  public.barrel_ledger (
+    id bigint generated by default as identity not null,
+    epoch bigint not null default current_epoch(),
+    barrel_id bigint null,
+    timestamp timestamp with time zone not null default now(),
+    red integer not null default 0,
+    green integer not null default 0,
+    blue integer not null default 0,
+    dark integer not null default 0,
+    primary key (epoch, id),
+    constraint barrel_ledger_barrel_id_fkey foreign key (barrel_id) references barrel_purchase (id)
+  ) partition by range (epoch);
+
+create table
+  public.capacity_ledger (
+    id bigint generated by default as identity not null,
+    epoch bigint not null default current_epoch(),
+    timestamp timestamp with time zone not null default now(),
+    potion integer not null default 50,
+    volume integer not null default 10000,
+    cost integer not null default '-100'::integer,
+    primary key (epoch, id)
+  ) partition by range (epoch);
+
+create table public.potion_ledger_default partition of public.potion_ledger default;
+create table public.barrel_ledger_default partition of public.barrel_ledger default;
+create table public.capacity_ledger_default partition of public.capacity_ledger default;
+
+create trigger resets_open_epoch
+  after insert on public.resets
+  for each row execute function open_epoch();
+
+-- Indexes for the routers' filter and join patterns. Indexes on the partitioned ledgers cascade
+-- to every epoch partition, including ones opened by later resets.
+
+-- Every epoch-scoped query looks up the latest reset
+create index if not exists resets_timestamp_idx on public.resets (timestamp);
+
+-- Ledger scans filter on timestamp >= reset.time; INCLUDE columns keep the sums index-only
+create index if not exists potion_ledger_timestamp_idx
+  on public.potion_ledger (timestamp, ledger_id) include (red, green, blue, dark, qty);
+
+create index if not exists barrel_ledger_timestamp_idx
+  on public.barrel_ledger (timestamp) include (red, green, blue, dark, barrel_id);
+
+create index if not exists capacity_ledger_timestamp_idx
+  on public.capacity_ledger (timestamp) include (potion, volume, cost);
+
+-- The catalog aggregation joins potion_ledger to catalog on potion_id
+create index if not exists potion_ledger_potion_id_timestamp_idx
+  on public.potion_ledger (potion_id, timestamp) include (qty);
+
+-- Checkout and order search go from carts to their line items and back
+create index if not exists potion_ledger_carts_cart_id_idx on public.potion_ledger_carts (cart_id) include (price);
+create index if not exists carts_customer_id_idx on public.carts (customer_id);
+create index if not exists visits_customer_id_idx on public.visits (customer_id);
+create index if not exists barrel_ledger_barrel_id_idx on public.barrel_ledger (barrel_id);
+create index if not exists strategy_potions_day_potion_id_idx on public.strategy_potions (day, potion_id);
+
+-- Order search: trigram indexes serve the ILIKE '%...%' name filters
+create extension if not exists pg_trgm;
+
+create index if not exists customers_name_trgm_idx on public.customers using gin (name gin_trgm_ops);
+create index if not exists catalog_name_trgm_idx on public.catalog using gin (name gin_trgm_ops);
+
+-- Full ledger recompute of the current epoch's inventory; the snapshot is verified against it
+create view public.global as
+  with potions as (select coalesce(sum(potion_ledger.qty), 0)::bigint as num_potions
+                   from potion_ledger
+                   where potion_ledger.epoch = current_epoch()),
+       sales as (select coalesce(sum(-potion_ledger.qty * potion_ledger_carts.price), 0)::bigint as gold
+                 from potion_ledger
+                 join potion_ledger_carts on potion_ledger_carts.potion_ledger_id = potion_ledger.ledger_id
+                 where potion_ledger.epoch = current_epoch()),
+       barrels as (select coalesce(sum(red), 0)::bigint as red, coalesce(sum(green), 0)::bigint as green,
+                          coalesce(sum(blue), 0)::bigint as blue, coalesce(sum(dark), 0)::bigint as dark
+                   from barrel_ledger
+                   where barrel_ledger.epoch = current_epoch()),
+       purchases as (select coalesce(sum(barrel_purchase.cost * barrel_purchase.quantity), 0)::bigint as gold
+                     from barrel_purchase
+                     join barrel_ledger on barrel_ledger.barrel_id = barrel_purchase.id
+                     where barrel_ledger.epoch = current_epoch()),
+       capacity as (select coalesce(sum(cost), 0)::bigint as gold
+                    from capacity_ledger
+                    where capacity_ledger.epoch = current_epoch())
+  select potions.num_potions,
+         (barrels.red + barrels.green + barrels.blue + barrels.dark) as ml_in_barrels,
+         (sales.gold - purchases.gold - capacity.gold) as gold,
+         barrels.red, barrels.green, barrels.blue, barrels.dark
+  from potions, sales, barrels, purchases, capacity;
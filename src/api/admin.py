@@ -1,8 +1,19 @@
-from fastapi import APIRouter, Depends, Request
+from fastapi import APIRouter, Depends, Request, HTTPException, status
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from typing import Optional
+from datetime import datetime
 from src.api import auth
-from sqlalchemy import text
 from src import database as db
+from src import queries
+from src import snapshot
+from src import compaction
+from src import cache
+from src import metrics
+from src import deliveries
+from src import strategy
+from src import exports
+from src import ledger_buffer
 
 router = APIRouter(
     prefix="/admin",
@@ -18,13 +29,133 @@ def reset():
     to initialize to + 100 gold overall.
     '''
 
-    reset = text('''INSERT INTO resets
-                    DEFAULT VALUES;
-                 
-                    INSERT INTO capacity_ledger
-                    DEFAULT VALUES;''')
+    # Buffered cart items belong to the epoch that's ending, so write them before it closes
+    ledger_buffer.items.flush()
 
     with db.engine.begin() as connection:
-        connection.execute(reset);
-        
-    return "OK"
\ No newline at end of file
+        connection.execute(queries.insert_reset)
+        connection.execute(queries.open_capacity)
+        snapshot.rebuild(connection)
+
+    cache.reset()
+
+    return "OK"
+
+
+@router.post("/snapshot/rebuild")
+def rebuild_snapshot():
+    '''
+    Recomputes the current epoch's inventory snapshot from the full ledgers.
+    '''
+
+    with db.engine.begin() as connection:
+        balances = snapshot.rebuild(connection)
+
+    return balances
+
+
+@router.get("/snapshot/verify")
+def verify_snapshot():
+    '''
+    Checks the inventory snapshot against a full ledger recompute, listing any mismatches.
+    '''
+
+    with db.engine.begin() as connection:
+        mismatches = snapshot.verify(connection)
+
+    return {"consistent": not mismatches, "mismatches": mismatches}
+
+
+@router.post("/compact")
+def compact_epochs(dry_run: bool = False):
+    '''
+    Rolls every closed reset epoch still in the hot ledgers into summary rows and moves its raw
+    rows to the archive schema. An epoch whose summary doesn't match its final snapshot and stock
+    rows is left in place.
+    '''
+
+    with db.engine.begin() as connection:
+        epochs = compaction.open_epochs(connection)
+
+    results = {}
+    for epoch in epochs:
+        with db.engine.begin() as connection:
+            results[epoch] = compaction.compact(connection, epoch, dry_run)
+
+    return results
+
+
+@router.get("/compact/verify")
+def verify_compaction():
+    '''
+    Checks every archived epoch's summary rows against its archived raw rows.
+    '''
+
+    with db.engine.begin() as connection:
+        results = {epoch: compaction.verify(connection, epoch) for epoch in compaction.archived_epochs(connection)}
+
+    return {"consistent": not any(results.values()), "mismatches": {epoch: result for epoch, result in results.items() if result}}
+
+
+@router.post("/compact/purge/{epoch}")
+def purge_epoch(epoch: int):
+    '''
+    Drops an archived epoch's raw rows after verifying them against its summary.
+    '''
+
+    with db.engine.begin() as connection:
+        if epoch not in compaction.archived_epochs(connection):
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Epoch {epoch} is not archived")
+        mismatches = compaction.purge(connection, epoch)
+
+    if mismatches:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail={"mismatches": mismatches})
+
+    return "OK"
+
+
+@router.get("/cache")
+def cache_stats():
+    '''
+    Reports in-process cache hit/miss counters and the line item buffer for this worker.
+    '''
+
+    return {"catalog": cache.catalog.stats(), "inventory": cache.inventory.stats(), "deliveries": deliveries.recent.stats(),
+            "strategy": strategy.daily.stats(), "ledger_buffer": ledger_buffer.items.stats()}
+
+
+@router.get("/slow_queries")
+def slow_queries():
+    '''
+    Lists this worker's most recent statements slower than SLOW_QUERY_MS, newest first.
+    '''
+
+    return list(reversed(metrics.slow_query_samples))
+
+
+
+@router.get("/queries")
+def query_stats():
+    '''
+    This worker's runs and time per registered statement, split by whether it had been prepared
+    yet, and the statements prepared on one pooled connection with their plan counts.
+    '''
+
+    with db.engine.begin() as connection:
+        prepared = [dict(row) for row in connection.execute(queries.get_prepared_statements).mappings()]
+
+    return {"queries": metrics.query_stats(queries.REGISTRY), "prepared": prepared}
+
+
+@router.get("/export/{dataset}")
+def export(dataset: exports.Dataset, format: exports.Format = exports.Format.ndjson, epoch: Optional[int] = None,
+           since: Optional[datetime] = None, until: Optional[datetime] = None):
+    '''
+    Streams a ledger or the cart history for one reset epoch (the current one by default),
+    optionally limited to [since, until), as NDJSON or CSV.
+    '''
+
+    filename = f"{dataset.value}-{'current' if epoch is None else epoch}.{format.value}"
+
+    return StreamingResponse(exports.stream(dataset, format, epoch, since, until), media_type = exports.MEDIA_TYPES[format],
+                             headers = {"Content-Disposition": f'attachment; filename="{filename}"'})
@@ -2,12 +2,10 @@ from fastapi import Security, HTTPException, status, Request
 from fastapi.security.api_key import APIKeyHeader
 import os
 import dotenv
-import sqlalchemy
-from src import database as db
 
 dotenv.load_dotenv()
 
-api_keys = []  
+api_keys = []
 
 api_keys.append(os.environ.get("API_KEY"))
 api_key_header = APIKeyHeader(name="access_token", auto_error=False)
@@ -18,4 +16,4 @@ async def get_api_key(request: Request, api_key_header: str = Security(api_key_h
     else:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Forbidden"
-        )
\ No newline at end of file
+        )
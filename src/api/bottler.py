@@ -1,10 +1,16 @@
 from fastapi import APIRouter, Depends
 from pydantic import BaseModel
 from src.api import auth
-from sqlalchemy import text
 from src import database as db
-from operator import add
-from pulp import LpProblem, LpVariable, lpSum, LpMaximize, PULP_CBC_CMD
+from src import queries
+from src import snapshot
+from src import cache
+from src import potions
+from src import deliveries
+from src import strategy
+from src import logs
+
+log = logs.get_logger(__name__)
 
 router = APIRouter(
     prefix="/bottler",
@@ -20,32 +26,29 @@ class PotionInventory(BaseModel):
 @router.post("/deliver/{order_id}")
 def post_deliver_bottles(potions_delivered: list[PotionInventory], order_id: int):
     '''
-    Posts delivered potions to the potion_ledger.
+    Posts delivered potions to the potion_ledger. Retries of an order_id return the first
+    delivery's result.
     '''
-    print(f"potions delievered: {potions_delivered} order_id: {order_id}")
+    logs.event(log, "potions delivered", order_id = order_id, potions = len(potions_delivered))
 
     color_volume_used = list(map(sum, list(zip(*[[color * potion.quantity for color in potion.potion_type] for potion in potions_delivered]))))
     color_volume_used = dict(zip(['red', 'green', 'blue', 'dark'], color_volume_used))
 
-    potions_delivered = [dict(potion) | {"order_id": order_id} for potion in potions_delivered]
+    potions_delivered = [{"potion_id": potions.ids.require(potion.potion_type), "quantity": potion.quantity, "order_id": order_id}
+                         for potion in potions_delivered]
 
-    post_delivery = text('''WITH new_ledger AS (INSERT INTO potion_ledger (red, green, blue, dark, qty)
-                                                SELECT r, g, b, d, :quantity
-                                                FROM catalog
-                                                WHERE ARRAY[r, g, b, d] = :potion_type
-                                                RETURNING ledger_id)
-                            INSERT INTO potion_ledger_deliveries (order_id, ledger_id)
-                            SELECT :order_id, ledger_id
-                            FROM new_ledger''')
-    
-    debit_barrel_volume =   text('''INSERT INTO barrel_ledger (red, green, blue, dark)
-                                VALUES (-:red, -:green, -:blue, -:dark)''')
+    def record(connection):
+        connection.execute(queries.bottle_delivery, potions_delivered)
+        connection.execute(queries.debit_barrel_volume, color_volume_used)
+        snapshot.apply(connection, num_potions = sum(potion['quantity'] for potion in potions_delivered),
+                       **{color: -volume for color, volume in color_volume_used.items()})
+        return "OK"
 
-    with db.engine.begin() as connection:
-        connection.execute(post_delivery, potions_delivered)
-        connection.execute(debit_barrel_volume, color_volume_used)
-    
-    return "OK"
+    result, delivered = deliveries.deliver("bottles", order_id, record)
+    if delivered:
+        cache.stock_changed()
+
+    return result
 
 
 @router.post("/plan")
@@ -54,47 +57,14 @@ def get_bottle_plan():
     Submits bottle order to be fulfilled, given barrel inventory constraints.
     '''
 
-    inventory = text('''WITH reset AS (SELECT timestamp AS time
-                                       FROM resets
-                                       ORDER BY timestamp DESC
-                                       LIMIT 1),
-                             inventory AS (SELECT SUM(potion)::INT AS space
-                                           FROM capacity_ledger, reset
-                                           WHERE timestamp >= reset.time)
-                        SELECT (inventory.space - num_potions) AS available_space, ARRAY[red, green, blue, dark] AS volumes
-                        FROM global, inventory''')
-
-    get_potion_strategy =   text('''SELECT ARRAY[cat.r, cat.g, cat.b, cat.d] AS type, cat.price AS price
-                                    FROM strategy
-                                    JOIN strategy_potions ON strategy_potions.day = strategy.day
-                                    JOIN catalog cat ON (cat.r, cat.g, cat.b, cat.d) IN 
-                                                    ((strategy_potions.r, strategy_potions.g, strategy_potions.b, strategy_potions.d))
-                                    WHERE strategy.is_today
-                                    ORDER BY cat.price DESC
-                                    LIMIT 6''')
-
-    with db.engine.begin() as connection:
-        available_space, volumes = connection.execute(inventory).one()
-        potions = connection.execute(get_potion_strategy).mappings().all()
+    from src.planning import plans
+    from src.planning import state
 
-    # Transposing so each row is a single color requirement for each potion [potion_1_red, potion_2_red, ...], etc
-    color_requirements = list(zip(*[potion['type'] for potion in potions]))
+    today = strategy.daily.today()
 
-    model = LpProblem('Potion_Mix', LpMaximize)
-    variables = [LpVariable('q'+str(i+1), lowBound = 0, cat = 'Integer') for i in range(len(potions))]
-
-    model += lpSum([(potion['price'] * variable) for potion, variable in zip(potions, variables)])
-
-    for color, volume in zip(color_requirements, volumes):
-        model += lpSum(qty * variable for qty, variable in zip(color, variables)) <= volume
-    
-    # Added inventory space constraint to not exceed space available
-    model += lpSum(variables) <= available_space
-
-    model.solve(PULP_CBC_CMD(msg = False, options = ['--simplex']))
+    with db.engine.begin() as connection:
+        inventory = snapshot.current(connection)
 
-    order = []
-    if model.status:
-        order = [{'potion_type': potion_type['type'], "quantity": int(quantity.varValue)} for potion_type, quantity in zip(potions, variables) if quantity]
+    [plan] = plans.bottling_plans(state.ShopStates.from_inventories([inventory]), state.Strategy.from_today(today))
 
-    return order
\ No newline at end of file
+    return plan
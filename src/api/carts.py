@@ -1,9 +1,20 @@
-from fastapi import APIRouter, Depends, Request
+from fastapi import APIRouter, Depends, Request, Response, Header, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from src.api import auth
 from enum import Enum
-from sqlalchemy import text
+from typing import Optional
+from datetime import datetime
+import base64
+import json
 from src import database as db
+from src import queries
+from src import async_database as async_db
+from src import cache
+from src import ledger_buffer
+from src import logs
+
+log = logs.get_logger(__name__)
 
 router = APIRouter(
     prefix="/carts",
@@ -19,51 +30,87 @@ class search_sort_options(str, Enum):
 
 class search_sort_order(str, Enum):
     asc = "asc"
-    desc = "desc"   
+    desc = "desc"
+
+SEARCH_PAGE_SIZE = 5
+
+
+def encode_search_page(direction: str, sort_value, ledger_id: int) -> str:
+    '''
+    Packs a keyset position into an opaque, url-safe page token.
+    '''
+    if isinstance(sort_value, datetime):
+        sort_value = sort_value.isoformat()
+
+    token = json.dumps([direction, sort_value, ledger_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(token.encode()).decode().rstrip('=')
+
+
+def decode_search_page(search_page: str):
+    '''
+    Unpacks a page token into (direction, sort_value, ledger_id); an empty token is the first page.
+    '''
+    if not search_page:
+        return None
+
+    try:
+        padded = search_page + '=' * (-len(search_page) % 4)
+        direction, sort_value, ledger_id = json.loads(base64.urlsafe_b64decode(padded))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid search_page token")
+
+    if direction not in ("next", "prev") or not isinstance(ledger_id, int):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid search_page token")
+
+    return direction, sort_value, ledger_id
+
 
 @router.get("/search/", tags=["search"])
 def search_orders(
     customer_name: str = "",
     potion_sku: str = "",
-    search_page: str = 0,
+    search_page: str = "",
     sort_col: search_sort_options = search_sort_options.timestamp,
     sort_order: search_sort_order = search_sort_order.desc,
+    x_cart_written_at: Optional[str] = Header(None),
 ):
     '''
-    The search function searches orders by name & sku (all results in both are none),
-    with pagination and timestamp ordering.
-    '''
-
-    customer_name = '%' + customer_name + '%'
-    potion_sku    = '%' + potion_sku    + '%'
-  
-    search_query = text(f'''SELECT customers.id AS line_item_id,
-                                   customers.name AS customer_name,
-                                   catalog.name AS item_sku,
-                                   COALESCE(SUM(-potion_ledger.qty * potion_ledger_carts.price), 0)::INT AS line_item_total,
-                                   potion_ledger.timestamp AS timestamp,
-                                   COUNT(potion_ledger.ledger_id) AS row_count
-                            FROM potion_ledger
-                            JOIN catalog ON (catalog.r, catalog.g, catalog.b, catalog.d) IN ((potion_ledger.red,
-                                                                                            potion_ledger.green,
-                                                                                            potion_ledger.blue,
-                                                                                            potion_ledger.dark))
-                            JOIN potion_ledger_carts ON potion_ledger_carts.potion_ledger_id = potion_ledger.ledger_id
-                            JOIN carts ON carts.cart_id = potion_ledger_carts.cart_id
-                            JOIN customers ON customers.id = carts.customer_id
-                            GROUP BY customers.id, catalog.name, potion_ledger.ledger_id
-                            HAVING (:customer_name = '' OR customers.name ILIKE :customer_name)
-                                AND (:potion_sku = '' OR catalog.name ILIKE :potion_sku)
-                            ORDER BY {sort_col.value} {sort_order.upper()}
-                            LIMIT 5 OFFSET :search_page * 5''')
+    The search function searches orders by name & sku (all results in both are none), with
+    keyset pagination: search_page is an opaque token from a previous response's next/previous.
+    Sending back the X-Cart-Written-At header of the caller's last cart write makes sure the
+    results include it.
+    '''
 
-    with db.engine.begin() as connection:
-        results = connection.execute(search_query, dict(locals())).mappings().all()
+    page = decode_search_page(search_page)
+    backwards = page is not None and page[0] == "prev"
+
+    # Walking back a page scans in the opposite direction, then flips the rows into display order
+    descending = (sort_order == search_sort_order.desc) != backwards
+    search_query = queries.search_orders[(sort_col.value, descending, page is not None, bool(customer_name), bool(potion_sku))]
+
+    parameters = {"limit": SEARCH_PAGE_SIZE + 1}
+    if customer_name:
+        parameters["customer_name"] = customer_name
+    if potion_sku:
+        parameters["potion_sku"] = potion_sku
+    if page is not None:
+        parameters |= {"sort_value": page[1], "ledger_id": page[2]}
+
+    with db.cart_reader(x_cart_written_at).begin() as connection:
+        rows = connection.execute(search_query, parameters).mappings().all()
+
+    more = len(rows) > SEARCH_PAGE_SIZE
+    rows = rows[:SEARCH_PAGE_SIZE]
+    if backwards:
+        rows.reverse()
+
+    has_previous = more if backwards else page is not None
+    has_next = page is not None if backwards else more
 
     return {
-        "previous": bool(search_page),
-        "next": (( len(results) // 5 ) - bool(search_page) ) > 0,
-        "results": results
+        "previous": encode_search_page("prev", rows[0]['sort_value'], rows[0]['line_item_id']) if rows and has_previous else "",
+        "next": encode_search_page("next", rows[-1]['sort_value'], rows[-1]['line_item_id']) if rows and has_next else "",
+        "results": [{key: value for key, value in row.items() if key != 'sort_value'} for row in rows]
     }
 
 
@@ -73,99 +120,259 @@ class Customer(BaseModel):
     level: int
 
 
-@router.post("/visits/{visit_id}")
+def record_visits(connection, visit_id: int, customers: list[Customer]):
+    '''
+    Upserts every customer and records one visit per entry in a single statement, whatever the
+    number of customers.
+    '''
+
+    connection.execute(queries.visit_insert, {"visit_id": visit_id,
+                                              "names": [customer.customer_name for customer in customers],
+                                              "classes": [customer.character_class for customer in customers],
+                                              "levels": [customer.level for customer in customers]})
+
+
 def post_visits(visit_id: int, customers: list[Customer]):
     '''
     Inserts customers & records customer visits.
     '''
 
-    print(visit_id, customers)
+    logs.event(log, "visits recorded", visit_id = visit_id, customers = len(customers))
+
+    with db.engine.begin() as connection:
+        record_visits(connection, visit_id, customers)
 
-    customer_group = []
-    for customer in customers:
-        customer_group.append(dict(zip(['name', 'class', 'level'], [*vars(customer).values()])) | {"visit_id": visit_id})
+    return "OK"
 
-    visit_insert =  text('''WITH customer AS (INSERT INTO customers (name, class, level)
-                                              VALUES (:name, :class, :level)
-                                              ON CONFLICT (name, class, level) DO UPDATE SET id = customers.id
-                                              RETURNING id)
-                            INSERT INTO visits (visit_id, customer_id)
-                            VALUES (:visit_id, (SELECT id FROM customer));''')
 
-    with db.engine.begin() as connection:
-        connection.execute(visit_insert, customer_group)
-        
+async def post_visits_async(visit_id: int, customers: list[Customer]):
+    '''
+    Inserts customers & records customer visits.
+    '''
+
+    async with async_db.engine.begin() as connection:
+        await connection.run_sync(record_visits, visit_id, customers)
+
     return "OK"
 
 
-@router.post("/")
+router.post("/visits/{visit_id}")(async_db.select(post_visits, post_visits_async))
+
+
+def insert_cart(connection, customer: Customer):
+    '''
+    Inserts a new cart into carts for an already visited customer.
+    '''
+
+    return dict(connection.execute(queries.create_cart_for, dict(customer)).mappings().one())
+
+
 def create_cart(customer: Customer):
     '''
     Inserts a new cart into carts.
     '''
-    print(customer)
-
-    create_cart_for =   text('''INSERT INTO carts (customer_id)
-                                SELECT id
-                                FROM customers
-                                WHERE (name, class, level) IN ((:customer_name, :character_class, :level))
-                                RETURNING cart_id''')
+    logs.event(log, "cart created", customer_name = customer.customer_name, character_class = customer.character_class)
 
     with db.engine.begin() as connection:
-        cart_id = connection.execute(create_cart_for, dict(customer)).mappings().one()
-    
+        cart_id = insert_cart(connection, customer)
+
     return cart_id
 
 
+async def create_cart_async(customer: Customer):
+    '''
+    Inserts a new cart into carts.
+    '''
+
+    async with async_db.engine.begin() as connection:
+        cart_id = await connection.run_sync(insert_cart, customer)
+
+    return cart_id
+
+
+router.post("/")(async_db.select(create_cart, create_cart_async))
+
+
 class CartItem(BaseModel):
     quantity: int
 
 
-@router.post("/{cart_id}/items/{item_sku}")
-def set_item_quantity(cart_id: int, item_sku: str, cart_item: CartItem):
+def add_item(connection, cart_id: int, item_sku: str, quantity: int):
     '''
-    Inserts new transaction into potion_ledger and creates cart connection.
+    Reserves the SKU's stock and counts the sale on its stock row, inserts new transaction into
+    potion_ledger & creates the cart connection. Asking for more than is in stock raises a 409.
     '''
 
-    print(cart_id, item_sku, cart_item)
+    item = connection.execute(queries.put_in_cart, {'cart_id': cart_id, 'sku': item_sku, 'quantity': quantity}).one_or_none()
+    if item is None:
+        return
+
+    if not item.reserved:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Not enough {item_sku} in stock")
+
+
+def written(response: Response):
+    '''
+    Hands the caller a token for its cart write, so its later searches read that write.
+    '''
+    response.headers[db.WRITTEN_AT_HEADER] = db.written_at()
+
+
+def set_item_quantity(cart_id: int, item_sku: str, cart_item: CartItem, response: Response):
+    '''
+    Inserts new transaction into potion_ledger and creates cart connection.
+    '''
 
-    put_in_cart =   text('''WITH new_ledger AS (INSERT INTO potion_ledger (red, green, blue, dark, qty)
-                                                SELECT r, g, b, d, -:quantity
-                                                FROM catalog
-                                                WHERE name = :sku
-                                                RETURNING ledger_id, (SELECT price FROM catalog WHERE name = :sku))
-                            INSERT INTO potion_ledger_carts (cart_id, potion_ledger_id, price)
-                            SELECT :cart_id, ledger_id, price
-                            FROM new_ledger''')
+    logs.event(log, "cart item set", cart_id = cart_id, item_sku = item_sku, quantity = cart_item.quantity)
 
-    items = {'cart_id': cart_id, 'sku': item_sku,} | dict(cart_item)
+    if ledger_buffer.enabled:
+        ledger_buffer.items.add(cart_id, item_sku, cart_item.quantity)
+        written(response)
+        return "OK"
 
     with db.engine.begin() as connection:
-        connection.execute(put_in_cart, items)
+        add_item(connection, cart_id, item_sku, cart_item.quantity)
+
+    cache.stock_changed()
+    written(response)
+
+    return "OK"
+
+
+async def set_item_quantity_async(cart_id: int, item_sku: str, cart_item: CartItem, response: Response):
+    '''
+    Inserts new transaction into potion_ledger and creates cart connection.
+    '''
+
+    if ledger_buffer.enabled:
+        ledger_buffer.items.add(cart_id, item_sku, cart_item.quantity)
+        written(response)
+        return "OK"
+
+    async with async_db.engine.begin() as connection:
+        await connection.run_sync(add_item, cart_id, item_sku, cart_item.quantity)
+
+    cache.stock_changed()
+    written(response)
 
     return "OK"
 
 
+router.post("/{cart_id}/items/{item_sku}")(async_db.select(set_item_quantity, set_item_quantity_async))
+
+
 class CartCheckout(BaseModel):
     payment: str
 
 
-@router.post("/{cart_id}/checkout")
+def checkout_totals(connection, cart_id: int):
+    '''
+    Totals a cart's line items on the given connection.
+    '''
+
+    return dict(connection.execute(queries.checkout_shopping_cart, {"cart_id": cart_id}).mappings().one())
+
+
 def checkout(cart_id: int, cart_checkout: CartCheckout):
     '''
-    Returns total potions sold & gold paid.
+    Returns total potions sold & gold paid. Any line items the cart still has queued are written
+    first.
     '''
 
-    print(cart_id, cart_checkout)
+    logs.event(log, "cart checked out", cart_id = cart_id)
 
-    checkout_shopping_cart =    text('''SELECT -COALESCE(SUM(potion_ledger.qty), 0)::INT AS total_potions_bought,
-                                               -COALESCE(SUM(potion_ledger.qty * potion_ledger_carts.price), 0)::INT AS total_gold_paid
-                                        FROM potion_ledger_carts
-                                        LEFT OUTER JOIN potion_ledger ON potion_ledger.ledger_id = potion_ledger_carts.potion_ledger_id
-                                        GROUP BY potion_ledger_carts.cart_id
-                                        HAVING potion_ledger_carts.cart_id = :cart_id''')
+    ledger_buffer.items.flush(cart_id)
 
     with db.engine.begin() as connection:
-        transaction_total = connection.execute(checkout_shopping_cart, {"cart_id": cart_id}).mappings().one()
+        transaction_total = checkout_totals(connection, cart_id)
+
+    cache.stock_changed()
+
+    return transaction_total
+
+
+async def checkout_async(cart_id: int, cart_checkout: CartCheckout):
+    '''
+    Returns total potions sold & gold paid. Any line items the cart still has queued are written
+    first.
+    '''
+
+    await run_in_threadpool(ledger_buffer.items.flush, cart_id)
+
+    async with async_db.engine.begin() as connection:
+        transaction_total = await connection.run_sync(checkout_totals, cart_id)
+
+    cache.stock_changed()
+
+    return transaction_total
+
+
+router.post("/{cart_id}/checkout")(async_db.select(checkout, checkout_async))
+
+
+class CartLineItem(BaseModel):
+    sku: str
+    quantity: int
+
+
+class CartItems(BaseModel):
+    items: list[CartLineItem]
+    checkout: Optional[CartCheckout] = None
+
+
+def add_items(connection, cart_id: int, cart_items: CartItems):
+    '''
+    Inserts every line item into potion_ledger & potion_ledger_carts in one statement, counting
+    the sales on each SKU's stock row, and returns the checkout totals when a payment is given.
+    Unknown SKUs raise a 404 and SKUs without enough stock a 409, either way rolling back the whole
+    call.
+    '''
+
+    items = {'cart_id': cart_id,
+             'skus': [item.sku for item in cart_items.items],
+             'quantities': [item.quantity for item in cart_items.items]}
+
+    added = connection.execute(queries.put_items_in_cart, items).one()
+    if added.unknown_skus:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Unknown SKUs: {added.unknown_skus}")
+    if added.short_skus:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Not enough stock: {added.short_skus}")
+
+    return checkout_totals(connection, cart_id) if cart_items.checkout else None
+
+
+def set_item_quantities(cart_id: int, cart_items: CartItems, response: Response):
+    '''
+    Sets many line items in one transaction, checking out atomically when a payment is given.
+    '''
+
+    if cart_items.checkout:
+        ledger_buffer.items.flush(cart_id)
+
+    with db.engine.begin() as connection:
+        transaction_total = add_items(connection, cart_id, cart_items)
+
+    cache.stock_changed()
+    written(response)
+
+    return transaction_total or "OK"
+
+
+async def set_item_quantities_async(cart_id: int, cart_items: CartItems, response: Response):
+    '''
+    Sets many line items in one transaction, checking out atomically when a payment is given.
+    '''
+
+    if cart_items.checkout:
+        await run_in_threadpool(ledger_buffer.items.flush, cart_id)
+
+    async with async_db.engine.begin() as connection:
+        transaction_total = await connection.run_sync(add_items, cart_id, cart_items)
+
+    cache.stock_changed()
+    written(response)
+
+    return transaction_total or "OK"
+
 
-    return dict(transaction_total)
\ No newline at end of file
+router.post("/{cart_id}/items")(async_db.select(set_item_quantities, set_item_quantities_async))
@@ -1,35 +1,57 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Request
 import sqlalchemy
-from sqlalchemy import text
 from src import database as db
+from src import queries
+from src import async_database as async_db
+from src import cache
 from src.api import bottler
+from src.api import conditional
 
 router = APIRouter()
 
-@router.get("/catalog/", tags=["catalog"])
-def get_catalog():
-    '''
-    Each unique item combination must have only a single price.
-    '''
-
-    get_catalog =   text('''WITH reset AS (SELECT timestamp AS time
-                                           FROM resets
-                                           ORDER BY timestamp DESC
-                                           LIMIT 1)
-                            SELECT catalog.name AS sku,
-                                   catalog.name AS name,
-                                   COALESCE(SUM(potion_ledger.qty), 0)::INT AS quantity,
-                                   catalog.price AS price,
-                                   ARRAY[catalog.r, catalog.g, catalog.b, catalog.d] AS potion_type
-                            FROM catalog
-                            JOIN reset ON TRUE
-                            JOIN potion_ledger ON (potion_ledger.red, potion_ledger.green, potion_ledger.blue, potion_ledger.dark)
-                                 IN ((catalog.r, catalog.g, catalog.b, catalog.d))
-                            WHERE potion_ledger.timestamp >= reset.time AND catalog.listed
-                            GROUP BY catalog.name, catalog.price, catalog.r, catalog.g, catalog.b, catalog.d
-                            HAVING COALESCE(SUM(potion_ledger.qty), 0)::INT > 0''')
-
-    with db.engine.begin() as connection:
-        potions = connection.execute(get_catalog).mappings().all()
-
-    return potions
\ No newline at end of file
+def read_catalog(connection):
+    '''
+    Lists potions that are listed and in stock since the last reset.
+    '''
+
+    return [dict(potion) for potion in connection.execute(queries.get_catalog).mappings().all()]
+
+
+def read_tagged_catalog(connection):
+    '''
+    The catalog with its ETag. The version is read first, so a write committing in between leaves
+    an older tag on newer rows, which only costs the next poll a full response.
+    '''
+
+    etag = conditional.tag(connection.execute(queries.get_ledger_version).mappings().one_or_none())
+
+    return conditional.encode(etag, read_catalog(connection))
+
+
+def get_catalog(request: Request):
+    '''
+    Each unique item combination must have only a single price. Served from the in-process
+    catalog cache, which stock-changing writes invalidate, with a 304 for an unchanged ETag.
+    '''
+
+    def load():
+        with db.engine.begin() as connection:
+            return read_tagged_catalog(connection)
+
+    return conditional.respond(request, cache.catalog.get(load), conditional.CATALOG_CACHE_CONTROL)
+
+
+async def get_catalog_async(request: Request):
+    '''
+    Each unique item combination must have only a single price. Served from the in-process
+    catalog cache, which stock-changing writes invalidate, with a 304 for an unchanged ETag.
+    '''
+
+    async def load():
+        async with async_db.engine.begin() as connection:
+            return await connection.run_sync(read_tagged_catalog)
+
+    return conditional.respond(request, await cache.catalog.get_async(load), conditional.CATALOG_CACHE_CONTROL)
+
+
+router.get("/catalog/", tags=["catalog"])(async_db.select(get_catalog, get_catalog_async))
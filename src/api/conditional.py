@@ -0,0 +1,47 @@
+import json
+from fastapi import Request, Response
+
+# Conditional GETs for the polled read endpoints. Their cached value is the encoded JSON body and
+# an ETag built from the snapshot's (epoch, version), which every ledger write bumps in its own
+# transaction and a reset starts over. A poll whose If-None-Match names the cached ETag gets a
+# 304 straight from the in-process cache, without Postgres or serializing anything. The cache's
+# TTL bounds how long writes made by other workers go unnoticed, the same as for a 200.
+
+# Clients may keep the body but must revalidate it on every use
+CATALOG_CACHE_CONTROL = "public, no-cache"
+PRIVATE_CACHE_CONTROL = "private, no-cache"
+
+
+def tag(version):
+    '''
+    The ETag for a get_ledger_version or get_snapshot mapping, or None without a snapshot.
+    '''
+    return None if version is None else f'"{version["epoch"]}-{version["version"]}"'
+
+
+def encode(etag: str, value):
+    '''
+    The cacheable form of a response: (etag, JSON body).
+    '''
+    return etag, json.dumps(value, separators=(",", ":"), default=str).encode()
+
+
+def matches(request: Request, etag: str):
+    if etag is None:
+        return False
+
+    candidates = {candidate.strip().removeprefix("W/") for candidate in request.headers.get("if-none-match", "").split(",")}
+    return etag in candidates or "*" in candidates
+
+
+def respond(request: Request, cached, cache_control: str):
+    '''
+    304 when the request already holds the cached body, otherwise the body itself.
+    '''
+    etag, body = cached
+    headers = {"Cache-Control": cache_control} | ({"ETag": etag} if etag else {})
+
+    if matches(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -2,8 +2,10 @@ from fastapi import APIRouter, Depends, Request
 from pydantic import BaseModel
 from src.api import auth
 import sqlalchemy
-from sqlalchemy import text
-from src import database as db
+from src import logs
+from src import strategy
+
+log = logs.get_logger(__name__)
 
 router = APIRouter(
     prefix="/info",
@@ -18,14 +20,10 @@ class Timestamp(BaseModel):
 @router.post("/current_time")
 def post_time(timestamp: Timestamp):
     """
-    Share current time.
+    Share current time. The day's strategy is only rewritten and recomputed when the day changes.
     """
-    print(timestamp)
+    logs.event(log, "current time", day = timestamp.day, hour = timestamp.hour)
 
-    with db.engine.begin() as connection:
-        set_day_from = text("""UPDATE strategy
-                               SET is_today = (day_name = :day)""")
-    
-        connection.execute(set_day_from, {'day': timestamp.day})
+    strategy.daily.set_day(timestamp.day)
 
-    return "OK"
\ No newline at end of file
+    return "OK"
@@ -1,5 +1,5 @@
 from fastapi import FastAPI, exceptions
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from pydantic import ValidationError
 from src.api import carts, catalog, bottler, barrels, admin, info, inventory
 import json
@@ -8,6 +8,12 @@ import sys
 from starlette.middleware.cors import CORSMiddleware
 import sqlalchemy
 from src import database as db
+from src import async_database as async_db
+from src import ledger_buffer
+from src import logs
+from src import metrics
+
+logs.configure()
 
 description = """
 Central Coast Cauldrons is the premier ecommerce site for all your alchemical desires.
@@ -32,8 +38,35 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "OPTIONS"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
+app.add_middleware(metrics.MetricsMiddleware)
+
+
+@app.on_event("startup")
+async def connect_database():
+    '''
+    Creates the database engines before serving, opening DB_PREWARM_CONNECTIONS in each pool.
+    Platforms that skip lifespan events still work: the engines are then created on first use.
+    '''
+    db.connect()
+    async_db.connect()
+    if db.PREWARM_CONNECTIONS:
+        db.prewarm()
+        await async_db.prewarm()
+
+
+@app.on_event("shutdown")
+async def close_database():
+    '''
+    Writes any buffered cart items and closes the pools.
+    '''
+    ledger_buffer.items.flush()
+    await async_db.dispose()
+    db.dispose()
+
+
 app.include_router(inventory.router)
 app.include_router(carts.router)
 app.include_router(catalog.router)
@@ -56,3 +89,7 @@ async def validation_exception_handler(request, exc):
 @app.get("/")
 async def root():
     return {"message": "Welcome to the Central Coast Cauldrons."}
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
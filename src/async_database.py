@@ -0,0 +1,114 @@
+import os
+import threading
+import dotenv
+from sqlalchemy.engine import make_url
+from src import database
+from src import metrics
+
+dotenv.load_dotenv()
+
+# ASYNC_DATABASE=1 serves the hot endpoints (catalog, carts, inventory audit) as `async def`
+# handlers on an asyncpg engine, so waiting on Postgres no longer holds a threadpool worker.
+enabled = os.environ.get("ASYNC_DATABASE", "").lower() in ("1", "true", "yes")
+
+
+def asyncpg_url(url):
+    '''
+    url for asyncpg, caching prepared statements only where database.prepares() allows. asyncpg
+    prepares every statement it runs, so behind a transaction-mode pooler use port 5432 instead.
+    '''
+    cache_size = os.environ.get("DB_STATEMENT_CACHE_SIZE", "100") if database.prepares(url) else "0"
+    return make_url(url).set(drivername="postgresql+asyncpg").update_query_dict(
+        {"prepared_statement_cache_size": cache_size}
+    )
+
+
+def database_connection_url():
+    return asyncpg_url(database.database_connection_url())
+
+
+def replica_connection_url():
+    return asyncpg_url(database.replica_connection_url())
+
+
+def select(sync_handler, async_handler):
+    '''
+    Picks which implementation of an endpoint to register with its router.
+    '''
+    return async_handler if enabled else sync_handler
+
+
+# Like database.engine and database.reads, `engine` and `reads` are created by connect() at
+# startup or on first use; both are None unless ASYNC_DATABASE is set. SQLAlchemy's asyncio
+# extension (which pulls in the ORM) and asyncpg are only imported then.
+_connect_lock = threading.Lock()
+_engines = None
+
+
+def connect():
+    '''
+    Creates and instruments the async engines once; later calls return them.
+    '''
+    global engine, reads, _engines
+    if _engines is not None:
+        return _engines
+
+    with _connect_lock:
+        if _engines is None and not enabled:
+            engine = reads = None
+            _engines = None, None
+        elif _engines is None:
+            from sqlalchemy.ext.asyncio import create_async_engine
+
+            primary = create_async_engine(
+                database_connection_url(),
+                pool_pre_ping = True,
+                poolclass = metrics.TimedAsyncQueuePool,
+                pool_size = int(os.environ.get("DB_POOL_SIZE", 5)),
+                max_overflow = int(os.environ.get("DB_MAX_OVERFLOW", 10)),
+                pool_timeout = float(os.environ.get("DB_POOL_TIMEOUT", 30)),
+            )
+
+            # The asyncpg counterpart of database.reads, sized and switched off by the same settings
+            replica = create_async_engine(
+                replica_connection_url(),
+                pool_pre_ping = True,
+                poolclass = metrics.TimedAsyncReplicaQueuePool,
+                pool_size = database.READ_POOL_SIZE,
+                max_overflow = int(os.environ.get("DB_READ_MAX_OVERFLOW", 5)),
+                execution_options = {"postgresql_readonly": True},
+            ) if database.READ_POOL_SIZE else primary
+
+            for created in {primary, replica}:
+                metrics.instrument(created.sync_engine)
+            engine, reads = _engines = primary, replica
+
+    return _engines
+
+
+async def prewarm(connections: int = database.PREWARM_CONNECTIONS):
+    '''
+    database.prewarm() for the async pools.
+    '''
+    for warmed in set(connect()) - {None}:
+        opened = [await warmed.connect() for _ in range(min(connections, warmed.pool.size()))]
+        for connection in opened:
+            await connection.close()
+
+
+async def dispose():
+    for created in set(_engines or ()) - {None}:
+        await created.dispose()
+
+
+def __getattr__(name: str):
+    if name in ("engine", "reads"):
+        return connect()[("engine", "reads").index(name)]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def reader():
+    '''
+    Async engine for read-only queries that don't depend on cart changes.
+    '''
+    return connect()[1]
@@ -0,0 +1,102 @@
+import os
+import threading
+import time
+import dotenv
+
+dotenv.load_dotenv()
+
+
+class EpochCache:
+    '''
+    Holds a single computed value for the current reset epoch. Writers that change the value
+    call invalidate() after committing, admin resets call reset(), and the TTL bounds staleness
+    from writes made by other processes.
+    '''
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+        self._epoch = 0
+        self._generation = 0
+        self._entry = None
+
+    def get(self, load):
+        '''
+        Returns the cached value, calling load() to refresh it on a miss. A load that overlaps an
+        invalidation is returned to its caller but not stored.
+        '''
+        with self._lock:
+            key = (self._epoch, self._generation)
+            if self._entry is not None and self._entry[0] == key and self._entry[1] > time.monotonic():
+                self.hits += 1
+                return self._entry[2]
+            self.misses += 1
+
+        value = load()
+
+        with self._lock:
+            if key == (self._epoch, self._generation):
+                self._entry = (key, time.monotonic() + self.ttl, value)
+
+        return value
+
+    async def get_async(self, load):
+        '''
+        get() for coroutine loaders; a hit never awaits.
+        '''
+        with self._lock:
+            key = (self._epoch, self._generation)
+            if self._entry is not None and self._entry[0] == key and self._entry[1] > time.monotonic():
+                self.hits += 1
+                return self._entry[2]
+            self.misses += 1
+
+        value = await load()
+
+        with self._lock:
+            if key == (self._epoch, self._generation):
+                self._entry = (key, time.monotonic() + self.ttl, value)
+
+        return value
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._entry = None
+            self.invalidations += 1
+
+    def reset(self):
+        '''
+        Starts a new reset epoch, dropping anything cached for the previous one.
+        '''
+        with self._lock:
+            self._epoch += 1
+            self._generation = 0
+            self._entry = None
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            return {"epoch": self._epoch, "hits": self.hits, "misses": self.misses,
+                    "invalidations": self.invalidations, "ttl": self.ttl,
+                    "cached": self._entry is not None and self._entry[1] > time.monotonic()}
+
+
+catalog = EpochCache(ttl = float(os.environ.get("CATALOG_CACHE_TTL", 30)))
+inventory = EpochCache(ttl = float(os.environ.get("INVENTORY_CACHE_TTL", 5)))
+
+
+def stock_changed():
+    '''
+    Drops the catalog and the balances after a committed write that moved potions (carts, bottling).
+    '''
+    catalog.invalidate()
+    inventory.invalidate()
+
+
+def reset():
+    catalog.reset()
+    inventory.reset()
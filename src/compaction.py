@@ -0,0 +1,352 @@
+from sqlalchemy import text
+
+# Compaction of closed reset epochs. An epoch is closed once a later reset exists, so nothing
+# writes to it again. Compacting rolls it up into epoch_potion_totals and epoch_totals, checks the
+# rollup against balances kept apart from the ledgers, then moves the raw rows into the archive
+# schema: a ledger's epoch partition is detached and moved whole, rows in default partitions and
+# in the link tables that point at ledger ids are copied and deleted, and the move is checked
+# against the rollup. Purging drops the archive copy after re-checking it.
+#
+# The rollup is checked before the move against the epoch's final inventory_snapshot row and its
+# potion_stock rows, which the write paths kept up to date a write at a time. Re-running the
+# rollup's own queries on the same rows could only agree with it. An epoch from before snapshots
+# existed (epoch 0 among them) is checked against a recompute in the shape of the `global` view,
+# one sum per ledger, instead.
+#
+# Table names below are fixed or built from an integer epoch, never from request input.
+
+LEDGERS = ("potion_ledger", "barrel_ledger", "capacity_ledger")
+
+# ledger -> (link table, its ledger id column, the ledger's id column)
+LINKS = {
+    "potion_ledger": (("potion_ledger_carts", "potion_ledger_id", "ledger_id"),
+                      ("potion_ledger_deliveries", "ledger_id", "ledger_id")),
+    "barrel_ledger": (),
+    "capacity_ledger": (("capacity_ledger_deliveries", "capacity_id", "id"),),
+}
+
+TOTALS = ("red", "green", "blue", "dark", "barrel_gold", "capacity_gold", "potion_capacity", "volume_capacity",
+          "barrel_entries", "capacity_entries")
+
+get_open_epochs =   text('''SELECT epoch
+                            FROM (SELECT 0::BIGINT AS epoch
+                                  UNION
+                                  SELECT id
+                                  FROM resets) AS epochs
+                            WHERE epoch < current_epoch()
+                                AND epoch NOT IN (SELECT epoch
+                                                  FROM epoch_totals
+                                                  WHERE archived)
+                            ORDER BY epoch''')
+
+get_archived_epochs =   text('''SELECT epoch
+                                FROM epoch_totals
+                                WHERE archived
+                                ORDER BY epoch''')
+
+get_stored_potions =    text('''SELECT potion_id, qty, gold, entries
+                                FROM epoch_potion_totals
+                                WHERE epoch = :epoch''')
+
+get_stored_totals = text(f'''SELECT {", ".join(TOTALS)}, archived
+                             FROM epoch_totals
+                             WHERE epoch = :epoch''')
+
+clear_potions = text('''DELETE FROM epoch_potion_totals
+                        WHERE epoch = :epoch''')
+
+store_potions = text('''INSERT INTO epoch_potion_totals (epoch, potion_id, qty, gold, entries)
+                        VALUES (:epoch, :potion_id, :qty, :gold, :entries)''')
+
+store_totals =  text(f'''INSERT INTO epoch_totals (epoch, {", ".join(TOTALS)})
+                         VALUES (:epoch, {", ".join(":" + column for column in TOTALS)})
+                         ON CONFLICT (epoch) DO UPDATE
+                         SET {", ".join(f"{column} = EXCLUDED.{column}" for column in TOTALS)},
+                             compacted_at = now()''')
+
+mark_archived = text('''UPDATE epoch_totals
+                        SET archived = TRUE
+                        WHERE epoch = :epoch''')
+
+clear_stock =   text('''DELETE FROM potion_stock
+                        WHERE epoch = :epoch''')
+
+partition_exists =  text('''SELECT to_regclass(:name) IS NOT NULL''')
+
+BALANCES = ("gold", "num_potions", "red", "green", "blue", "dark", "potion_capacity", "volume_capacity")
+
+# The epoch's snapshot row as the write paths left it, plus the cart sales counted on its stock rows
+get_final_balances =    text('''SELECT snapshot.gold + stock.gold AS gold,
+                                        snapshot.num_potions - stock.sold AS num_potions,
+                                        snapshot.red, snapshot.green, snapshot.blue, snapshot.dark,
+                                        snapshot.potion_capacity, snapshot.volume_capacity
+                                 FROM resets
+                                 JOIN inventory_snapshot AS snapshot ON snapshot.reset_time = resets.timestamp
+                                 CROSS JOIN (SELECT COALESCE(SUM(sold), 0)::BIGINT AS sold,
+                                                    COALESCE(SUM(gold), 0)::BIGINT AS gold
+                                             FROM potion_stock
+                                             WHERE epoch = :epoch) AS stock
+                                 WHERE resets.id = :epoch''')
+
+get_final_stock =   text('''SELECT potion_id, available
+                            FROM potion_stock
+                            WHERE epoch = :epoch''')
+
+get_ledger_balances =   text('''WITH potions AS (SELECT COALESCE(SUM(qty), 0)::BIGINT AS num_potions
+                                                    FROM potion_ledger
+                                                    WHERE epoch = :epoch),
+                                     sales AS (SELECT COALESCE(SUM(-ledger.qty * carts.price), 0)::BIGINT AS gold
+                                               FROM potion_ledger_carts carts
+                                               JOIN potion_ledger ledger ON ledger.ledger_id = carts.potion_ledger_id
+                                               WHERE ledger.epoch = :epoch),
+                                     barrels AS (SELECT COALESCE(SUM(red), 0)::BIGINT AS red, COALESCE(SUM(green), 0)::BIGINT AS green,
+                                                        COALESCE(SUM(blue), 0)::BIGINT AS blue, COALESCE(SUM(dark), 0)::BIGINT AS dark
+                                                 FROM barrel_ledger
+                                                 WHERE epoch = :epoch),
+                                     purchases AS (SELECT COALESCE(SUM(purchase.cost * purchase.quantity), 0)::BIGINT AS gold
+                                                   FROM barrel_purchase purchase
+                                                   JOIN barrel_ledger ledger ON ledger.barrel_id = purchase.id
+                                                   WHERE ledger.epoch = :epoch),
+                                     capacity AS (SELECT COALESCE(SUM(cost), 0)::BIGINT AS gold,
+                                                         COALESCE(SUM(potion), 0)::BIGINT AS potion_capacity,
+                                                         COALESCE(SUM(volume), 0)::BIGINT AS volume_capacity
+                                                  FROM capacity_ledger
+                                                  WHERE epoch = :epoch)
+                                SELECT sales.gold - purchases.gold - capacity.gold AS gold, potions.num_potions,
+                                       barrels.red, barrels.green, barrels.blue, barrels.dark,
+                                       capacity.potion_capacity, capacity.volume_capacity
+                                FROM potions, sales, barrels, purchases, capacity''')
+
+
+def tables(epoch: int, archived: bool):
+    '''
+    Where an epoch's raw rows live: the hot tables, or their archive copies.
+    '''
+    names = LEDGERS + tuple(link for links in LINKS.values() for link, _, _ in links)
+    return {name: f"archive.{name}_e{int(epoch)}" if archived else f"public.{name}" for name in names}
+
+
+def raw_potions(connection, epoch: int, archived: bool):
+    names = tables(epoch, archived)
+    potions = text(f'''SELECT ledger.potion_id,
+                              COALESCE(SUM(ledger.qty), 0)::BIGINT AS qty,
+                              COALESCE(SUM(-ledger.qty * carts.price), 0)::BIGINT AS gold,
+                              COUNT(*) AS entries
+                       FROM {names["potion_ledger"]} ledger
+                       LEFT JOIN {names["potion_ledger_carts"]} carts ON carts.potion_ledger_id = ledger.ledger_id
+                       WHERE ledger.epoch = :epoch
+                       GROUP BY ledger.potion_id''')
+
+    return {row.potion_id: dict(row._mapping) for row in connection.execute(potions, {"epoch": epoch})}
+
+
+def raw_totals(connection, epoch: int, archived: bool):
+    names = tables(epoch, archived)
+    totals = text(f'''WITH barrels AS (SELECT COALESCE(SUM(ledger.red), 0)::BIGINT AS red,
+                                              COALESCE(SUM(ledger.green), 0)::BIGINT AS green,
+                                              COALESCE(SUM(ledger.blue), 0)::BIGINT AS blue,
+                                              COALESCE(SUM(ledger.dark), 0)::BIGINT AS dark,
+                                              COALESCE(SUM(barrel_purchase.cost * barrel_purchase.quantity), 0)::BIGINT AS gold,
+                                              COUNT(*) AS entries
+                                       FROM {names["barrel_ledger"]} ledger
+                                       LEFT JOIN barrel_purchase ON barrel_purchase.id = ledger.barrel_id
+                                       WHERE ledger.epoch = :epoch),
+                           capacity AS (SELECT COALESCE(SUM(cost), 0)::BIGINT AS gold,
+                                               COALESCE(SUM(potion), 0)::BIGINT AS potion,
+                                               COALESCE(SUM(volume), 0)::BIGINT AS volume,
+                                               COUNT(*) AS entries
+                                        FROM {names["capacity_ledger"]}
+                                        WHERE epoch = :epoch)
+                      SELECT barrels.red, barrels.green, barrels.blue, barrels.dark,
+                             barrels.gold AS barrel_gold, capacity.gold AS capacity_gold,
+                             capacity.potion AS potion_capacity, capacity.volume AS volume_capacity,
+                             barrels.entries AS barrel_entries, capacity.entries AS capacity_entries
+                      FROM barrels, capacity''')
+
+    return dict(connection.execute(totals, {"epoch": epoch}).mappings().one())
+
+
+def summarize(connection, epoch: int):
+    '''
+    (Re)writes an epoch's summary rows from its raw ledger rows in the hot tables.
+    '''
+    potions = raw_potions(connection, epoch, archived = False)
+
+    connection.execute(clear_potions, {"epoch": epoch})
+    if potions:
+        connection.execute(store_potions, [potion | {"epoch": epoch} for potion in potions.values()])
+    connection.execute(store_totals, raw_totals(connection, epoch, archived = False) | {"epoch": epoch})
+
+
+def verify(connection, epoch: int):
+    '''
+    Compares an epoch's summary rows against its raw rows, wherever they currently live. Returns
+    the mismatches as {key: {"summary": ..., "raw": ...}}; empty when they agree.
+    '''
+    stored = connection.execute(get_stored_totals, {"epoch": epoch}).mappings().one_or_none()
+    if stored is None:
+        return {"epoch_totals": {"summary": None, "raw": "not compacted"}}
+
+    archived = stored["archived"]
+    mismatches = {}
+
+    totals = raw_totals(connection, epoch, archived)
+    for column in TOTALS:
+        if stored[column] != totals[column]:
+            mismatches[column] = {"summary": stored[column], "raw": totals[column]}
+
+    summary = {row.potion_id: dict(row._mapping) for row in connection.execute(get_stored_potions, {"epoch": epoch})}
+    potions = raw_potions(connection, epoch, archived)
+    for potion_id in summary.keys() | potions.keys():
+        if summary.get(potion_id) != potions.get(potion_id):
+            mismatches[f"potion {potion_id}"] = {"summary": summary.get(potion_id), "raw": potions.get(potion_id)}
+
+    return mismatches
+
+
+def summary_balances(connection, epoch: int):
+    '''
+    The balances an epoch's summary rows add up to, and its net stock per potion.
+    '''
+    totals = connection.execute(get_stored_totals, {"epoch": epoch}).mappings().one()
+    potions = connection.execute(get_stored_potions, {"epoch": epoch}).all()
+
+    balances = {"gold": sum(potion.gold for potion in potions) - totals["barrel_gold"] - totals["capacity_gold"],
+                "num_potions": sum(potion.qty for potion in potions)}
+    balances |= {column: totals[column] for column in ("red", "green", "blue", "dark", "potion_capacity", "volume_capacity")}
+
+    return balances, {potion.potion_id: potion.qty for potion in potions}
+
+
+def check_balances(connection, epoch: int):
+    '''
+    Compares an epoch's freshly written summary rows against its final snapshot and stock rows (or,
+    without a snapshot, a separate recompute from its hot ledger rows). Returns the mismatches as
+    {key: {"summary": ..., "recorded": ...}}; empty when they agree.
+    '''
+    summary, stock = summary_balances(connection, epoch)
+
+    recorded = connection.execute(get_final_balances, {"epoch": epoch}).mappings().one_or_none()
+    if recorded is None:
+        recorded = connection.execute(get_ledger_balances, {"epoch": epoch}).mappings().one()
+
+    mismatches = {column: {"summary": summary[column], "recorded": recorded[column]}
+                  for column in BALANCES if summary[column] != recorded[column]}
+
+    # Epochs from before stock rows were kept have none; potions without a row hold nothing
+    available = dict(connection.execute(get_final_stock, {"epoch": epoch}).all())
+    if available:
+        for potion_id in stock.keys() | available.keys():
+            if stock.get(potion_id, 0) != available.get(potion_id, 0):
+                mismatches[f"potion {potion_id}"] = {"summary": stock.get(potion_id, 0), "recorded": available.get(potion_id, 0)}
+
+    return mismatches
+
+
+def archive(connection, epoch: int):
+    '''
+    Moves an epoch's raw rows from the hot tables into the archive schema.
+    '''
+    epoch = int(epoch)
+
+    for ledger in LEDGERS:
+        for link, column, ledger_id in LINKS[ledger]:
+            connection.execute(text(f'''CREATE TABLE archive.{link}_e{epoch} AS
+                                        SELECT link.*
+                                        FROM public.{link} link
+                                        JOIN public.{ledger} ledger ON ledger.{ledger_id} = link.{column}
+                                        WHERE ledger.epoch = :epoch'''), {"epoch": epoch})
+            connection.execute(text(f'''DELETE FROM public.{link} link
+                                        USING public.{ledger} ledger
+                                        WHERE ledger.{ledger_id} = link.{column} AND ledger.epoch = :epoch'''),
+                               {"epoch": epoch})
+
+        partition = f"{ledger}_e{epoch}"
+        if connection.execute(partition_exists, {"name": f"public.{partition}"}).scalar_one():
+            connection.execute(text(f"ALTER TABLE public.{ledger} DETACH PARTITION public.{partition}"))
+            connection.execute(text(f"ALTER TABLE public.{partition} SET SCHEMA archive"))
+        else:
+            # Epoch 0 and anything else without its own partition sits in the default partition
+            connection.execute(text(f'''CREATE TABLE archive.{partition} AS
+                                        SELECT *
+                                        FROM public.{ledger}
+                                        WHERE epoch = :epoch'''), {"epoch": epoch})
+            connection.execute(text(f"DELETE FROM public.{ledger} WHERE epoch = :epoch"), {"epoch": epoch})
+
+
+def compact(connection, epoch: int, dry_run: bool = False):
+    '''
+    Summarizes a closed epoch and, if the summary matches its recorded balances and then the moved
+    rows, archives them. A dry run only summarizes and checks. Returns {"archived", "mismatches"};
+    a failed check after the move raises so the caller's transaction rolls back.
+    '''
+    summarize(connection, epoch)
+    mismatches = check_balances(connection, epoch)
+    if mismatches or dry_run:
+        return {"archived": False, "mismatches": mismatches}
+
+    archive(connection, epoch)
+    connection.execute(mark_archived, {"epoch": epoch})
+    # A closed epoch sells nothing more, so its stock counters go with its raw rows
+    connection.execute(clear_stock, {"epoch": epoch})
+
+    mismatches = verify(connection, epoch)
+    if mismatches:
+        raise RuntimeError(f"Epoch {epoch} archive does not match its summary: {mismatches}")
+
+    return {"archived": True, "mismatches": {}}
+
+
+def purge(connection, epoch: int):
+    '''
+    Drops an archived epoch's raw rows once they are verified against its summary, keeping only
+    the summary. Returns the mismatches instead of dropping anything if they disagree.
+    '''
+    mismatches = verify(connection, epoch)
+    if mismatches:
+        return mismatches
+
+    for name in tables(epoch, archived = True).values():
+        connection.execute(text(f"DROP TABLE IF EXISTS {name}"))
+
+    return {}
+
+
+def open_epochs(connection):
+    '''
+    Closed epochs whose raw rows are still in the hot tables.
+    '''
+    return list(connection.execute(get_open_epochs).scalars())
+
+
+def archived_epochs(connection):
+    return list(connection.execute(get_archived_epochs).scalars())
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    from src import database as db
+
+    parser = argparse.ArgumentParser(description="Compact, verify or purge closed reset epochs.")
+    parser.add_argument("command", choices=["compact", "verify", "purge"])
+    parser.add_argument("--epoch", type=int, action="append", help="limit to these epochs")
+    parser.add_argument("--dry-run", action="store_true", help="summarize and verify without archiving")
+    args = parser.parse_args()
+
+    with db.engine.begin() as connection:
+        epochs = args.epoch or (open_epochs(connection) if args.command == "compact" else archived_epochs(connection))
+
+    results = {}
+    for epoch in epochs:
+        with db.engine.begin() as connection:
+            if args.command == "compact":
+                results[epoch] = compact(connection, epoch, args.dry_run)
+            elif args.command == "verify":
+                results[epoch] = verify(connection, epoch)
+            else:
+                results[epoch] = purge(connection, epoch)
+
+    print(json.dumps(results, default=str, indent=2))
+    failed = any(result.get("mismatches") if args.command == "compact" else result for result in results.values())
+    raise SystemExit(1 if failed else 0)
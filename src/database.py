@@ -1,13 +1,168 @@
 import os
+import threading
+import time
 import dotenv
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from src import metrics
+
+dotenv.load_dotenv()
 
 def database_connection_url():
-    dotenv.load_dotenv()
+    return os.environ.get("POSTGRES_URI")
+
+def replica_connection_url():
+    '''
+    POSTGRES_REPLICA_URI when a replica is configured, else the primary (reads then get their own
+    pool on the primary).
+    '''
+    return os.environ.get("POSTGRES_REPLICA_URI") or database_connection_url()
+
+# psycopg prepares a statement server-side once it has run DB_PREPARE_THRESHOLD times on a
+# connection; later runs skip parse and plan. The registry in src/queries keeps each statement's
+# text fixed so repeats match. That needs each connection to keep one server connection, which a
+# direct connection or a session-mode pooler does (both on port 5432 at Supabase). A
+# transaction-mode pooler (PgBouncer, Supabase on port 6543) hands every transaction whichever
+# server connection is free, where the statement may not exist or may clash with another
+# client's. So unless DB_PREPARE_THRESHOLD is set, statements are only prepared over port 5432.
+DIRECT_PORT = 5432
+
+
+def prepares(url):
+    '''
+    Whether connections to url may keep prepared statements: DB_PREPARE_THRESHOLD if set, else
+    whether url is on the direct/session port.
+    '''
+    setting = os.environ.get("DB_PREPARE_THRESHOLD")
+    if setting is None:
+        return (make_url(url).port or DIRECT_PORT) == DIRECT_PORT
+    return setting.lower() not in ("", "off", "none")
+
+
+def prepare_threshold(url):
+    '''
+    psycopg's prepare_threshold for connections to url; None never prepares.
+    '''
+    return int(os.environ.get("DB_PREPARE_THRESHOLD", 1)) if prepares(url) else None
+
+
+def psycopg_url(url):
+    return make_url(url).set(drivername="postgresql+psycopg")
+
+
+# Heavy read-only endpoints (order search, inventory audit, capacity plan) run on a separately
+# sized pool so they can't starve cart writes of connections. Its transactions begin READ ONLY,
+# so a stray write fails loudly instead of landing on a replica; that is set per transaction by
+# the driver rather than as a startup option, which PgBouncer and Supabase's pooler reject.
+# DB_READ_POOL_SIZE=0 turns routing off.
+READ_POOL_SIZE = int(os.environ.get("DB_READ_POOL_SIZE", 5))
+
+# Connections each pool opens as the app starts, so the first requests after a cold start don't
+# pay for connecting
+PREWARM_CONNECTIONS = int(os.environ.get("DB_PREWARM_CONNECTIONS", 0))
+
+# `engine` and `reads` are created by connect(), which the app's startup event calls, or
+# on first use otherwise; importing this module doesn't load the driver or touch the network.
+_connect_lock = threading.Lock()
+_engines = None
+
+
+def connect():
+    '''
+    Creates and instruments the engines once; later calls return them.
+    '''
+    global engine, reads, _engines
+    if _engines is not None:
+        return _engines
+
+    with _connect_lock:
+        if _engines is None:
+            primary = create_engine(
+                psycopg_url(database_connection_url()),
+                pool_pre_ping = True,
+                poolclass = metrics.TimedQueuePool,
+                connect_args = {"prepare_threshold": prepare_threshold(database_connection_url())},
+            )
+
+            replica = create_engine(
+                psycopg_url(replica_connection_url()),
+                pool_pre_ping = True,
+                poolclass = metrics.TimedReplicaQueuePool,
+                pool_size = READ_POOL_SIZE,
+                max_overflow = int(os.environ.get("DB_READ_MAX_OVERFLOW", 5)),
+                connect_args = {"prepare_threshold": prepare_threshold(replica_connection_url())},
+                execution_options = {"postgresql_readonly": True},
+            ) if READ_POOL_SIZE else primary
+
+            for created in {primary, replica}:
+                metrics.instrument(created)
+            engine, reads = _engines = primary, replica
+
+    return _engines
+
+
+def prewarm(connections: int = PREWARM_CONNECTIONS):
+    '''
+    Opens up to connections connections in each pool and returns them to it.
+    '''
+    for warmed in set(connect()):
+        opened = [warmed.connect() for _ in range(min(connections, warmed.pool.size()))]
+        for connection in opened:
+            connection.close()
+
+
+def dispose():
+    for created in set(_engines or ()):
+        created.dispose()
+
+
+def __getattr__(name: str):
+    if name in ("engine", "reads"):
+        return connect()[("engine", "reads").index(name)]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# Cart writes answer with WRITTEN_AT_HEADER, the time they committed. A caller that sends it
+# back on a read spanning carts (order search) reads the primary until the replica has had
+# READ_YOUR_WRITES_SECONDS to replay its write. Only the caller's own writes count, and the token
+# works whichever instance or worker served the write.
+WRITTEN_AT_HEADER = "X-Cart-Written-At"
+READ_YOUR_WRITES_SECONDS = float(os.environ.get("READ_YOUR_WRITES_SECONDS", 10))
+
+
+def written_at():
+    '''
+    The token a cart write answers with.
+    '''
+    return f"{time.time():.3f}"
+
+
+def recently_written(token: str = None):
+    '''
+    Whether a written_at token is within the replica's catch-up window. Tokens a little ahead
+    (rounding, another instance's clock) count; missing, malformed and far-future ones don't.
+    '''
+    try:
+        age = time.time() - float(token)
+    except (TypeError, ValueError):
+        return False
+    return abs(age) < READ_YOUR_WRITES_SECONDS
+
+
+def reader():
+    '''
+    Engine for read-only queries that don't depend on cart changes.
+    '''
+    return connect()[1]
 
-    return os.environ.get("POSTGRES_URI") 
 
-engine = create_engine(database_connection_url(), pool_pre_ping = True)
+def cart_reader(written_at: str = None):
+    '''
+    Engine for read-only queries over carts: the primary while the caller's last cart write (its
+    written_at token) may not have reached the replica, otherwise the read pool.
+    '''
+    primary, replica = connect()
+    return primary if recently_written(written_at) else replica
 
 
 # if __name__ == '__main__':
@@ -27,4 +182,4 @@ engine = create_engine(database_connection_url(), pool_pre_ping = True)
 #         return {'api_key': api_key, 'base_url': base_url, 'headers': headers}
 
 #     time = requests.get(shop_info()['base_url']+'/rest/v1/current_game_time?select=*', headers=shop_info()['headers']).json()
-#     ratings = requests.get(shop_info()['base_url']+'/rest/v1/rpc/shop_star_ratings', headers=shop_info()['headers']).json()
\ No newline at end of file
+#     ratings = requests.get(shop_info()['base_url']+'/rest/v1/rpc/shop_star_ratings', headers=shop_info()['headers']).json()
@@ -0,0 +1,73 @@
+import collections
+import json
+import os
+import threading
+import dotenv
+from src import database as db
+from src import queries
+
+dotenv.load_dotenv()
+
+# Delivery endpoints are retried by the game server after timeouts. Each (kind, order_id) is
+# claimed once in the deliveries table; replays return the stored result without touching the
+# ledgers, and recent results are also kept in memory so most retries skip the database.
+
+
+class RecentOrders:
+    '''
+    LRU of delivery results by (kind, order_id), holding only committed deliveries.
+    '''
+
+    def __init__(self, size: int):
+        self.size = size
+        self.hits = 0
+        self._lock = threading.Lock()
+        self._results = collections.OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._results:
+                return None
+            self._results.move_to_end(key)
+            self.hits += 1
+            return self._results[key]
+
+    def put(self, key, result):
+        with self._lock:
+            self._results[key] = result
+            self._results.move_to_end(key)
+            while len(self._results) > self.size:
+                self._results.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "size": len(self._results), "capacity": self.size}
+
+
+recent = RecentOrders(size = int(os.environ.get("DELIVERY_CACHE_SIZE", 1024)))
+
+
+def deliver(kind: str, order_id: int, record):
+    '''
+    Runs record(connection) once per (kind, order_id) and returns (result, delivered). A replay
+    returns the first delivery's result with delivered False; concurrent duplicates wait on the
+    unique key until the first commits.
+    '''
+    key = (kind, order_id)
+    result = recent.get(key)
+    if result is not None:
+        return result, False
+
+    parameters = {"kind": kind, "order_id": order_id}
+
+    with db.engine.begin() as connection:
+        delivered = connection.execute(queries.claim_delivery, parameters).first() is not None
+        if delivered:
+            result = record(connection)
+            connection.execute(queries.store_delivery_result, parameters | {"result": json.dumps(result)})
+        else:
+            result = connection.execute(queries.get_delivery_result, parameters).scalar_one()
+
+    recent.put(key, result)
+
+    return result, delivered
@@ -0,0 +1,71 @@
+import csv
+import io
+import json
+import os
+from datetime import datetime
+from enum import Enum
+import dotenv
+from src import database as db
+from src import queries
+
+dotenv.load_dotenv()
+
+# Bulk exports of the ledgers and cart history. Rows come from a server-side cursor on the read
+# pool, EXPORT_BATCH_ROWS at a time, and each batch is encoded and sent before the next is
+# fetched, so memory stays flat however many rows an epoch holds. Epochs already archived by
+# compaction are no longer in the hot tables and export empty.
+
+EXPORT_BATCH_ROWS = int(os.environ.get("EXPORT_BATCH_ROWS", 1000))
+
+
+class Dataset(str, Enum):
+    potion_ledger = "potion_ledger"
+    barrel_ledger = "barrel_ledger"
+    capacity_ledger = "capacity_ledger"
+    cart_history = "cart_history"
+
+
+class Format(str, Enum):
+    ndjson = "ndjson"
+    csv = "csv"
+
+
+MEDIA_TYPES = {Format.ndjson: "application/x-ndjson", Format.csv: "text/csv"}
+
+
+def encode_value(value):
+    return value.isoformat() if isinstance(value, datetime) else str(value)
+
+
+def ndjson_lines(columns, batches):
+    for rows in batches:
+        yield "".join(json.dumps(dict(zip(columns, row)), default=encode_value) + "\n" for row in rows)
+
+
+def csv_lines(columns, batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    writer.writerow(columns)
+    for rows in batches:
+        writer.writerows((encode_value(value) if isinstance(value, datetime) else value for value in row) for row in rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+    # Header only, when the export is empty
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def stream(dataset: Dataset, format: Format, epoch: int = None, since: datetime = None, until: datetime = None):
+    '''
+    Yields one encoded chunk per batch of rows. The cursor stays open between chunks and is closed
+    when the generator finishes or the client disconnects.
+    '''
+    parameters = {"epoch": epoch, "since": since, "until": until}
+
+    with db.reader().begin() as connection:
+        result = connection.execution_options(yield_per = EXPORT_BATCH_ROWS).execute(queries.exports[dataset.value], parameters)
+        encode = ndjson_lines if format == Format.ndjson else csv_lines
+        yield from encode(list(result.keys()), result.partitions())
@@ -0,0 +1,149 @@
+import atexit
+import multiprocessing
+import os
+import threading
+import dotenv
+from src import database as db
+from src import queries
+from src import cache
+from src import logs
+
+dotenv.load_dotenv()
+
+log = logs.get_logger(__name__)
+
+# LEDGER_BUFFER=1 turns cart line items into write-behind: the endpoint queues the item and
+# answers at once, and a background thread writes everything queued in one transaction every
+# LEDGER_BUFFER_FLUSH_MS, or sooner once LEDGER_BUFFER_ITEMS are waiting. A burst of carts then
+# pays for one commit per flush instead of one per item. Checkout flushes first, so its totals
+# include every item its cart queued.
+#
+# Stock is still never oversold: a flush locks the stock rows of the SKUs it carries and accepts
+# items in arrival order while they fit. An item that doesn't fit (or names an unknown SKU) is
+# dropped and logged, since its request was already answered; that late refusal, and losing
+# what is queued if the process dies, are the price of the mode.
+#
+# The queue lives in this process's memory, so the mode is only safe when one long-lived process
+# serves every request: a checkout answered by another worker or instance can't flush the items
+# its cart queued here, and a serverless instance frozen between requests holds them until it is
+# thrown away. Setting LEDGER_BUFFER=1 declares that deployment (a single `uvicorn` with no
+# --workers or --reload); where it plainly isn't one (serverless platforms, WEB_CONCURRENCY above
+# 1, a spawned worker process) the buffer refuses to turn on and every item is written directly.
+
+SERVERLESS = ("VERCEL", "AWS_LAMBDA_FUNCTION_NAME", "K_SERVICE", "FUNCTIONS_WORKER_RUNTIME")
+
+
+def shared_process():
+    '''
+    Why this process can't be trusted to serve every request on its own, or None if nothing says so.
+    '''
+    platform = next((name for name in SERVERLESS if os.environ.get(name)), None)
+    if platform:
+        return f"serverless platform ({platform} is set)"
+    if int(os.environ.get("WEB_CONCURRENCY") or 1) > 1:
+        return f"WEB_CONCURRENCY is {os.environ['WEB_CONCURRENCY']}"
+    if multiprocessing.parent_process() is not None:
+        return "running as a spawned worker process"
+    return None
+
+
+requested = os.environ.get("LEDGER_BUFFER", "").lower() in ("1", "true", "yes")
+refused = shared_process() if requested else None
+enabled = requested and refused is None
+
+if refused:
+    logs.event(log, "ledger buffer disabled", logs.WARNING, reason = refused)
+
+class LedgerBuffer:
+    '''
+    Queue of (cart_id, sku, quantity) line items and the thread that group-commits them.
+    '''
+
+    def __init__(self, interval: float, max_items: int):
+        self.interval = interval
+        self.max_items = max_items
+        self.flushes = 0
+        self.written = 0
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._queued = threading.Condition(self._lock)
+        # Held for a whole write, so a flush returns only after any write already under way
+        self._writing = threading.Lock()
+        self._items = []
+        self._thread = None
+
+    def add(self, cart_id: int, sku: str, quantity: int):
+        with self._queued:
+            self._items.append((cart_id, sku, quantity))
+            self._queued.notify()
+
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="ledger-buffer", daemon=True)
+                self._thread.start()
+
+    def flush(self, cart_id: int = None):
+        '''
+        Writes everything queued and returns once it has committed. Given a cart, returns at once
+        when that cart has nothing queued or being written.
+        '''
+        with self._writing:
+            with self._lock:
+                if cart_id is not None and all(item[0] != cart_id for item in self._items):
+                    return
+                items, self._items = self._items, []
+
+            if items:
+                try:
+                    self._write(items)
+                except Exception:
+                    logs.event(log, "buffered cart items lost", logs.WARNING, items = items)
+                    raise
+
+    def _run(self):
+        while True:
+            with self._queued:
+                self._queued.wait_for(lambda: self._items)
+                self._queued.wait_for(lambda: len(self._items) >= self.max_items, timeout=self.interval)
+
+            try:
+                self.flush()
+            except Exception:
+                log.exception("ledger buffer flush failed")
+
+    def _write(self, items: list):
+        with db.engine.begin() as connection:
+            available = dict(connection.execute(queries.lock_stock, {"skus": sorted({item[1] for item in items})}).all())
+
+            accepted, dropped = [], []
+            for cart_id, sku, quantity in items:
+                if sku in available and available[sku] >= quantity:
+                    available[sku] -= quantity
+                    accepted.append((cart_id, sku, quantity))
+                else:
+                    dropped.append((cart_id, sku, quantity))
+
+            if accepted:
+                cart_ids, skus, quantities = map(list, zip(*accepted))
+                connection.execute(queries.put_buffered_items, {"cart_ids": cart_ids, "skus": skus, "quantities": quantities})
+
+        cache.stock_changed()
+
+        if dropped:
+            logs.event(log, "buffered cart items dropped", logs.WARNING, items = dropped)
+
+        with self._lock:
+            self.flushes += 1
+            self.written += len(accepted)
+            self.dropped += len(dropped)
+
+    def stats(self):
+        with self._lock:
+            return {"enabled": enabled, "refused": refused, "queued": len(self._items), "flushes": self.flushes,
+                    "written": self.written, "dropped": self.dropped}
+
+
+items = LedgerBuffer(interval = float(os.environ.get("LEDGER_BUFFER_FLUSH_MS", 5)) / 1000,
+                     max_items = int(os.environ.get("LEDGER_BUFFER_ITEMS", 200)))
+
+# Queued items are written on a clean shutdown
+atexit.register(items.flush)
@@ -0,0 +1,82 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import dotenv
+
+dotenv.load_dotenv()
+
+# Structured logging for the app: one JSON object per line, written by a background thread so a
+# slow stdout never blocks a request. Below WARNING, records are sampled at LOG_SAMPLE_RATE.
+
+INFO = logging.INFO
+WARNING = logging.WARNING
+SAMPLE_RATE = float(os.environ.get("LOG_SAMPLE_RATE", 0.1))
+LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {"time": round(record.created, 3), "level": record.levelname, "logger": record.name,
+                 "event": record.getMessage()}
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SampleFilter(logging.Filter):
+    '''
+    Keeps every WARNING and above, and a random rate of everything below.
+    '''
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+
+def configure():
+    '''
+    Routes the src.* loggers through a sampling queue handler to a JSON stdout writer thread.
+    Safe to call more than once.
+    '''
+    global _listener
+    if _listener is not None:
+        return
+
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(JsonFormatter())
+
+    records = queue.SimpleQueue()
+    handler = logging.handlers.QueueHandler(records)
+    handler.addFilter(SampleFilter(SAMPLE_RATE))
+
+    root = logging.getLogger("src")
+    root.setLevel(LEVEL)
+    root.addHandler(handler)
+    root.propagate = False
+
+    _listener = logging.handlers.QueueListener(records, stream)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+def get_logger(name: str):
+    return logging.getLogger(name)
+
+
+def event(logger, message: str, level: int = INFO, **fields):
+    '''
+    Logs message with fields as structured JSON keys.
+    '''
+    if logger.isEnabledFor(level):
+        logger.log(level, message, extra = {"fields": fields})
@@ -0,0 +1,262 @@
+import bisect
+import collections
+import contextvars
+import os
+import threading
+import time
+import dotenv
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from src import logs
+
+dotenv.load_dotenv()
+
+# In-process request and database metrics, rendered in the Prometheus text format at /metrics.
+# Counts are per worker process; Prometheus sums them across scrapes of each worker.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34)
+SLOW_QUERY_SECONDS = float(os.environ.get("SLOW_QUERY_MS", 250)) / 1000
+SLOW_QUERY_SAMPLES = int(os.environ.get("SLOW_QUERY_SAMPLES", 50))
+
+log = logs.get_logger(__name__)
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._lock = threading.Lock()
+        self._values = collections.defaultdict(float)
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] += amount
+
+    def items(self):
+        with self._lock:
+            return list(self._values.items())
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for labels, value in self.items():
+            yield f"{self.name}{format_labels(self.labels, labels)} {value:g}"
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        # labels -> [per-bucket counts (+Inf last), sum]
+        self._series = {}
+
+    def observe(self, value: float, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            series = [(labels, list(counts), total) for labels, (counts, total) in self._series.items()]
+        for labels, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                yield f"{self.name}_bucket{format_labels(self.labels + ('le',), labels + (bound,))} {cumulative}"
+            yield f"{self.name}_sum{format_labels(self.labels, labels)} {total:g}"
+            yield f"{self.name}_count{format_labels(self.labels, labels)} {cumulative}"
+
+
+def format_labels(names: tuple, values: tuple):
+    if not names:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"') for value in values)
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, escaped)) + "}"
+
+
+request_seconds = Histogram("http_request_duration_seconds", "Request latency by route.", ("method", "route"))
+requests_total = Counter("http_requests_total", "Requests by route and status.", ("method", "route", "status"))
+request_queries = Histogram("db_queries_per_request", "SQL statements executed per request.", ("route",), COUNT_BUCKETS)
+request_sql_seconds = Histogram("db_request_sql_seconds", "Total SQL time per request.", ("route",))
+query_seconds = Histogram("db_query_duration_seconds", "SQL statement latency.")
+checkout_seconds = Histogram("db_pool_checkout_wait_seconds", "Time spent waiting for a pooled connection.", ("pool",))
+slow_queries = Counter("db_slow_queries_total", "Statements slower than SLOW_QUERY_MS.")
+query_executions = Counter("db_query_executions_total", "Registered statement runs by preparation stage.", ("query", "stage"))
+query_stage_seconds = Counter("db_query_seconds_total", "Registered statement time by preparation stage.", ("query", "stage"))
+
+REGISTRY = (request_seconds, requests_total, request_queries, request_sql_seconds,
+            query_seconds, checkout_seconds, slow_queries, query_executions, query_stage_seconds)
+
+# A registered statement's run on a connection is "unprepared" below the driver's prepare
+# threshold, "prepare" on the run that prepares it server-side and "prepared" afterwards, so
+# db_query_seconds_total shows what preparing costs and what it saves.
+STAGES = ("unprepared", "prepare", "prepared")
+
+# The most recent slow statements, newest last, for /admin/slow_queries
+slow_query_samples = collections.deque(maxlen = SLOW_QUERY_SAMPLES)
+
+
+class RequestStats:
+    __slots__ = ("queries", "sql_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_seconds = 0.0
+
+
+# Set per request by the middleware. The value is mutable so statements run from threadpool
+# handlers, which see a copy of the context, still add to the request's totals.
+current_request = contextvars.ContextVar("current_request", default = None)
+
+
+def render():
+    '''
+    Every metric in the Prometheus text exposition format.
+    '''
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
+
+
+def timed_checkout(pool_class, name: str):
+    '''
+    Subclasses a SQLAlchemy queue pool to record how long each checkout waits for a connection.
+    '''
+
+    class TimedPool(pool_class):
+        def _do_get(self):
+            started = time.perf_counter()
+            try:
+                return super()._do_get()
+            finally:
+                checkout_seconds.observe(time.perf_counter() - started, name)
+
+    TimedPool.__name__ = "Timed" + pool_class.__name__
+    return TimedPool
+
+
+TimedQueuePool = timed_checkout(QueuePool, "sync")
+TimedAsyncQueuePool = timed_checkout(AsyncAdaptedQueuePool, "async")
+TimedReplicaQueuePool = timed_checkout(QueuePool, "reads")
+TimedAsyncReplicaQueuePool = timed_checkout(AsyncAdaptedQueuePool, "async_reads")
+
+
+def query_stats(names):
+    '''
+    Runs and seconds per registered statement and stage, for this worker.
+    '''
+    stats = {name: {stage: {"runs": 0, "seconds": 0.0} for stage in STAGES} for name in names}
+    for (name, stage), runs in query_executions.items():
+        stats.setdefault(name, {stage: {"runs": 0, "seconds": 0.0} for stage in STAGES})[stage]["runs"] = int(runs)
+    for (name, stage), seconds in query_stage_seconds.items():
+        stats[name][stage]["seconds"] = round(seconds, 6)
+    return stats
+
+
+def prepare_stage(conn, name: str):
+    '''
+    Counts a run of a registered statement on this DBAPI connection and returns its stage. psycopg
+    prepares once a statement has run prepare_threshold times on a connection (never when it is
+    None); asyncpg, with no threshold, prepares on the first run. Connection info is cleared when
+    the DBAPI connection closes, as are its prepared statements.
+    '''
+    runs = conn.info.setdefault("query_runs", collections.Counter())
+    count = runs[name]
+    runs[name] += 1
+
+    threshold = getattr(conn.connection.dbapi_connection, "prepare_threshold", 0)
+    if threshold is None or count < threshold:
+        return "unprepared"
+    return "prepare" if count == threshold else "prepared"
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_started"].pop()
+    query_seconds.observe(elapsed)
+
+    name = context.execution_options.get("query_name") if context is not None else None
+    if name is not None:
+        stage = prepare_stage(conn, name)
+        query_executions.inc(name, stage)
+        query_stage_seconds.inc(name, stage, amount = elapsed)
+
+    stats = current_request.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.sql_seconds += elapsed
+
+    if elapsed >= SLOW_QUERY_SECONDS:
+        slow_queries.inc()
+        sample = {"seconds": round(elapsed, 4), "statement": " ".join(statement.split()), "at": time.time()}
+        slow_query_samples.append(sample)
+        logs.event(log, "slow query", level = logs.WARNING, **sample)
+
+
+def handle_error(exception_context):
+    started = exception_context.connection.info.get("query_started") if exception_context.connection is not None else None
+    if started:
+        started.pop()
+
+
+def instrument(engine):
+    '''
+    Hooks statement timing onto an engine (pass async engines' sync_engine).
+    '''
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", after_cursor_execute)
+    event.listen(engine, "handle_error", handle_error)
+
+
+class MetricsMiddleware:
+    '''
+    ASGI middleware timing each HTTP request and attributing its SQL statements to its route.
+    Routes are labelled by their path template, so path parameters don't multiply series.
+    '''
+
+    def __init__(self, app):
+        self.app = app
+        self._routes = None
+
+    def route_of(self, scope):
+        if self._routes is None:
+            self._routes = {route.endpoint: route.path for route in scope["app"].routes if hasattr(route, "endpoint")}
+        return self._routes.get(scope.get("endpoint"), "unmatched")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats()
+        token = current_request.set(stats)
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            current_request.reset(token)
+
+            route = self.route_of(scope)
+            request_seconds.observe(elapsed, scope["method"], route)
+            requests_total.inc(scope["method"], route, status[0])
+            request_queries.observe(stats.queries, route)
+            request_sql_seconds.observe(stats.sql_seconds, route)
@@ -0,0 +1,67 @@
+import os
+from sqlalchemy import text
+from src import database as db
+
+# Versioned schema migrations: migrations/NNNN_name.sql files applied in order, each in its own
+# transaction, with applied versions recorded in schema_migrations.
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "migrations")
+
+create_history =    text('''CREATE TABLE IF NOT EXISTS schema_migrations (
+                                version text PRIMARY KEY,
+                                applied_at timestamp with time zone NOT NULL DEFAULT now()
+                            )''')
+
+get_applied =   text('''SELECT version
+                        FROM schema_migrations''')
+
+record_applied =    text('''INSERT INTO schema_migrations (version)
+                            VALUES (:version)''')
+
+
+def available():
+    '''
+    Lists migration versions on disk, oldest first.
+    '''
+    return sorted(name[:-len(".sql")] for name in os.listdir(MIGRATIONS_DIR) if name.endswith(".sql"))
+
+
+def pending(connection):
+    connection.execute(create_history)
+    applied = set(connection.execute(get_applied).scalars())
+
+    return [version for version in available() if version not in applied]
+
+
+def migrate(engine = None):
+    '''
+    Applies every pending migration, returning the versions applied.
+    '''
+    engine = engine or db.engine
+
+    with engine.begin() as connection:
+        versions = pending(connection)
+
+    for version in versions:
+        with open(os.path.join(MIGRATIONS_DIR, version + ".sql")) as migration:
+            statements = migration.read()
+
+        with engine.begin() as connection:
+            connection.exec_driver_sql(statements, execution_options={"no_parameters": True})
+            connection.execute(record_applied, {"version": version})
+
+    return versions
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Apply or list schema migrations.")
+    parser.add_argument("--list", action="store_true", help="only list pending migrations")
+    args = parser.parse_args()
+
+    if args.list:
+        with db.engine.begin() as connection:
+            print("\n".join(pending(connection)) or "up to date")
+    else:
+        print("\n".join(f"applied {version}" for version in migrate()) or "up to date")
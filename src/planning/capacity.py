@@ -0,0 +1,76 @@
+import numpy as np
+
+# Rows of every series are [potions, ml]; columns are consecutive hours, oldest first. Any leading
+# axes are a batch of shops planned together.
+MINIMUM_HEADROOM = np.array([5, 500])
+CAPACITY_COST = 1000
+HOURS_PER_TICK = 2
+
+
+def levels_before(deltas, now):
+    '''
+    Rebuilds end-of-hour levels from hourly ledger deltas and the current totals.
+    '''
+    return now[..., None] - (deltas.sum(axis=-1)[..., None] - deltas.cumsum(axis=-1))
+
+
+def headroom(deltas, levels_now, capacity_deltas, capacity_now, lookahead_ticks: int):
+    '''
+    Smallest capacity headroom for potions and ml, over both the recorded hours and a linear
+    trend projected lookahead_ticks ticks forward from the current levels.
+    '''
+    levels_now = np.asarray(levels_now, dtype=float)
+    capacity_now = np.asarray(capacity_now, dtype=float)
+    deltas = np.asarray(deltas, dtype=float).reshape(*levels_now.shape, -1)
+    capacity_deltas = np.asarray(capacity_deltas, dtype=float).reshape(*capacity_now.shape, -1)
+
+    smallest = capacity_now - levels_now
+    hours = deltas.shape[-1]
+
+    if hours:
+        recorded = levels_before(capacity_deltas, capacity_now) - levels_before(deltas, levels_now)
+        smallest = np.minimum(smallest, recorded.min(axis=-1))
+
+    if hours > 1 and lookahead_ticks > 0:
+        levels = levels_before(deltas, levels_now)
+        slopes = np.polyfit(np.arange(hours), levels.reshape(-1, hours).T, 1)[0].reshape(levels_now.shape)
+        ahead = HOURS_PER_TICK * np.arange(1, lookahead_ticks + 1)
+        projected = capacity_now[..., None] - (levels_now[..., None] + slopes[..., None] * ahead)
+        smallest = np.minimum(smallest, projected.min(axis=-1))
+
+    return smallest
+
+
+def capacity_plans(gold, deltas, levels_now, capacity_deltas, capacity_now, lookahead_ticks: int):
+    '''
+    Buys one potion and/or ml capacity unit per shop when headroom has dropped, or is projected
+    to drop, below the minimum, keeping a 1000 gold reserve after each purchase. gold is (n,),
+    levels and capacities (n, 2), and the hourly series (n, 2, hours).
+    '''
+    gold = np.asarray(gold)
+    pressured = headroom(deltas, levels_now, capacity_deltas, capacity_now, lookahead_ticks) < MINIMUM_HEADROOM
+
+    # Potion capacity is bought first, so the ml unit needs the reserve on top of its price
+    potion = pressured[:, 0] & (gold >= 2 * CAPACITY_COST)
+    ml = pressured[:, 1] & (gold - potion * CAPACITY_COST >= 2 * CAPACITY_COST)
+
+    return [{"potion_capacity": int(potion_unit), "ml_capacity": int(ml_unit)} for potion_unit, ml_unit in zip(potion, ml)]
+
+
+def capacity_plan(gold: int, deltas, levels_now, capacity_deltas, capacity_now, lookahead_ticks: int):
+    '''
+    capacity_plans for one shop.
+    '''
+    return capacity_plans([gold], [deltas], [levels_now], [capacity_deltas], [capacity_now], lookahead_ticks)[0]
+
+
+def pressure_plan(series, lookahead_ticks: int):
+    '''
+    capacity_plan from the get_pressure rows: hourly [potions, ml, potion capacity, ml capacity]
+    deltas, oldest first, with the current gold, levels and capacities on every row.
+    '''
+    hourly = np.array([row[:4] for row in series], dtype=float).T
+    now = series[-1]
+
+    return capacity_plan(now.gold, hourly[:2], [now.num_potions, now.ml], hourly[2:],
+                         [now.potion_capacity_now, now.volume_capacity_now], lookahead_ticks)
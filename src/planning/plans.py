@@ -0,0 +1,249 @@
+import copy
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+import dotenv
+import numpy as np
+from src.planning import solver
+from src.planning.state import COLORS, ShopStates, Strategy
+
+dotenv.load_dotenv()
+
+# PLANNER_SOLVER=cbc routes plans through PuLP's CBC subprocess instead of the in-process solver
+SOLVERS = {"exact": solver.maximize, "cbc": solver.maximize_with_cbc}
+
+
+class PlanMemo:
+    '''
+    LRU of finished plans keyed on a canonical hash of everything the plan depends on, so a
+    repeated tick with unchanged catalog, inventory, gold, capacity and strategy skips the solve.
+    '''
+
+    def __init__(self, size: int):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._plans = OrderedDict()
+
+    @staticmethod
+    def key(*parts):
+        canonical = json.dumps(parts, sort_keys=True, separators=(',', ':'), default=str)
+        return hashlib.sha256(canonical.encode()).hexdigest()
+
+    def get(self, key: str, compute):
+        with self._lock:
+            if key in self._plans:
+                self.hits += 1
+                self._plans.move_to_end(key)
+                return copy.deepcopy(self._plans[key])
+            self.misses += 1
+
+        plan = compute()
+
+        with self._lock:
+            self._plans[key] = plan
+            self._plans.move_to_end(key)
+            while len(self._plans) > self.size:
+                self._plans.popitem(last = False)
+
+        return copy.deepcopy(plan)
+
+    def put(self, key: str, plan):
+        '''
+        Stores a plan computed elsewhere (e.g. as part of a joint tick plan) under key.
+        '''
+        with self._lock:
+            self._plans[key] = copy.deepcopy(plan)
+            self._plans.move_to_end(key)
+            while len(self._plans) > self.size:
+                self._plans.popitem(last = False)
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._plans), "capacity": self.size}
+
+
+memo = PlanMemo(size = int(os.environ.get("PLANNER_CACHE_SIZE", 256)))
+
+
+def solve(objective, rows, limits, upper):
+    return SOLVERS[os.environ.get("PLANNER_SOLVER", "exact")](objective, rows, limits, upper)
+
+
+def barrel_rows(catalog: list[dict], states: ShopStates, target: list[int], tolerance: float):
+    '''
+    Constraint rows over barrel quantities: volume capacity, gold, and each barrel type's volume
+    within tolerance of what the target potion's colors still need. The rows are the same for
+    every state; the limits come back as one row per state.
+    '''
+    volumes, vol_capacity = states.volumes, states.volume_capacity[:, None]
+
+    # Colors over their target share can't be used for the target potion, so shrink the budget
+    current_ratios = volumes / vol_capacity
+    target_ratios = np.asarray(target) / 100
+    usable_capacity = states.volume_capacity - np.where(current_ratios > target_ratios,
+                                                        (current_ratios - target_ratios) * vol_capacity, 0).sum(axis = 1)
+
+    volumes_required = np.trunc(target_ratios * usable_capacity[:, None])
+    volumes_to_purchase = np.maximum(volumes_required - volumes, 0)
+
+    ml = [barrel['ml_per_barrel'] for barrel in catalog]
+    rows = [ml, [barrel['price'] for barrel in catalog]]
+    limits = [states.available_volume, states.gold]
+
+    # Each barrel type's volume must land within tolerance of what its colors still need
+    for potion_type in dict.fromkeys(tuple(barrel['potion_type']) for barrel in catalog):
+        need = volumes_to_purchase @ np.asarray(potion_type)
+        of_type = [volume if tuple(barrel['potion_type']) == potion_type else 0 for volume, barrel in zip(ml, catalog)]
+        rows += [[-volume for volume in of_type], of_type]
+        limits += [-(1 - tolerance) * need, (1 + tolerance) * need]
+
+    return rows, np.column_stack(limits)
+
+
+def sorted_catalog(catalog: list[dict]):
+    return sorted(catalog, key = lambda barrel: ([-x for x in barrel['potion_type']], barrel['ml_per_barrel']))
+
+
+def barrel_plan(catalog: list[dict], gold: int, volumes: list[int], vol_capacity: int,
+                target: list[int], tolerance: float):
+    '''
+    Picks barrels that move barrel volumes towards the target potion's color ratios (within
+    tolerance), maximizing volume bought under the gold and volume capacity limits. Catalog
+    entries are barrel dicts; the chosen ones are returned with their purchase quantity.
+    '''
+    catalog = sorted_catalog(catalog)
+    key = memo.key("barrels", catalog, gold, volumes, vol_capacity, target, tolerance)
+
+    def compute():
+        rows, limits = barrel_rows(catalog, ShopStates(gold, volumes, 0, 0, vol_capacity), target, tolerance)
+        ml = [barrel['ml_per_barrel'] for barrel in catalog]
+
+        quantities = solve(ml, rows, limits[0].tolist(), [barrel['quantity'] for barrel in catalog]) or []
+
+        return [barrel | {"quantity": quantity} for barrel, quantity in zip(catalog, quantities) if quantity]
+
+    return memo.get(key, compute)
+
+
+def bottle_plan(potions: list[dict], volumes: list[int], available_space: int):
+    '''
+    Chooses how many of each potion ({'type', 'price'}) to bottle, maximizing sale value within
+    the barrel volumes on hand and the potion space available.
+    '''
+    key = memo.key("bottles", potions, volumes, available_space)
+
+    def compute():
+        # Transposing so each row is a single color requirement for each potion [potion_1_red, potion_2_red, ...], etc
+        rows = [list(color) for color in zip(*[potion['type'] for potion in potions])]
+        limits = list(volumes[:len(rows)])
+
+        # Added inventory space constraint to not exceed space available
+        rows.append([1] * len(potions))
+        limits.append(available_space)
+
+        quantities = solve([potion['price'] for potion in potions], rows, limits, [float('inf')] * len(potions)) or []
+
+        return [{'potion_type': list(potion['type']), 'quantity': quantity}
+                for potion, quantity in zip(potions, quantities) if quantity]
+
+    return memo.get(key, compute)
+
+
+def delivered_volumes(volumes: list[int], barrels: list[dict]):
+    '''
+    Barrel volumes once the given barrels (with quantities) are delivered.
+    '''
+    return [volume + sum(barrel['ml_per_barrel'] * barrel['quantity'] * barrel['potion_type'][color] for barrel in barrels)
+            for color, volume in enumerate(volumes)]
+
+
+def tick_plans(catalog: list[dict], states: ShopStates, strategy: Strategy):
+    '''
+    Plans each state's barrel purchase and the bottling that follows its delivery as one program.
+    Bottling value comes first and barrel volume breaks ties, so barrels are chosen for what they
+    let the shop bottle now as well as for the target ratios. Returns one {'barrels', 'bottles'}
+    per state, and stores the bottles under bottle_plan's key for the post-delivery state, so
+    /bottler/plan is served from this solve when the delivery matches the plan.
+    '''
+    catalog = sorted_catalog(catalog)
+    potions, target, tolerance = strategy.potions, strategy.target.tolist(), strategy.tolerance
+
+    barrel_constraints, barrel_limits = barrel_rows(catalog, states, target, tolerance)
+    ml = [barrel['ml_per_barrel'] for barrel in catalog]
+
+    # Variables are [barrel quantities..., potion quantities...]
+    rows = [row + [0] * len(potions) for row in barrel_constraints]
+
+    # Each color bottled can use what's on hand plus what the barrels deliver
+    for color in range(len(COLORS)):
+        rows.append([-barrel['ml_per_barrel'] * barrel['potion_type'][color] for barrel in catalog]
+                    + [potion['type'][color] for potion in potions])
+
+    rows.append([0] * len(catalog) + [1] * len(potions))
+    limits = np.column_stack([barrel_limits, states.volumes, states.available_space])
+
+    # Weighting bottling value above any achievable volume makes the objective lexicographic
+    weights = np.maximum(states.available_volume, 0) + 1
+    objectives = weights[:, None] * strategy.prices
+    upper = [barrel['quantity'] for barrel in catalog] + [float('inf')] * len(potions)
+
+    def plan(index: int):
+        gold, vol_capacity, available_space = (states.gold[index].item(), states.volume_capacity[index].item(),
+                                               states.available_space[index].item())
+        volumes = states.volumes[index].tolist()
+        key = memo.key("tick", catalog, gold, volumes, vol_capacity, target, tolerance, potions, available_space)
+
+        def compute():
+            quantities = solve(ml + objectives[index].tolist(), rows, limits[index].tolist(), upper)
+            if quantities is None:
+                # No barrel purchase satisfies the ratio constraints; bottle from what's on hand
+                return {"barrels": [], "bottles": bottle_plan(potions, volumes, available_space)}
+
+            barrels = [barrel | {"quantity": quantity} for barrel, quantity in zip(catalog, quantities) if quantity]
+            bottles = [{'potion_type': list(potion['type']), 'quantity': quantity}
+                       for potion, quantity in zip(potions, quantities[len(catalog):]) if quantity]
+
+            return {"barrels": barrels, "bottles": bottles}
+
+        tick = memo.get(key, compute)
+        memo.put(memo.key("bottles", potions, delivered_volumes(volumes, tick["barrels"]), available_space), tick["bottles"])
+
+        return tick
+
+    # Identical states in one batch hash to the same key, so each distinct state is solved once
+    return [plan(index) for index in range(len(states))]
+
+
+def tick_plan(catalog: list[dict], gold: int, volumes: list[int], vol_capacity: int, target: list[int],
+              tolerance: float, potions: list[dict], available_space: int):
+    '''
+    tick_plans for a single state given as plain values.
+    '''
+    states = ShopStates(gold, volumes, 0, available_space, vol_capacity)
+    return tick_plans(catalog, states, Strategy.from_potions(potions, tolerance, target))[0]
+
+
+def purchase_plans(wholesale_catalog: list[dict], states: ShopStates, strategy: Strategy):
+    '''
+    Each state's barrel purchase this tick under the strategy. Nothing is bought without potions
+    to bottle. Reads nothing but its arguments, so the simulator and what-if batches plan the
+    same way the endpoint does.
+    '''
+    if not len(strategy.types):
+        return [[] for _ in range(len(states))]
+
+    return [tick['barrels'] for tick in tick_plans(wholesale_catalog, states, strategy)]
+
+
+def bottling_plans(states: ShopStates, strategy: Strategy):
+    '''
+    The bottles each state makes under the strategy.
+    '''
+    potions = strategy.potions
+
+    return [bottle_plan(potions, volumes, available_space)
+            for volumes, available_space in zip(states.volumes.tolist(), states.available_space.tolist())]
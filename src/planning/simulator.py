@@ -0,0 +1,266 @@
+import collections
+import os
+import random
+import statistics
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import dotenv
+from src.planning import capacity
+from src.planning import plans
+from src.planning import state
+
+dotenv.load_dotenv()
+
+# Offline backtests of strategy weeks. A simulated shop keeps the inventory_snapshot balances and
+# per-potion stock in memory, replays recorded ticks (customer carts, wholesale catalogs, which
+# plans ran) against them, and decides barrels, bottling and capacity with the same planner
+# functions the endpoints call. Each run is independent, so runs fan out over a process pool.
+#
+# Recorded days are resampled per simulated day: every tick keeps its schedule and wholesale
+# catalog, but its carts are drawn with replacement from the recorded ones (scaled by traffic),
+# so thousands of days can be played from a few recordings. Every potion in stock is listed.
+
+STARTING_BALANCES = {"gold": 100, "num_potions": 0, "red": 0, "green": 0, "blue": 0, "dark": 0,
+                     "potion_capacity": 50, "volume_capacity": 10000}
+POTIONS_PER_CAPACITY = 50
+ML_PER_CAPACITY = 10000
+HOURS_PER_DAY = 24
+LOOKAHEAD_TICKS = int(os.environ.get("CAPACITY_LOOKAHEAD_TICKS", 6))
+
+COUNTERS = ("potions_sold", "revenue", "stockouts", "lost_potions", "lost_revenue", "empty_catalog",
+            "barrel_gold", "capacity_gold", "bottled")
+
+
+class Shop:
+    '''
+    One simulated shop: snapshot balances, stock and price per potion type, the last day of
+    hourly [potions, ml, potion capacity, ml capacity] deltas for the capacity planner, and
+    outcome counters.
+    '''
+
+    def __init__(self, gold: int = STARTING_BALANCES["gold"]):
+        self.balances = STARTING_BALANCES | {"gold": gold}
+        self.stock = collections.Counter()
+        self.prices = {}
+        self.hours = collections.deque(maxlen = HOURS_PER_DAY)
+        self.counters = dict.fromkeys(COUNTERS, 0)
+
+    def states(self):
+        return state.ShopStates.from_inventories([self.balances])
+
+    def advance(self, hours: int):
+        for _ in range(hours):
+            self.hours.append(np.zeros(4))
+
+    def record(self, potions = 0, ml = 0, potion_capacity = 0, volume_capacity = 0):
+        self.hours[-1] += (potions, ml, potion_capacity, volume_capacity)
+
+    def catalog(self):
+        return [{"type": list(potion_type), "price": self.prices[potion_type]}
+                for potion_type, quantity in sorted(self.stock.items()) if quantity > 0]
+
+    def sell(self, potion: dict, quantity: int):
+        '''
+        A cart item: sold whole if in stock, otherwise rejected as the reservation would be.
+        '''
+        potion_type = tuple(potion["type"])
+        if quantity > self.stock[potion_type]:
+            self.counters["stockouts"] += 1
+            self.counters["lost_potions"] += quantity
+            self.counters["lost_revenue"] += quantity * potion["price"]
+            return
+
+        self.stock[potion_type] -= quantity
+        self.balances["num_potions"] -= quantity
+        self.balances["gold"] += quantity * potion["price"]
+        self.counters["potions_sold"] += quantity
+        self.counters["revenue"] += quantity * potion["price"]
+        self.record(potions = -quantity)
+
+    def deliver_barrels(self, barrels: list[dict]):
+        volumes = plans.delivered_volumes([self.balances[color] for color in state.COLORS], barrels)
+        added = sum(volumes) - sum(self.balances[color] for color in state.COLORS)
+        cost = sum(barrel["price"] * barrel["quantity"] for barrel in barrels)
+
+        self.balances.update(zip(state.COLORS, volumes))
+        self.balances["gold"] -= cost
+        self.counters["barrel_gold"] += cost
+        self.record(ml = added)
+
+    def deliver_bottles(self, bottles: list[dict], today):
+        prices = {tuple(potion["type"]): potion["price"] for potion in today["potions"]} if today else {}
+
+        for bottle in bottles:
+            potion_type, quantity = tuple(bottle["potion_type"]), bottle["quantity"]
+            self.stock[potion_type] += quantity
+            self.prices[potion_type] = prices.get(potion_type, self.prices.get(potion_type, 0))
+            self.balances["num_potions"] += quantity
+            for color, share in zip(state.COLORS, potion_type):
+                self.balances[color] -= share * quantity
+            self.counters["bottled"] += quantity
+            self.record(potions = quantity, ml = -sum(potion_type) * quantity)
+
+    def capacity_plan(self):
+        hourly = np.array(self.hours).T
+        ml = sum(self.balances[color] for color in state.COLORS)
+
+        return capacity.capacity_plan(self.balances["gold"], hourly[:2], [self.balances["num_potions"], ml], hourly[2:],
+                                      [self.balances["potion_capacity"], self.balances["volume_capacity"]], LOOKAHEAD_TICKS)
+
+    def deliver_capacity(self, plan: dict):
+        cost = (plan["potion_capacity"] + plan["ml_capacity"]) * capacity.CAPACITY_COST
+        potion, volume = plan["potion_capacity"] * POTIONS_PER_CAPACITY, plan["ml_capacity"] * ML_PER_CAPACITY
+
+        self.balances["potion_capacity"] += potion
+        self.balances["volume_capacity"] += volume
+        self.balances["gold"] -= cost
+        self.counters["capacity_gold"] += cost
+        self.record(potion_capacity = potion, volume_capacity = volume)
+
+
+def play_tick(shop: Shop, tick: dict, carts: list[dict], wholesale: list[dict], today):
+    '''
+    One tick in the order benchmarks/game_day.py replays it: carts against the current catalog,
+    then the barrel, bottler and capacity plans the recorded tick ran, each delivered at once.
+    '''
+    shop.advance(capacity.HOURS_PER_TICK)
+    listed = shop.catalog()
+    strategy = state.Strategy.from_today(today)
+
+    for cart in carts:
+        for item in cart["items"]:
+            if listed:
+                shop.sell(listed[item["pick"] % len(listed)], item["quantity"])
+            else:
+                shop.counters["empty_catalog"] += 1
+
+    if tick["barrels"]:
+        [barrels] = plans.purchase_plans(wholesale, shop.states(), strategy)
+        shop.deliver_barrels(barrels)
+
+    if tick["bottler"]:
+        [bottles] = plans.bottling_plans(shop.states(), strategy)
+        shop.deliver_bottles(bottles, today)
+
+    if tick["inventory"]:
+        shop.deliver_capacity(shop.capacity_plan())
+
+
+def simulate(week: list[dict], recorded: list[dict], days: int, seed: int, traffic: float = 1.0,
+             gold: int = STARTING_BALANCES["gold"]):
+    '''
+    Plays days simulated days from a reset with gold on hand, cycling through the week's
+    strategies. Returns the final balances and the outcome counters.
+    '''
+    rng = random.Random(seed)
+    shop = Shop(gold)
+
+    for day in range(days):
+        today = week[day % len(week)] if week else None
+        source = rng.choice(recorded)
+        for tick in source["ticks"]:
+            carts = rng.choices(tick["carts"], k = round(len(tick["carts"]) * traffic)) if tick["carts"] else []
+            play_tick(shop, tick, carts, source["wholesale_catalog"], today)
+
+    return {"balances": shop.balances, "counters": shop.counters}
+
+
+# Set in each worker by the pool initializer, so jobs don't pickle the strategies and recordings
+_strategies = {}
+_recorded = []
+
+
+def _load(strategies: dict, recorded: list[dict]):
+    global _strategies, _recorded
+    _strategies, _recorded = strategies, recorded
+
+
+def _run(job):
+    name, days, seed, traffic, gold = job
+    return name, simulate(_strategies[name], _recorded, days, seed, traffic, gold)
+
+
+def backtest(strategies: dict, recorded: list[dict], days: int, runs: int, traffic: float = 1.0,
+             workers: int = None, seed: int = 0, gold: int = STARTING_BALANCES["gold"]):
+    '''
+    Runs every named strategy week runs times (same seeds for every strategy, so they face the
+    same customers) over a process pool. Returns {name: [result, ...]}.
+    '''
+    jobs = [(name, days, seed + run, traffic, gold) for name in strategies for run in range(runs)]
+    results = {name: [] for name in strategies}
+
+    with ProcessPoolExecutor(max_workers = workers, initializer = _load, initargs = (strategies, recorded)) as pool:
+        for name, result in pool.map(_run, jobs, chunksize = max(1, len(jobs) // (4 * (workers or os.cpu_count() or 1)))):
+            results[name].append(result)
+
+    return results
+
+
+def summarize(results: dict, days: int, gold: int = STARTING_BALANCES["gold"]):
+    '''
+    Per strategy: final gold (mean and p5/p50/p95 over runs), gold per day, and sales and
+    stockout counters averaged per run. stockout_rate is the share of requested potions refused.
+    '''
+    summary = {}
+    for name, runs in results.items():
+        final = [run["balances"]["gold"] for run in runs]
+        cuts = statistics.quantiles(final, n = 20, method = "inclusive") if len(final) > 1 else [final[0]] * 19
+        totals = {counter: sum(run["counters"][counter] for run in runs) / len(runs) for counter in COUNTERS}
+        requested = totals["potions_sold"] + totals["lost_potions"]
+
+        summary[name] = {"runs": len(runs), "gold": statistics.fmean(final), "gold_p5": cuts[0], "gold_p50": cuts[9],
+                         "gold_p95": cuts[18], "gold_per_day": (statistics.fmean(final) - gold) / days,
+                         "stockout_rate": totals["lost_potions"] / requested if requested else 0.0} | totals
+
+    return summary
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Backtest strategy weeks against recorded game days.")
+    parser.add_argument("--day", action="append", help="recorded day (JSON like benchmarks/data/game_day.json); repeatable")
+    parser.add_argument("--strategies", nargs="*", default=[],
+                        help="strategy week JSON files (lists of days shaped like strategy.read_week); default: the database's")
+    parser.add_argument("--tolerance", type=float, nargs="*", default=[], help="also run each week with every day at these tolerances")
+    parser.add_argument("--days", type=int, default=7, help="simulated days per run")
+    parser.add_argument("--runs", type=int, default=100, help="runs per strategy")
+    parser.add_argument("--traffic", type=float, default=1.0, help="carts per tick relative to the recording")
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: one per CPU)")
+    parser.add_argument("--gold", type=int, default=STARTING_BALANCES["gold"], help="gold on hand after the reset")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print the summary as JSON")
+    args = parser.parse_args()
+
+    recordings = args.day or [os.path.join(os.path.dirname(__file__), "..", "..", "benchmarks", "data", "game_day.json")]
+    recorded = []
+    for path in recordings:
+        with open(path) as day:
+            recorded.append(json.load(day))
+
+    strategies = {}
+    for path in args.strategies:
+        with open(path) as week:
+            strategies[os.path.splitext(os.path.basename(path))[0]] = json.load(week)
+
+    if not strategies:
+        from src import database as db
+        from src import strategy
+        with db.engine.begin() as connection:
+            strategies["database"] = strategy.read_week(connection)
+
+    for name, week in list(strategies.items()):
+        for tolerance in args.tolerance:
+            strategies[f"{name}@{tolerance:g}"] = [day | {"tolerance": tolerance} for day in week]
+
+    summary = summarize(backtest(strategies, recorded, args.days, args.runs, args.traffic, args.workers, args.seed, args.gold),
+                        args.days, args.gold)
+
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print(f"{'strategy':>20} {'gold':>9} {'p5':>9} {'p95':>9} {'gold/day':>9} {'sold':>8} {'stockout':>9} {'lost gold':>10}")
+        for name, row in sorted(summary.items(), key = lambda item: -item[1]["gold"]):
+            print(f"{name:>20} {row['gold']:>9.0f} {row['gold_p5']:>9.0f} {row['gold_p95']:>9.0f} {row['gold_per_day']:>9.1f} "
+                  f"{row['potions_sold']:>8.1f} {row['stockout_rate']:>9.1%} {row['lost_revenue']:>10.1f}")
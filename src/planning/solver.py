@@ -0,0 +1,209 @@
+import math
+import numpy as np
+
+# Exact in-process solver for the small bounded integer programs the planners pose:
+#
+#     maximize  objective . x   subject to   rows . x <= limits,   0 <= x <= upper,   x integer
+#
+# LP relaxations are solved with a dense two-phase simplex (Bland's rule) and integrality is
+# restored by depth-first branch and bound, so no solver process or LP files are involved.
+
+EPSILON = 1e-9
+INTEGRALITY = 1e-6
+
+
+def pivot(tableau, row: int, column: int):
+    tableau[row] /= tableau[row, column]
+    factors = tableau[:, column].copy()
+    factors[row] = 0
+    tableau -= np.outer(factors, tableau[row])
+
+
+def optimize(tableau, basis: list[int], cost, allowed):
+    '''
+    Runs simplex pivots until no allowed column improves cost. Returns False when unbounded.
+    '''
+    allowed = np.asarray(allowed)
+    while True:
+        reduced = cost[allowed] - cost[basis] @ tableau[:, allowed]
+        improving = np.flatnonzero(reduced > EPSILON)
+        if not len(improving):
+            return True
+        entering = int(allowed[improving[0]])
+
+        column = tableau[:, entering]
+        eligible = np.flatnonzero(column > EPSILON)
+        if not len(eligible):
+            return False
+
+        # Minimum ratio, ties broken by the lowest basic variable index (Bland)
+        ratios = tableau[eligible, -1] / column[eligible]
+        tied = eligible[ratios <= ratios.min() + EPSILON]
+        leaving = int(min(tied, key = lambda row: basis[row]))
+
+        pivot(tableau, leaving, entering)
+        basis[leaving] = entering
+
+
+def linear_maximize(objective, rows, limits):
+    '''
+    Solves max objective . x s.t. rows . x <= limits, x >= 0. Returns (value, x), or None when
+    infeasible.
+    '''
+    constraints, variables = rows.shape
+    negative = limits < 0
+    artificials = int(negative.sum())
+
+    tableau = np.zeros((constraints, variables + constraints + artificials + 1))
+    tableau[:, :variables] = rows
+    tableau[:, variables:variables + constraints] = np.eye(constraints)
+    tableau[:, -1] = limits
+    tableau[negative] *= -1
+
+    basis = list(range(variables, variables + constraints))
+    for artificial, row in enumerate(np.flatnonzero(negative)):
+        tableau[row, variables + constraints + artificial] = 1
+        basis[row] = variables + constraints + artificial
+
+    columns = tableau.shape[1] - 1
+    structural = range(variables + constraints)
+
+    if artificials:
+        feasibility = np.zeros(columns)
+        feasibility[variables + constraints:] = -1
+        optimize(tableau, basis, feasibility, range(columns))
+        if feasibility[basis] @ tableau[:, -1] < -INTEGRALITY:
+            return None
+
+        # Drive any zero-valued artificials out of the basis, dropping rows that are redundant
+        keep = []
+        for row, column in enumerate(basis):
+            if column >= variables + constraints:
+                replacement = next((candidate for candidate in structural if abs(tableau[row, candidate]) > EPSILON), None)
+                if replacement is None:
+                    continue
+                pivot(tableau, row, replacement)
+                basis[row] = replacement
+            keep.append(row)
+        tableau = tableau[keep]
+        basis = [basis[row] for row in keep]
+
+    cost = np.zeros(columns)
+    cost[:variables] = objective
+    if not optimize(tableau, basis, cost, structural):
+        raise ValueError("Linear relaxation is unbounded")
+
+    solution = np.zeros(columns)
+    solution[basis] = tableau[:, -1]
+    return float(objective @ solution[:variables]), solution[:variables]
+
+
+def relax(objective, rows, limits, lower, upper):
+    '''
+    LP relaxation with per-variable bounds, solved by shifting x = lower + y.
+    '''
+    if np.any(upper < lower):
+        return None
+
+    bounded = np.flatnonzero(np.isfinite(upper))
+    shifted_rows = np.vstack([rows, np.eye(len(objective))[bounded]])
+    shifted_limits = np.concatenate([limits - rows @ lower, (upper - lower)[bounded]])
+
+    relaxation = linear_maximize(objective, shifted_rows, shifted_limits)
+    if relaxation is None:
+        return None
+
+    value, shift = relaxation
+    return value + float(objective @ lower), lower + shift
+
+
+def maximize(objective: list[float], rows: list[list[float]], limits: list[float], upper: list[float]):
+    '''
+    Exactly solves the bounded integer program by branch and bound. Returns the optimal integer
+    quantities, or None when no integer point is feasible.
+    '''
+    objective = np.asarray(objective, dtype=float)
+    rows = np.asarray(rows, dtype=float).reshape(len(limits), len(objective))
+    limits = np.asarray(limits, dtype=float)
+    upper = np.asarray(upper, dtype=float).copy()
+
+    # Presolve: rows with no negative coefficients cap each variable on their own, which fixes
+    # variables with nothing left to buy at zero so branch and bound never sees them
+    for row, limit in zip(rows, limits):
+        if np.all(row >= 0):
+            if limit < -INTEGRALITY:
+                return None
+            positive = row > 0
+            upper[positive] = np.minimum(upper[positive], np.floor(limit / row[positive] + INTEGRALITY))
+    if np.any(upper < 0):
+        return None
+
+    active = np.flatnonzero(upper > 0)
+    if not len(active):
+        return [0] * len(objective) if np.all(limits >= -INTEGRALITY) else None
+
+    if len(active) < len(objective):
+        reduced = maximize(objective[active], rows[:, active], limits, upper[active])
+        if reduced is None:
+            return None
+        quantities = [0] * len(objective)
+        for index, quantity in zip(active, reduced):
+            quantities[index] = quantity
+        return quantities
+
+    # Integer objectives only take multiples of their gcd, which tightens every relaxation bound
+    integral_objective = bool(np.all(np.isclose(objective, np.round(objective))))
+    step = math.gcd(*(int(coefficient) for coefficient in np.round(objective))) if integral_objective else 0
+    best_value, best = -math.inf, None
+
+    stack = [(np.zeros(len(objective)), upper)]
+    while stack:
+        lower, bound = stack.pop()
+        relaxation = relax(objective, rows, limits, lower, bound)
+        if relaxation is None:
+            continue
+
+        value, x = relaxation
+        ceiling = math.floor(value / step + INTEGRALITY) * step if step else value
+        if best is not None and ceiling <= best_value + EPSILON:
+            continue
+
+        fractions = np.abs(x - np.round(x))
+        branch = int(np.argmax(fractions)) if len(x) else 0
+        if not len(x) or fractions[branch] <= INTEGRALITY:
+            candidate = np.round(x)
+            if np.all(rows @ candidate <= limits + INTEGRALITY):
+                best_value, best = float(objective @ candidate), candidate
+            continue
+
+        down = bound.copy()
+        down[branch] = math.floor(x[branch])
+        up = lower.copy()
+        up[branch] = math.ceil(x[branch])
+
+        # Explore rounding up first; it usually finds a strong incumbent quickly
+        stack.append((lower, down))
+        stack.append((up, bound))
+
+    return None if best is None else [int(quantity) for quantity in best]
+
+
+def maximize_with_cbc(objective: list[float], rows: list[list[float]], limits: list[float], upper: list[float]):
+    '''
+    The same program solved through PuLP's CBC subprocess, kept for comparison and as a fallback.
+    '''
+    from pulp import LpProblem, LpVariable, lpSum, LpMaximize, LpStatusOptimal, PULP_CBC_CMD
+
+    model = LpProblem('Plan', LpMaximize)
+    variables = [LpVariable(f'q{i}', lowBound = 0, upBound = None if math.isinf(bound) else bound, cat = 'Integer')
+                 for i, bound in enumerate(upper)]
+
+    model += lpSum(coefficient * variable for coefficient, variable in zip(objective, variables))
+    for row, limit in zip(rows, limits):
+        model += lpSum(coefficient * variable for coefficient, variable in zip(row, variables)) <= limit
+
+    model.solve(PULP_CBC_CMD(msg = False))
+
+    if model.status != LpStatusOptimal:
+        return None
+    return [int(round(variable.varValue or 0)) for variable in variables]
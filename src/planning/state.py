@@ -0,0 +1,93 @@
+import numpy as np
+
+COLORS = ('red', 'green', 'blue', 'dark')
+
+# Planner inputs as arrays. ShopStates holds any number of shops' balances, one row per shop, so
+# a batch of what-if states is planned in one call and the constraint limits of every state come
+# out of one numpy pass; the live shop is a batch of one. Strategy is today's potion list as a
+# (potions, 4) type matrix and a price vector, most valuable first. Neither touches the database.
+
+BALANCES = ('gold', 'volumes', 'num_potions', 'potion_capacity', 'volume_capacity')
+
+
+class ShopStates:
+    '''
+    Balances of n shops: gold, num_potions, potion_capacity and volume_capacity of shape (n,), and
+    barrel volumes of shape (n, 4) in COLORS order. Scalars and a single volume row are shared by
+    every state.
+    '''
+    __slots__ = BALANCES
+
+    def __init__(self, gold, volumes, num_potions, potion_capacity, volume_capacity):
+        volumes = np.asarray(volumes, dtype = np.int64).reshape(-1, len(COLORS))
+        # Raises ValueError when two balances disagree on the number of states
+        columns = np.broadcast_arrays(volumes[:, :1], *(np.asarray(balance, dtype = np.int64).reshape(-1, 1)
+                                                        for balance in (gold, num_potions, potion_capacity, volume_capacity)))
+
+        self.volumes = np.broadcast_to(volumes, (len(columns[0]), len(COLORS))).copy()
+        self.gold, self.num_potions, self.potion_capacity, self.volume_capacity = (column[:, 0].copy() for column in columns[1:])
+
+    @classmethod
+    def from_inventories(cls, inventories):
+        '''
+        Stacks snapshot balances (mappings shaped like snapshot.current's) into one batch.
+        '''
+        inventories = list(inventories)
+        return cls([inventory['gold'] for inventory in inventories],
+                   [[inventory[color] for color in COLORS] for inventory in inventories],
+                   [inventory['num_potions'] for inventory in inventories],
+                   [inventory['potion_capacity'] for inventory in inventories],
+                   [inventory['volume_capacity'] for inventory in inventories])
+
+    def __len__(self):
+        return len(self.gold)
+
+    def __getitem__(self, index):
+        '''
+        A sub-batch: an int, slice, mask or index list over states. An int gives a batch of one.
+        '''
+        if isinstance(index, int):
+            index = [index]
+        return ShopStates(*(getattr(self, balance)[index] for balance in BALANCES))
+
+    @property
+    def available_space(self):
+        return self.potion_capacity - self.num_potions
+
+    @property
+    def available_volume(self):
+        return self.volume_capacity - self.volumes.sum(axis = 1)
+
+
+class Strategy:
+    '''
+    Potions to bottle as types (k, 4) and prices (k,), the potion barrels are bought towards
+    (the first one unless given), and how far barrel volumes may stray from its ratios.
+    '''
+    __slots__ = ('types', 'prices', 'target', 'tolerance')
+
+    def __init__(self, types, prices, tolerance: float, target = None):
+        self.types = np.asarray(types, dtype = np.int64).reshape(-1, len(COLORS))
+        self.prices = np.asarray(prices, dtype = np.int64).reshape(-1)
+        self.tolerance = float(tolerance)
+
+        if target is None:
+            target = self.types[0] if len(self.types) else np.zeros(len(COLORS))
+        self.target = np.asarray(target, dtype = np.int64)
+
+    @classmethod
+    def from_potions(cls, potions: list[dict], tolerance: float, target = None):
+        return cls([potion['type'] for potion in potions], [potion['price'] for potion in potions], tolerance, target)
+
+    @classmethod
+    def from_today(cls, today):
+        '''
+        Today's strategy as strategy.daily.today() returns it; no strategy bottles nothing.
+        '''
+        if not today:
+            return cls([], [], 0)
+        return cls.from_potions(today['potions'], today['tolerance'])
+
+    @property
+    def potions(self):
+        return [{'type': potion_type, 'price': price} for potion_type, price in zip(self.types.tolist(), self.prices.tolist())]
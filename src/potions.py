@@ -0,0 +1,59 @@
+import os
+import threading
+import time
+from fastapi import HTTPException, status
+from src import database as db
+from src import queries
+
+
+class PotionIds:
+    '''
+    In-process potion_type -> catalog id lookup. Loaded from the catalog on first use. Potion
+    types are only ever added, so a miss reloads it, but at most once per reload_after seconds:
+    misses in between are answered from the map already loaded.
+    '''
+
+    def __init__(self, reload_after: float):
+        self.reload_after = reload_after
+        self.loads = 0
+        self._lock = threading.Lock()
+        self._ids = None
+        self._loaded_at = 0.0
+
+    def load(self, connection = None):
+        if connection is None:
+            with db.engine.begin() as connection:
+                rows = connection.execute(queries.get_potion_ids).all()
+        else:
+            rows = connection.execute(queries.get_potion_ids).all()
+
+        with self._lock:
+            self._ids = {tuple(row[1:]): row[0] for row in rows}
+            self._loaded_at = time.monotonic()
+            self.loads += 1
+
+    def get(self, potion_type):
+        '''
+        Returns the catalog id for a [r, g, b, d] potion type, or None if it is not in the catalog.
+        '''
+        key = tuple(potion_type)
+
+        ids = self._ids
+        if ids is None or (key not in ids and time.monotonic() - self._loaded_at >= self.reload_after):
+            self.load()
+            ids = self._ids
+
+        return ids.get(key)
+
+    def require(self, potion_type):
+        '''
+        get() for request edges: an unknown potion type raises a 404.
+        '''
+        potion_id = self.get(potion_type)
+        if potion_id is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Unknown potion type: {list(potion_type)}")
+
+        return potion_id
+
+
+ids = PotionIds(reload_after = float(os.environ.get("POTION_IDS_RELOAD_SECONDS", 60)))
@@ -0,0 +1,495 @@
+from sqlalchemy import text
+
+# Every statement the shop runs on its request paths, declared once at import under a stable name.
+# A name's SQL text never changes between executions, so psycopg (see database.prepare_threshold)
+# and asyncpg prepare it server-side once per connection and later executions skip parse and
+# plan. Each statement carries its name as the query_name execution option, which metrics uses to
+# count executions and preparation per query.
+#
+# Parameters are bound server-side, where psycopg sends small ints as SMALLINT: arithmetic between
+# two parameters casts them first so products can't overflow. asyncpg sends them untyped for the
+# server to infer, which fails on a negated parameter (`- unknown` is ambiguous), so those are cast.
+#
+# Reads of the open epoch filter the ledgers on epoch = current_epoch(), the partition key, so
+# Postgres prunes every closed epoch's partitions instead of scanning them for recent timestamps.
+# Order search covers every epoch's orders, so it has no epoch filter.
+#
+# Compaction and migrations build their SQL per epoch or per file and stay in their own modules.
+
+REGISTRY = {}
+
+
+def register(name: str, sql: str):
+    '''
+    Declares a named statement and returns it, tagged with its name.
+    '''
+    if name in REGISTRY:
+        raise ValueError(f"Query {name} is already registered")
+
+    statement = REGISTRY[name] = text(sql).execution_options(query_name = name)
+    return statement
+
+
+# Catalog
+
+get_catalog =   register("catalog.get", '''SELECT catalog.name AS sku,
+                                                  catalog.name AS name,
+                                                  COALESCE(SUM(potion_ledger.qty), 0)::INT AS quantity,
+                                                  catalog.price AS price,
+                                                  ARRAY[catalog.r, catalog.g, catalog.b, catalog.d] AS potion_type
+                                           FROM catalog
+                                           JOIN potion_ledger ON potion_ledger.potion_id = catalog.id
+                                           WHERE potion_ledger.epoch = current_epoch() AND catalog.listed
+                                           GROUP BY catalog.r, catalog.g, catalog.b, catalog.d
+                                           HAVING COALESCE(SUM(potion_ledger.qty), 0)::INT > 0''')
+
+get_potion_ids =    register("potions.ids", '''SELECT id, r, g, b, d
+                                                FROM catalog''')
+
+
+# Carts
+
+# Whitelisted sort expressions; every page is ordered by (expression, ledger_id) so the pair is unique
+SEARCH_SORT_COLUMNS = {
+    "customer_name": "customers.name",
+    "item_sku": "catalog.name",
+    "line_item_total": "(-potion_ledger.qty * potion_ledger_carts.price)",
+    "timestamp": "potion_ledger.timestamp",
+}
+
+
+def search_sql(sort_expression: str, descending: bool, keyset: bool, by_name: bool, by_sku: bool):
+    direction = "DESC" if descending else "ASC"
+    filters = []
+    if by_name:
+        filters.append("customers.name ILIKE '%' || :customer_name || '%'")
+    if by_sku:
+        filters.append("catalog.name ILIKE '%' || :potion_sku || '%'")
+    if keyset:
+        filters.append(f"({sort_expression}, potion_ledger.ledger_id) {'<' if descending else '>'} (:sort_value, :ledger_id)")
+    where = "WHERE " + "\n                   AND ".join(filters) if filters else ""
+
+    return f'''SELECT potion_ledger.ledger_id AS line_item_id,
+                      customers.name AS customer_name,
+                      catalog.name AS item_sku,
+                      (-potion_ledger.qty * potion_ledger_carts.price)::INT AS line_item_total,
+                      potion_ledger.timestamp AS timestamp,
+                      {sort_expression} AS sort_value
+               FROM potion_ledger
+               JOIN potion_ledger_carts ON potion_ledger_carts.potion_ledger_id = potion_ledger.ledger_id
+               JOIN carts ON carts.cart_id = potion_ledger_carts.cart_id
+               JOIN customers ON customers.id = carts.customer_id
+               JOIN catalog ON catalog.id = potion_ledger.potion_id
+               {where}
+               ORDER BY {sort_expression} {direction}, potion_ledger.ledger_id {direction}
+               LIMIT :limit'''
+
+
+# One statement per (sort column, descending, keyset page, name filter, sku filter), so no search
+# builds SQL per request. An empty filter gets a variant without it rather than a
+# (:customer_name = '' OR ...) guard, which a generic plan can't resolve and so never uses the
+# trigram index for.
+search_orders = {
+    (column, descending, keyset, by_name, by_sku):
+        register(f"carts.search.{column}.{'desc' if descending else 'asc'}{'.keyset' if keyset else ''}"
+                 f"{'.name' if by_name else ''}{'.sku' if by_sku else ''}",
+                 search_sql(expression, descending, keyset, by_name, by_sku))
+    for column, expression in SEARCH_SORT_COLUMNS.items()
+    for descending in (False, True)
+    for keyset in (False, True)
+    for by_name in (False, True)
+    for by_sku in (False, True)
+}
+
+visit_insert =  register("carts.visits", '''WITH incoming AS (SELECT *
+                                                              FROM unnest(CAST(:names AS TEXT[]), CAST(:classes AS TEXT[]), CAST(:levels AS BIGINT[]))
+                                                                   AS incoming (name, class, level)),
+                                                 customer AS (INSERT INTO customers (name, class, level)
+                                                              SELECT DISTINCT name, class, level
+                                                              FROM incoming
+                                                              ON CONFLICT (name, class, level) DO UPDATE SET id = customers.id
+                                                              RETURNING id, name, class, level)
+                                            INSERT INTO visits (visit_id, customer_id)
+                                            SELECT :visit_id, customer.id
+                                            FROM incoming
+                                            JOIN customer ON (customer.name, customer.class, customer.level)
+                                                             = (incoming.name, incoming.class, incoming.level)''')
+
+create_cart_for =   register("carts.create", '''INSERT INTO carts (customer_id)
+                                                SELECT id
+                                                FROM customers
+                                                WHERE (name, class, level) IN ((:customer_name, :character_class, :level))
+                                                RETURNING cart_id''')
+
+# Cart items reserve stock by taking it from the SKU's potion_stock row only while enough is left,
+# and count the sale on that same row rather than on the epoch's snapshot (see SALES). Concurrent
+# carts for one SKU queue on that row and recheck the condition once the first commits; carts for
+# other SKUs never wait on each other. Negative quantities hand stock back.
+put_in_cart =   register("carts.item", '''WITH item AS (SELECT id, r, g, b, d, price
+                                                        FROM catalog
+                                                        WHERE name = :sku),
+                                               reserved AS (UPDATE potion_stock
+                                                            SET available = potion_stock.available - :quantity,
+                                                                sold = potion_stock.sold + :quantity,
+                                                                gold = potion_stock.gold + CAST(:quantity AS BIGINT) * item.price,
+                                                                version = potion_stock.version + 1
+                                                            FROM item
+                                                            WHERE potion_stock.epoch = current_epoch()
+                                                                AND potion_stock.potion_id = item.id
+                                                                AND potion_stock.available >= :quantity
+                                                            RETURNING potion_stock.potion_id),
+                                               new_ledger AS (INSERT INTO potion_ledger (potion_id, red, green, blue, dark, qty)
+                                                              SELECT id, r, g, b, d, -CAST(:quantity AS INT)
+                                                              FROM item
+                                                              JOIN reserved ON reserved.potion_id = item.id
+                                                              RETURNING ledger_id),
+                                               new_cart AS (INSERT INTO potion_ledger_carts (cart_id, potion_ledger_id, price)
+                                                            SELECT :cart_id, new_ledger.ledger_id, item.price
+                                                            FROM new_ledger, item
+                                                            RETURNING price)
+                                          SELECT item.price, EXISTS (SELECT 1 FROM new_cart) AS reserved
+                                          FROM item''')
+
+put_items_in_cart = register("carts.items", '''WITH items AS (SELECT *
+                                                              FROM unnest(CAST(:skus AS TEXT[]), CAST(:quantities AS INT[])) AS items (sku, quantity)),
+                                                    requested AS (SELECT catalog.id AS potion_id, SUM(items.quantity) AS quantity,
+                                                                         SUM(items.quantity) * catalog.price AS gold
+                                                                  FROM items
+                                                                  JOIN catalog ON catalog.name = items.sku
+                                                                  GROUP BY catalog.id, catalog.price),
+                                                    reserved AS (UPDATE potion_stock
+                                                                 SET available = potion_stock.available - requested.quantity,
+                                                                     sold = potion_stock.sold + requested.quantity,
+                                                                     gold = potion_stock.gold + requested.gold,
+                                                                     version = potion_stock.version + 1
+                                                                 FROM requested
+                                                                 WHERE potion_stock.epoch = current_epoch()
+                                                                     AND potion_stock.potion_id = requested.potion_id
+                                                                     AND potion_stock.available >= requested.quantity
+                                                                 RETURNING potion_stock.potion_id),
+                                                    new_ledger AS (INSERT INTO potion_ledger (potion_id, red, green, blue, dark, qty)
+                                                                   SELECT catalog.id, catalog.r, catalog.g, catalog.b, catalog.d, -items.quantity
+                                                                   FROM items
+                                                                   JOIN catalog ON catalog.name = items.sku
+                                                                   JOIN reserved ON reserved.potion_id = catalog.id
+                                                                   RETURNING ledger_id, potion_id, qty),
+                                                    new_carts AS (INSERT INTO potion_ledger_carts (cart_id, potion_ledger_id, price)
+                                                                  SELECT :cart_id, new_ledger.ledger_id, catalog.price
+                                                                  FROM new_ledger
+                                                                  JOIN catalog ON catalog.id = new_ledger.potion_id
+                                                                  RETURNING potion_ledger_id, price)
+                                               SELECT -COALESCE(SUM(new_ledger.qty), 0)::INT AS potions,
+                                                      -COALESCE(SUM(new_ledger.qty * new_carts.price), 0)::INT AS gold,
+                                                      ARRAY(SELECT items.sku
+                                                            FROM items
+                                                            LEFT JOIN catalog ON catalog.name = items.sku
+                                                            WHERE catalog.name IS NULL) AS unknown_skus,
+                                                      ARRAY(SELECT catalog.name
+                                                            FROM requested
+                                                            JOIN catalog ON catalog.id = requested.potion_id
+                                                            WHERE requested.potion_id NOT IN (SELECT potion_id FROM reserved)) AS short_skus
+                                               FROM new_ledger
+                                               JOIN new_carts ON new_carts.potion_ledger_id = new_ledger.ledger_id''')
+
+# Write-behind flushes (src/ledger_buffer.py) lock the stock rows of every SKU in the batch, decide
+# in Python which items fit, and write the accepted items of many carts in one statement. Ledger
+# ids are drawn up front so each cart row can point at its own ledger row.
+lock_stock =    register("carts.lock_stock", '''SELECT catalog.name AS sku, potion_stock.available
+                                               FROM catalog
+                                               JOIN potion_stock ON potion_stock.potion_id = catalog.id AND potion_stock.epoch = current_epoch()
+                                               WHERE catalog.name = ANY(CAST(:skus AS TEXT[]))
+                                               ORDER BY catalog.id
+                                               FOR UPDATE OF potion_stock''')
+
+put_buffered_items =    register("carts.buffered_items", '''WITH items AS (SELECT catalog.id AS potion_id, catalog.r, catalog.g, catalog.b, catalog.d, catalog.price,
+                                                                            items.cart_id, items.quantity,
+                                                                            nextval(pg_get_serial_sequence('public.potion_ledger', 'ledger_id')) AS ledger_id
+                                                                     FROM unnest(CAST(:cart_ids AS BIGINT[]), CAST(:skus AS TEXT[]), CAST(:quantities AS INT[]))
+                                                                          AS items (cart_id, sku, quantity)
+                                                                     JOIN catalog ON catalog.name = items.sku),
+                                                          reserved AS (UPDATE potion_stock
+                                                                       SET available = potion_stock.available - taken.quantity,
+                                                                           sold = potion_stock.sold + taken.quantity,
+                                                                           gold = potion_stock.gold + taken.gold,
+                                                                           version = potion_stock.version + 1
+                                                                       FROM (SELECT potion_id, SUM(quantity) AS quantity,
+                                                                                    SUM(CAST(quantity AS BIGINT) * price) AS gold
+                                                                             FROM items
+                                                                             GROUP BY potion_id) AS taken
+                                                                       WHERE potion_stock.epoch = current_epoch()
+                                                                           AND potion_stock.potion_id = taken.potion_id),
+                                                          new_ledger AS (INSERT INTO potion_ledger (ledger_id, potion_id, red, green, blue, dark, qty)
+                                                                         SELECT ledger_id, potion_id, r, g, b, d, -quantity
+                                                                         FROM items),
+                                                          new_carts AS (INSERT INTO potion_ledger_carts (cart_id, potion_ledger_id, price)
+                                                                        SELECT cart_id, ledger_id, price
+                                                                        FROM items)
+                                                     SELECT COALESCE(SUM(quantity), 0)::INT AS potions,
+                                                            COALESCE(SUM(quantity * price), 0)::INT AS gold
+                                                     FROM items''')
+
+checkout_shopping_cart =    register("carts.checkout", '''SELECT -COALESCE(SUM(potion_ledger.qty), 0)::INT AS total_potions_bought,
+                                                                 -COALESCE(SUM(potion_ledger.qty * potion_ledger_carts.price), 0)::INT AS total_gold_paid
+                                                          FROM potion_ledger_carts
+                                                          JOIN potion_ledger ON potion_ledger.ledger_id = potion_ledger_carts.potion_ledger_id
+                                                          WHERE potion_ledger_carts.cart_id = :cart_id''')
+
+
+# Deliveries
+
+barrel_delivery =   register("barrels.deliver", '''WITH delivery AS (
+                                                       INSERT INTO barrel_purchase (order_id, size, quantity, cost)
+                                                       VALUES (:order_id, :ml_per_barrel, :quantity, :price)
+                                                       RETURNING id
+                                                   )
+                                                   INSERT INTO barrel_ledger (barrel_id, red, green, blue, dark)
+                                                   SELECT id, (CAST(:ml_per_barrel AS INT) * CAST(:quantity AS INT)) * (CAST(:potion_type AS INT[]))[1],
+                                                              (CAST(:ml_per_barrel AS INT) * CAST(:quantity AS INT)) * (CAST(:potion_type AS INT[]))[2],
+                                                              (CAST(:ml_per_barrel AS INT) * CAST(:quantity AS INT)) * (CAST(:potion_type AS INT[]))[3],
+                                                              (CAST(:ml_per_barrel AS INT) * CAST(:quantity AS INT)) * (CAST(:potion_type AS INT[]))[4]
+                                                   FROM delivery''')
+
+bottle_delivery =   register("bottler.deliver", '''WITH new_ledger AS (INSERT INTO potion_ledger (potion_id, red, green, blue, dark, qty)
+                                                                       SELECT id, r, g, b, d, :quantity
+                                                                       FROM catalog
+                                                                       WHERE id = :potion_id
+                                                                       RETURNING ledger_id, epoch, potion_id, qty),
+                                                        stocked AS (INSERT INTO potion_stock (epoch, potion_id, available)
+                                                                    SELECT epoch, potion_id, qty
+                                                                    FROM new_ledger
+                                                                    ON CONFLICT (epoch, potion_id) DO UPDATE
+                                                                    SET available = potion_stock.available + EXCLUDED.available)
+                                                   INSERT INTO potion_ledger_deliveries (order_id, ledger_id)
+                                                   SELECT :order_id, ledger_id
+                                                   FROM new_ledger''')
+
+debit_barrel_volume =   register("bottler.debit_volume", '''INSERT INTO barrel_ledger (red, green, blue, dark)
+                                                            VALUES (-CAST(:red AS INT), -CAST(:green AS INT), -CAST(:blue AS INT), -CAST(:dark AS INT))''')
+
+deliver_capacity =  register("inventory.deliver", '''WITH new_ledger AS (INSERT INTO capacity_ledger (potion, volume, cost)
+                                                                         SELECT :potion_capacity, :ml_capacity,
+                                                                                 ((CAST(:potion_capacity AS INT) / 50) + (CAST(:ml_capacity AS INT) / 10000)) * 1000
+                                                                         RETURNING id, potion, volume, cost),
+                                                          delivery AS (INSERT INTO capacity_ledger_deliveries (capacity_id, order_id)
+                                                                       SELECT new_ledger.id, :order_id
+                                                                       FROM new_ledger)
+                                                     SELECT potion, volume, cost
+                                                     FROM new_ledger''')
+
+claim_delivery =    register("deliveries.claim", '''INSERT INTO deliveries (kind, order_id)
+                                                    VALUES (:kind, :order_id)
+                                                    ON CONFLICT (kind, order_id) DO NOTHING
+                                                    RETURNING order_id''')
+
+store_delivery_result = register("deliveries.store_result", '''UPDATE deliveries
+                                                               SET result = CAST(:result AS JSONB)
+                                                               WHERE kind = :kind AND order_id = :order_id''')
+
+get_delivery_result =   register("deliveries.get_result", '''SELECT result
+                                                             FROM deliveries
+                                                             WHERE kind = :kind AND order_id = :order_id''')
+
+
+# Inventory
+
+# Cart sales are counted per SKU on potion_stock, not on the epoch's inventory_snapshot row, so
+# carts never queue on one shared row. The epoch's gold and num_potions are its snapshot's plus
+# these sums, and its version the snapshot's plus every stock row's.
+SALES = '''(SELECT COALESCE(SUM(sold), 0)::BIGINT AS sold,
+                   COALESCE(SUM(gold), 0)::BIGINT AS gold,
+                   COALESCE(SUM(version), 0)::BIGINT AS version
+            FROM potion_stock
+            WHERE epoch = current_epoch()) AS sales'''
+
+# Hourly potion, ml and capacity deltas for the last day of the epoch, alongside the snapshot's
+# current totals that anchor them, in one round trip
+get_pressure =  register("inventory.pressure", f'''WITH reset AS (SELECT timestamp AS time
+                                                                  FROM resets
+                                                                  ORDER BY timestamp DESC
+                                                                  LIMIT 1),
+                                                        since AS (SELECT GREATEST(reset.time, CURRENT_TIMESTAMP - INTERVAL '24 hours') AS start
+                                                                   FROM reset),
+                                                        hours AS (SELECT generate_series(date_trunc('hour', since.start),
+                                                                                         date_trunc('hour', CURRENT_TIMESTAMP),
+                                                                                         INTERVAL '1 hour') AS hour
+                                                                  FROM since),
+                                                        potions AS (SELECT date_trunc('hour', timestamp) AS hour, SUM(qty) AS potions
+                                                                    FROM potion_ledger, since
+                                                                    WHERE epoch = current_epoch() AND timestamp >= since.start
+                                                                    GROUP BY 1),
+                                                        volumes AS (SELECT date_trunc('hour', timestamp) AS hour, SUM(red + green + blue + dark) AS volume
+                                                                    FROM barrel_ledger, since
+                                                                    WHERE epoch = current_epoch() AND timestamp >= since.start
+                                                                    GROUP BY 1),
+                                                        capacity AS (SELECT date_trunc('hour', timestamp) AS hour,
+                                                                            SUM(potion) AS potion_capacity, SUM(volume) AS volume_capacity
+                                                                     FROM capacity_ledger, since
+                                                                     WHERE epoch = current_epoch() AND timestamp >= since.start
+                                                                     GROUP BY 1)
+                                                   SELECT COALESCE(potions.potions, 0)::INT AS potions,
+                                                          COALESCE(volumes.volume, 0)::INT AS volume,
+                                                          COALESCE(capacity.potion_capacity, 0)::INT AS potion_capacity,
+                                                          COALESCE(capacity.volume_capacity, 0)::INT AS volume_capacity,
+                                                          snapshot.gold + sales.gold AS gold, snapshot.num_potions - sales.sold AS num_potions,
+                                                          snapshot.red + snapshot.green + snapshot.blue + snapshot.dark AS ml,
+                                                          snapshot.potion_capacity AS potion_capacity_now, snapshot.volume_capacity AS volume_capacity_now
+                                                   FROM hours
+                                                   LEFT JOIN potions ON potions.hour = hours.hour
+                                                   LEFT JOIN volumes ON volumes.hour = hours.hour
+                                                   LEFT JOIN capacity ON capacity.hour = hours.hour
+                                                   LEFT JOIN inventory_snapshot AS snapshot ON snapshot.reset_time = (SELECT time FROM reset)
+                                                   CROSS JOIN {SALES}
+                                                   ORDER BY hours.hour ASC''')
+
+get_snapshot =  register("snapshot.get", f'''SELECT snapshot.reset_time,
+                                                    snapshot.gold + sales.gold AS gold,
+                                                    snapshot.num_potions - sales.sold AS num_potions,
+                                                    snapshot.red, snapshot.green, snapshot.blue, snapshot.dark,
+                                                    (snapshot.red + snapshot.green + snapshot.blue + snapshot.dark) AS ml_in_barrels,
+                                                    snapshot.potion_capacity, snapshot.volume_capacity,
+                                                    current_epoch() AS epoch, snapshot.version + sales.version AS version
+                                             FROM inventory_snapshot AS snapshot, {SALES}
+                                             WHERE snapshot.reset_time = (SELECT MAX(timestamp) FROM resets)''')
+
+apply_snapshot_delta =  register("snapshot.apply", '''UPDATE inventory_snapshot
+                                                      SET gold = gold + :gold,
+                                                          num_potions = num_potions + :num_potions,
+                                                          red = red + :red,
+                                                          green = green + :green,
+                                                          blue = blue + :blue,
+                                                          dark = dark + :dark,
+                                                          potion_capacity = potion_capacity + :potion_capacity,
+                                                          volume_capacity = volume_capacity + :volume_capacity,
+                                                          version = version + 1,
+                                                          updated_at = now()
+                                                      WHERE reset_time = (SELECT MAX(timestamp) FROM resets)''')
+
+recompute_snapshot =    register("snapshot.recompute", '''WITH reset AS (SELECT timestamp AS time
+                                                                         FROM resets
+                                                                         ORDER BY timestamp DESC
+                                                                         LIMIT 1),
+                                                               capacity AS (SELECT COALESCE(SUM(potion), 0)::BIGINT AS potion_capacity,
+                                                                                   COALESCE(SUM(volume), 0)::BIGINT AS volume_capacity
+                                                                            FROM capacity_ledger
+                                                                            WHERE epoch = current_epoch())
+                                                          SELECT reset.time AS reset_time,
+                                                                 global.gold, global.num_potions,
+                                                                 global.red, global.green, global.blue, global.dark,
+                                                                 capacity.potion_capacity, capacity.volume_capacity
+                                                          FROM global, capacity, reset''')
+
+# Stores full ledger balances as the snapshot row, less the cart sales the stock rows already count
+store_snapshot =    register("snapshot.store", f'''INSERT INTO inventory_snapshot (reset_time, gold, num_potions, red, green, blue, dark,
+                                                                               potion_capacity, volume_capacity)
+                                                   SELECT :reset_time, :gold - sales.gold, :num_potions + sales.sold, :red, :green, :blue, :dark,
+                                                          :potion_capacity, :volume_capacity
+                                                   FROM {SALES}
+                                                   ON CONFLICT (reset_time) DO UPDATE
+                                                   SET gold = EXCLUDED.gold,
+                                                       num_potions = EXCLUDED.num_potions,
+                                                       red = EXCLUDED.red,
+                                                       green = EXCLUDED.green,
+                                                       blue = EXCLUDED.blue,
+                                                       dark = EXCLUDED.dark,
+                                                       potion_capacity = EXCLUDED.potion_capacity,
+                                                       volume_capacity = EXCLUDED.volume_capacity,
+                                                       version = inventory_snapshot.version + 1,
+                                                       updated_at = now()''')
+
+# Bumped by every snapshot and stock sales write, so (epoch, version) names one state of the ledgers
+get_ledger_version =    register("snapshot.version", f'''SELECT current_epoch() AS epoch, snapshot.version + sales.version AS version
+                                                         FROM inventory_snapshot AS snapshot, {SALES}
+                                                         WHERE snapshot.reset_time = (SELECT MAX(timestamp) FROM resets)''')
+
+
+# Strategy
+
+set_day_from =  register("strategy.set_day", '''UPDATE strategy
+                                                SET is_today = (day_name = :day)
+                                                WHERE is_today IS DISTINCT FROM (day_name = :day)''')
+
+get_today = register("strategy.today", '''SELECT strategy.day_name, strategy.tolerance, strategy.deviation,
+                                                 ARRAY[strategy.red_ratio, strategy.green_ratio, strategy.blue_ratio, strategy.dark_ratio] AS ratios,
+                                                 ARRAY[cat.r, cat.g, cat.b, cat.d] AS type, cat.price, cat.id AS potion_id
+                                          FROM strategy
+                                          LEFT JOIN strategy_potions ON strategy_potions.day = strategy.day
+                                          LEFT JOIN catalog cat ON cat.id = strategy_potions.potion_id
+                                          WHERE strategy.is_today
+                                          ORDER BY cat.price DESC NULLS LAST
+                                          LIMIT 6''')
+
+
+# Every day's strategy, each day's potions most expensive first
+get_strategies =    register("strategy.week", '''SELECT strategy.day, strategy.day_name, strategy.tolerance, strategy.deviation,
+                                                          ARRAY[strategy.red_ratio, strategy.green_ratio, strategy.blue_ratio, strategy.dark_ratio] AS ratios,
+                                                          ARRAY[cat.r, cat.g, cat.b, cat.d] AS type, cat.price, cat.id AS potion_id
+                                                   FROM strategy
+                                                   LEFT JOIN strategy_potions ON strategy_potions.day = strategy.day
+                                                   LEFT JOIN catalog cat ON cat.id = strategy_potions.potion_id
+                                                   ORDER BY strategy.day, cat.price DESC NULLS LAST''')
+
+
+# Exports
+
+# One reset epoch (the current one when :epoch is NULL) within [:since, :until), in ledger order
+EXPORT_FILTER = '''epoch = COALESCE(CAST(:epoch AS BIGINT), current_epoch())
+                   AND timestamp >= COALESCE(CAST(:since AS TIMESTAMPTZ), '-infinity')
+                   AND timestamp < COALESCE(CAST(:until AS TIMESTAMPTZ), 'infinity')'''
+
+exports = {
+    "potion_ledger":    register("exports.potion_ledger", f'''SELECT ledger.ledger_id, ledger.epoch, ledger.timestamp,
+                                                                      ledger.potion_id, catalog.name AS sku, ledger.qty,
+                                                                      ledger.red, ledger.green, ledger.blue, ledger.dark,
+                                                                      carts.cart_id, carts.price, deliveries.order_id
+                                                               FROM (SELECT *
+                                                                     FROM potion_ledger
+                                                                     WHERE {EXPORT_FILTER}) AS ledger
+                                                               JOIN catalog ON catalog.id = ledger.potion_id
+                                                               LEFT JOIN potion_ledger_carts carts ON carts.potion_ledger_id = ledger.ledger_id
+                                                               LEFT JOIN potion_ledger_deliveries deliveries ON deliveries.ledger_id = ledger.ledger_id
+                                                               ORDER BY ledger.ledger_id'''),
+    "barrel_ledger":    register("exports.barrel_ledger", f'''SELECT ledger.id, ledger.epoch, ledger.timestamp,
+                                                                      ledger.red, ledger.green, ledger.blue, ledger.dark,
+                                                                      ledger.barrel_id, purchase.order_id, purchase.size,
+                                                                      purchase.quantity, purchase.cost
+                                                               FROM (SELECT *
+                                                                     FROM barrel_ledger
+                                                                     WHERE {EXPORT_FILTER}) AS ledger
+                                                               LEFT JOIN barrel_purchase purchase ON purchase.id = ledger.barrel_id
+                                                               ORDER BY ledger.id'''),
+    "capacity_ledger":  register("exports.capacity_ledger", f'''SELECT ledger.id, ledger.epoch, ledger.timestamp,
+                                                                        ledger.potion, ledger.volume, ledger.cost,
+                                                                        deliveries.order_id
+                                                                 FROM (SELECT *
+                                                                       FROM capacity_ledger
+                                                                       WHERE {EXPORT_FILTER}) AS ledger
+                                                                 LEFT JOIN capacity_ledger_deliveries deliveries ON deliveries.capacity_id = ledger.id
+                                                                 ORDER BY ledger.id'''),
+    "cart_history":     register("exports.cart_history", f'''SELECT carts.cart_id, carts.created_at AS cart_created_at,
+                                                                     customers.name AS customer_name, customers.class AS character_class,
+                                                                     customers.level, ledger.ledger_id AS line_item_id, ledger.epoch,
+                                                                     ledger.timestamp, catalog.name AS sku, -ledger.qty AS quantity,
+                                                                     items.price, -ledger.qty * items.price AS gold
+                                                              FROM (SELECT *
+                                                                    FROM potion_ledger
+                                                                    WHERE {EXPORT_FILTER}) AS ledger
+                                                              JOIN potion_ledger_carts items ON items.potion_ledger_id = ledger.ledger_id
+                                                              JOIN carts ON carts.cart_id = items.cart_id
+                                                              JOIN customers ON customers.id = carts.customer_id
+                                                              JOIN catalog ON catalog.id = ledger.potion_id
+                                                              ORDER BY ledger.ledger_id'''),
+}
+
+
+# Admin
+
+# Prepared statements hold one command each, so a reset is two statements on one transaction
+insert_reset =  register("admin.reset", '''INSERT INTO resets
+                                           DEFAULT VALUES''')
+
+open_capacity = register("admin.open_capacity", '''INSERT INTO capacity_ledger
+                                                   DEFAULT VALUES''')
+
+get_prepared_statements =   register("admin.prepared_statements", '''SELECT name, statement, prepare_time, generic_plans, custom_plans
+                                                                     FROM pg_prepared_statements
+                                                                     ORDER BY prepare_time''')
@@ -0,0 +1,87 @@
+from src import queries
+
+# Running balances for the current reset epoch. Every ledger write applies its delta to the
+# snapshot row in the same transaction, so reads no longer aggregate the ledgers through `global`.
+# Cart sales are the exception: they are counted on each SKU's potion_stock row, which the cart
+# already locks to reserve stock, so concurrent carts don't all queue on the one snapshot row.
+# Reads add those counts back (queries.SALES), and a rebuild stores the ledger totals less them.
+
+COLUMNS = ('gold', 'num_potions', 'red', 'green', 'blue', 'dark', 'potion_capacity', 'volume_capacity')
+
+
+def apply(connection, **deltas):
+    '''
+    Adds ledger deltas (gold, num_potions, colors in ml, capacities) to the current epoch's
+    snapshot. Must be called on the connection that wrote the ledger rows, so both commit together.
+    If the epoch has no snapshot yet it is rebuilt, which already includes the new rows.
+    '''
+
+    unknown = set(deltas) - set(COLUMNS)
+    if unknown:
+        raise ValueError(f"Unknown snapshot columns: {sorted(unknown)}")
+
+    if not connection.execute(queries.apply_snapshot_delta, {column: deltas.get(column, 0) for column in COLUMNS}).rowcount:
+        rebuild(connection)
+
+
+def stored(connection):
+    '''
+    Returns the current epoch's stored balances, or None if it has no snapshot yet. Never writes,
+    so it is safe on read-only connections.
+    '''
+
+    return connection.execute(queries.get_snapshot).mappings().one_or_none()
+
+
+def current(connection):
+    '''
+    Returns the current epoch's running balances, rebuilding them from the ledgers if missing.
+    '''
+
+    snapshot = connection.execute(queries.get_snapshot).mappings().one_or_none()
+    if snapshot is None:
+        rebuild(connection)
+        snapshot = connection.execute(queries.get_snapshot).mappings().one()
+
+    return snapshot
+
+
+def rebuild(connection):
+    '''
+    Recomputes the current epoch's balances from the full ledgers and stores them, less the cart
+    sales already counted on its stock rows.
+    '''
+
+    balances = connection.execute(queries.recompute_snapshot).mappings().one()
+    connection.execute(queries.store_snapshot, balances)
+
+    return dict(balances)
+
+
+def verify(connection):
+    '''
+    Compares the stored snapshot against a full ledger recompute. Returns the mismatched
+    columns as {column: {"snapshot": ..., "ledger": ...}}; empty when they agree.
+    '''
+
+    expected = connection.execute(queries.recompute_snapshot).mappings().one()
+    stored = connection.execute(queries.get_snapshot).mappings().one_or_none() or {}
+
+    return {column: {"snapshot": stored.get(column), "ledger": expected[column]}
+            for column in COLUMNS if stored.get(column) != expected[column]}
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    from src import database as db
+
+    parser = argparse.ArgumentParser(description="Rebuild or verify the inventory snapshot.")
+    parser.add_argument("command", choices=["rebuild", "verify"])
+    args = parser.parse_args()
+
+    with db.engine.begin() as connection:
+        result = rebuild(connection) if args.command == "rebuild" else verify(connection)
+
+    print(json.dumps(result, default=str, indent=2))
+    raise SystemExit(1 if args.command == "verify" and result else 0)
@@ -0,0 +1,109 @@
+import itertools
+import os
+import threading
+import time
+import dotenv
+from src import database as db
+from src import queries
+
+dotenv.load_dotenv()
+
+# Potions planned per day, most expensive first, as get_today's LIMIT
+POTIONS_PER_DAY = 6
+
+# DailyStrategy's strategy before its first load; None is a loaded day without a strategy
+_UNLOADED = object()
+
+
+def read_today(connection):
+    '''
+    Today's strategy: tolerance, color ratios and its potions ({'type', 'price', 'potion_id'}),
+    most expensive first. None if no day is marked as today.
+    '''
+    rows = connection.execute(queries.get_today).mappings().all()
+    if not rows:
+        return None
+
+    return from_rows(rows)
+
+
+def read_week(connection):
+    '''
+    Every day's strategy in day order, shaped like read_today(), for offline simulation.
+    '''
+    days = itertools.groupby(connection.execute(queries.get_strategies).mappings().all(), key = lambda row: row["day"])
+
+    return [from_rows(list(rows)[:POTIONS_PER_DAY]) for _, rows in days]
+
+
+def from_rows(rows):
+    return {"day_name": rows[0]["day_name"], "tolerance": rows[0]["tolerance"], "deviation": rows[0]["deviation"],
+            "ratios": list(rows[0]["ratios"]),
+            "potions": [{"type": list(row["type"]), "price": row["price"], "potion_id": row["potion_id"]}
+                        for row in rows if row["potion_id"] is not None]}
+
+
+class DailyStrategy:
+    '''
+    The current day's strategy, computed once per day change and held in memory. The worker that
+    receives /info/current_time switches it immediately; other workers reload it from is_today
+    once their copy is older than refresh seconds. A day without a strategy is held the same
+    way, as None.
+    '''
+
+    def __init__(self, refresh: float):
+        self.refresh = refresh
+        self.loads = 0
+        self.day_changes = 0
+        self._lock = threading.Lock()
+        self._day = None
+        self._strategy = _UNLOADED
+        self._expires = 0.0
+
+    def _store(self, day, strategy):
+        with self._lock:
+            self._day = day
+            self._strategy = strategy
+            self._expires = time.monotonic() + self.refresh
+            self.loads += 1
+
+    def set_day(self, day: str):
+        '''
+        Marks day as today, writing is_today only on rows whose value changes. Returns whether
+        this worker's day changed.
+        '''
+        with self._lock:
+            if day == self._day:
+                return False
+
+        with db.engine.begin() as connection:
+            connection.execute(queries.set_day_from, {"day": day})
+            strategy = read_today(connection)
+
+        self._store(day, strategy)
+        with self._lock:
+            self.day_changes += 1
+
+        return True
+
+    def today(self):
+        '''
+        Today's strategy without a query, unless this worker has none yet or its copy expired.
+        '''
+        with self._lock:
+            if self._strategy is not _UNLOADED and self._expires > time.monotonic():
+                return self._strategy
+
+        with db.engine.begin() as connection:
+            strategy = read_today(connection)
+
+        self._store(strategy["day_name"] if strategy else None, strategy)
+
+        return strategy
+
+    def stats(self):
+        with self._lock:
+            return {"day": self._day, "loads": self.loads, "day_changes": self.day_changes, "refresh": self.refresh}
+
+
+daily = DailyStrategy(refresh = float(os.environ.get("STRATEGY_REFRESH_SECONDS", 300)))
@@ -0,0 +1,113 @@
+import itertools
+import os
+import time
+import pytest
+from sqlalchemy import text
+from sqlalchemy.engine import URL
+from src import database as db
+from src import migrate
+
+# Tests that take the `shop` fixture run against the Postgres configured by the POSTGRES_*
+# settings (CI's PYTEST environment provides them), migrated to the latest schema, and are
+# skipped without them. Each test starts in a fresh reset epoch. The database is not cleaned up
+# afterwards, so order ids and customer names only need to be unique across runs.
+
+RED = [100, 0, 0, 0]
+
+add_red =   text('''INSERT INTO catalog (name, price, r, g, b, d, listed)
+                    VALUES ('red_potion', 50, 100, 0, 0, 0, TRUE)
+                    ON CONFLICT DO NOTHING''')
+
+get_red =   text('''SELECT name
+                    FROM catalog
+                    WHERE (r, g, b, d) = (100, 0, 0, 0)''')
+
+get_available = text('''SELECT COALESCE(SUM(potion_stock.available), 0)::INT
+                        FROM potion_stock
+                        JOIN catalog ON catalog.id = potion_stock.potion_id
+                        WHERE catalog.name = :sku AND potion_stock.epoch = current_epoch()''')
+
+
+def database_url():
+    '''
+    The test database from POSTGRES_USER, POSTGRES_PASSWORD, POSTGRES_SERVER, POSTGRES_PORT and
+    POSTGRES_DB, or None if it isn't configured.
+    '''
+    user, server, name = (os.environ.get(setting) for setting in ("POSTGRES_USER", "POSTGRES_SERVER", "POSTGRES_DB"))
+    if not (user and server and name):
+        return None
+
+    port = os.environ.get("POSTGRES_PORT")
+    return URL.create("postgresql+psycopg", username = user, password = os.environ.get("POSTGRES_PASSWORD") or None,
+                      host = server, port = int(port) if port else None,
+                      database = name).render_as_string(hide_password = False)
+
+
+@pytest.fixture(scope="session")
+def database():
+    url = database_url()
+    if url is None:
+        pytest.skip("no test database: POSTGRES_USER, POSTGRES_SERVER and POSTGRES_DB are not set")
+
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setenv("POSTGRES_URI", url)
+        patch.delenv("POSTGRES_REPLICA_URI", raising = False)
+        db.dispose()
+        patch.setattr(db, "_engines", None)
+        db.connect()
+
+        migrate.migrate()
+        with db.engine.begin() as connection:
+            connection.execute(add_red)
+            red = connection.execute(get_red).scalar_one()
+
+        yield red
+
+        db.dispose()
+
+
+class Shop:
+    '''
+    A freshly reset shop selling red potions, with helpers for the calls the tests set up with.
+    '''
+
+    def __init__(self, red: str):
+        self.red = red
+        self._ids = itertools.count(int(time.time() * 1000))
+
+    def order_id(self):
+        return next(self._ids)
+
+    def bottle(self, quantity: int):
+        '''
+        Buys the red ml for quantity potions and bottles them.
+        '''
+        from src.api import barrels, bottler
+
+        barrels.post_deliver_barrels([barrels.Barrel(sku = "SMALL_RED_BARREL", ml_per_barrel = 100 * quantity,
+                                                     potion_type = [1, 0, 0, 0], price = quantity, quantity = 1)],
+                                     self.order_id())
+        bottler.post_deliver_bottles([bottler.PotionInventory(potion_type = RED, quantity = quantity)], self.order_id())
+
+    def cart(self):
+        from src.api import carts
+
+        customer = carts.Customer(customer_name = f"test_customer_{self.order_id()}", character_class = "Tester", level = 1)
+        carts.post_visits(self.order_id(), [customer])
+        return carts.create_cart(customer)["cart_id"]
+
+    def available(self):
+        with db.engine.begin() as connection:
+            return connection.execute(get_available, {"sku": self.red}).scalar_one()
+
+    def epoch(self):
+        with db.engine.begin() as connection:
+            return connection.execute(text("SELECT current_epoch()")).scalar_one()
+
+
+@pytest.fixture
+def shop(database):
+    from src.api import admin
+
+    admin.reset()
+    return Shop(database)
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+from src.planning import capacity
+
+FLAT = np.zeros((2, 3))
+
+
+@pytest.mark.parametrize("gold, expected", [
+    (5000, {"potion_capacity": 1, "ml_capacity": 1}),
+    (2500, {"potion_capacity": 1, "ml_capacity": 0}),   # the ml unit would break the reserve
+    (1999, {"potion_capacity": 0, "ml_capacity": 0}),
+])
+def test_buys_capacity_under_the_minimum_headroom(gold, expected):
+    plan = capacity.capacity_plan(gold, FLAT, [48, 9600], FLAT, [50, 10000], lookahead_ticks = 0)
+
+    assert plan == expected
+
+
+def test_leaves_capacity_with_room_to_spare():
+    plan = capacity.capacity_plan(5000, FLAT, [10, 1000], FLAT, [50, 10000], lookahead_ticks = 4)
+
+    assert plan == {"potion_capacity": 0, "ml_capacity": 0}
+
+
+def test_projects_the_trend_forward():
+    # Ten potions an hour: 30 of 50 now, so the headroom falls to 0 within one two-hour tick
+    deltas = np.array([[10, 10, 10], [0, 0, 0]])
+
+    assert capacity.capacity_plan(5000, deltas, [30, 0], FLAT, [50, 10000], lookahead_ticks = 0) == \
+        {"potion_capacity": 0, "ml_capacity": 0}
+    assert capacity.capacity_plan(5000, deltas, [30, 0], FLAT, [50, 10000], lookahead_ticks = 1) == \
+        {"potion_capacity": 1, "ml_capacity": 0}
+
+
+def test_recorded_hours_count_against_headroom():
+    # Two hours ago the shop held 48 potions against the same capacity before selling them
+    deltas = np.array([[0, -20, -18], [0, 0, 0]])
+
+    assert capacity.capacity_plan(5000, deltas, [10, 0], FLAT, [50, 10000], lookahead_ticks = 0) == \
+        {"potion_capacity": 1, "ml_capacity": 0}
+
+
+def test_batch_matches_single_shops():
+    generator = np.random.default_rng(7)
+    shops, hours = 12, 6
+    gold = generator.integers(0, 6000, shops)
+    deltas = generator.integers(-20, 30, (shops, 2, hours)) * np.array([1, 100])[None, :, None]
+    levels = generator.integers(0, 50, (shops, 2)) * np.array([1, 200])
+    capacity_deltas = np.zeros((shops, 2, hours))
+    capacity_now = np.tile([50, 10000], (shops, 1))
+
+    batch = capacity.capacity_plans(gold, deltas, levels, capacity_deltas, capacity_now, lookahead_ticks = 2)
+
+    assert batch == [capacity.capacity_plan(gold[shop], deltas[shop], levels[shop], capacity_deltas[shop],
+                                            capacity_now[shop], lookahead_ticks = 2)
+                     for shop in range(shops)]
+    assert {plan["potion_capacity"] for plan in batch} == {0, 1}
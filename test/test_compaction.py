@@ -0,0 +1,116 @@
+import pytest
+from fastapi import Response
+from sqlalchemy import text
+from src import compaction
+from src import database as db
+from src.api import admin, carts
+
+count_hot_rows =    text('''SELECT COUNT(*)
+                            FROM potion_ledger
+                            WHERE epoch = :epoch''')
+
+archive_exists =    text('''SELECT to_regclass(:name) IS NOT NULL''')
+
+# Ways an epoch's recorded balances can disagree with its ledger rows
+TAMPERS = {
+    "gold": text('''UPDATE inventory_snapshot
+                    SET gold = gold + 1
+                    FROM resets
+                    WHERE resets.id = :epoch AND inventory_snapshot.reset_time = resets.timestamp'''),
+    "potion": text('''UPDATE potion_stock
+                      SET available = available + 1
+                      WHERE epoch = :epoch'''),
+}
+
+
+@pytest.fixture
+def closed_epoch(shop):
+    '''
+    An epoch that bottled five potions and sold two, closed by a reset.
+    '''
+    shop.bottle(5)
+    cart_id = shop.cart()
+    carts.set_item_quantity(cart_id, shop.red, carts.CartItem(quantity = 2), Response())
+    carts.checkout(cart_id, carts.CartCheckout(payment = "gold"))
+
+    epoch = shop.epoch()
+    admin.reset()
+    return epoch
+
+
+def compact(epoch, dry_run = False):
+    with db.engine.begin() as connection:
+        return compaction.compact(connection, epoch, dry_run)
+
+
+def hot_rows(epoch):
+    with db.engine.begin() as connection:
+        return connection.execute(count_hot_rows, {"epoch": epoch}).scalar_one()
+
+
+def archived(epoch):
+    with db.engine.begin() as connection:
+        return epoch in compaction.archived_epochs(connection)
+
+
+def test_only_closed_epochs_are_open_for_compaction(shop, closed_epoch):
+    with db.engine.begin() as connection:
+        epochs = compaction.open_epochs(connection)
+
+    assert closed_epoch in epochs
+    assert shop.epoch() not in epochs
+
+
+def test_archives_a_closed_epoch_that_matches_its_balances(closed_epoch):
+    rows = hot_rows(closed_epoch)
+
+    assert compact(closed_epoch) == {"archived": True, "mismatches": {}}
+
+    assert hot_rows(closed_epoch) == 0
+    assert archived(closed_epoch)
+    with db.engine.begin() as connection:
+        assert compaction.verify(connection, closed_epoch) == {}
+        moved = connection.execute(text(f"SELECT COUNT(*) FROM archive.potion_ledger_e{int(closed_epoch)}")).scalar_one()
+    assert moved == rows
+
+
+def test_dry_run_leaves_the_rows_in_place(closed_epoch):
+    rows = hot_rows(closed_epoch)
+
+    assert compact(closed_epoch, dry_run = True) == {"archived": False, "mismatches": {}}
+
+    assert hot_rows(closed_epoch) == rows
+    assert not archived(closed_epoch)
+
+
+@pytest.mark.parametrize("tamper", sorted(TAMPERS))
+def test_refuses_to_archive_when_the_balances_dont_match(closed_epoch, tamper):
+    rows = hot_rows(closed_epoch)
+    with db.engine.begin() as connection:
+        connection.execute(TAMPERS[tamper], {"epoch": closed_epoch})
+
+    result = compact(closed_epoch)
+
+    assert not result["archived"]
+    assert any(key.startswith(tamper) for key in result["mismatches"])
+    assert hot_rows(closed_epoch) == rows
+    assert not archived(closed_epoch)
+
+
+def test_purge_keeps_an_archive_that_no_longer_matches_its_summary(closed_epoch):
+    compact(closed_epoch)
+    name = f"archive.potion_ledger_e{int(closed_epoch)}"
+
+    with db.engine.begin() as connection:
+        connection.execute(text(f"DELETE FROM {name} WHERE ledger_id = (SELECT MIN(ledger_id) FROM {name})"))
+        assert compaction.purge(connection, closed_epoch)
+        assert connection.execute(archive_exists, {"name": name}).scalar_one()
+
+
+def test_purge_drops_a_verified_archive(closed_epoch):
+    compact(closed_epoch)
+    name = f"archive.potion_ledger_e{int(closed_epoch)}"
+
+    with db.engine.begin() as connection:
+        assert compaction.purge(connection, closed_epoch) == {}
+        assert not connection.execute(archive_exists, {"name": name}).scalar_one()
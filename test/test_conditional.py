@@ -0,0 +1,75 @@
+import pytest
+from fastapi import Request, Response
+from src.api import carts, catalog, conditional, inventory
+
+
+def request(if_none_match = None):
+    headers = [(b"if-none-match", if_none_match.encode())] if if_none_match else []
+    return Request({"type": "http", "headers": headers})
+
+
+@pytest.mark.parametrize("header, matched", [
+    ('"3-7"', True),
+    ('W/"3-7"', True),                      # weak comparison
+    ('"3-6", "3-7"', True),
+    ("*", True),
+    ('"3-6"', False),
+    ('"2-7"', False),                       # same version in an earlier epoch
+    (None, False),
+])
+def test_matches_if_none_match(header, matched):
+    assert conditional.matches(request(header), '"3-7"') == matched
+
+
+def test_without_a_snapshot_nothing_matches():
+    assert conditional.tag(None) is None
+    assert not conditional.matches(request("*"), None)
+
+
+def test_304_carries_the_etag_without_a_body():
+    cached = conditional.encode('"3-7"', [{"sku": "red_potion"}])
+
+    response = conditional.respond(request('"3-7"'), cached, conditional.CATALOG_CACHE_CONTROL)
+
+    assert response.status_code == 304
+    assert response.body == b""
+    assert response.headers["etag"] == '"3-7"'
+    assert response.headers["cache-control"] == conditional.CATALOG_CACHE_CONTROL
+
+
+def test_catalog_is_not_modified_until_a_cart_write(shop):
+    shop.bottle(5)
+    first = catalog.get_catalog(request())
+    etag = first.headers["etag"]
+
+    assert first.status_code == 200
+    assert catalog.get_catalog(request(etag)).status_code == 304
+    assert catalog.get_catalog(request(etag)).status_code == 304
+
+    carts.set_item_quantity(shop.cart(), shop.red, carts.CartItem(quantity = 1), Response())
+
+    changed = catalog.get_catalog(request(etag))
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != etag
+    assert catalog.get_catalog(request(changed.headers["etag"])).status_code == 304
+
+
+def test_audit_is_not_modified_until_a_delivery(shop):
+    etag = inventory.get_inventory(request()).headers["etag"]
+
+    assert inventory.get_inventory(request(etag)).status_code == 304
+
+    shop.bottle(2)
+
+    changed = inventory.get_inventory(request(etag))
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != etag
+
+
+def test_a_reset_starts_a_new_etag(shop):
+    from src.api import admin
+
+    etag = inventory.get_inventory(request()).headers["etag"]
+    admin.reset()
+
+    assert inventory.get_inventory(request(etag)).status_code == 200
@@ -0,0 +1,45 @@
+import pytest
+from src import async_database
+from src import database
+
+DIRECT = "postgresql://shop@db.example.supabase.co:5432/postgres"
+POOLER = "postgresql://shop@pooler.example.supabase.com:6543/postgres"
+
+
+@pytest.mark.parametrize("url, threshold", [
+    (DIRECT, 1),
+    ("postgresql://shop@localhost/postgres", 1),   # no port is the default 5432
+    (POOLER, None),
+])
+def test_prepares_only_on_the_direct_port_by_default(monkeypatch, url, threshold):
+    monkeypatch.delenv("DB_PREPARE_THRESHOLD", raising=False)
+
+    assert database.prepare_threshold(url) == threshold
+
+
+@pytest.mark.parametrize("setting, threshold", [("5", 5), ("off", None), ("", None)])
+def test_setting_overrides_the_port(monkeypatch, setting, threshold):
+    monkeypatch.setenv("DB_PREPARE_THRESHOLD", setting)
+
+    assert database.prepare_threshold(DIRECT) == threshold
+    assert database.prepare_threshold(POOLER) == threshold
+
+
+def test_asyncpg_caches_statements_only_on_the_direct_port(monkeypatch):
+    monkeypatch.delenv("DB_PREPARE_THRESHOLD", raising=False)
+    monkeypatch.delenv("DB_STATEMENT_CACHE_SIZE", raising=False)
+
+    assert async_database.asyncpg_url(DIRECT).query["prepared_statement_cache_size"] == "100"
+    assert async_database.asyncpg_url(POOLER).query["prepared_statement_cache_size"] == "0"
+
+
+def test_write_tokens_count_within_the_window(monkeypatch):
+    monkeypatch.setattr(database, "READ_YOUR_WRITES_SECONDS", 10)
+    monkeypatch.setattr(database.time, "time", lambda: 1000.0)
+
+    assert database.recently_written("995.5")
+    assert database.recently_written("1000.2")
+    assert not database.recently_written("989.0")
+    assert not database.recently_written("5000")
+    assert not database.recently_written("soon")
+    assert not database.recently_written(None)
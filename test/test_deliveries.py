@@ -0,0 +1,82 @@
+import threading
+import time
+from sqlalchemy import text
+from src import database as db
+from src import deliveries
+from src.api import barrels
+
+get_balances =  text('''SELECT (SELECT COUNT(*) FROM barrel_ledger WHERE epoch = current_epoch()) AS barrel_rows,
+                               (SELECT COUNT(*) FROM barrel_purchase WHERE order_id = :order_id) AS purchases,
+                               inventory.gold, inventory.red
+                        FROM inventory_snapshot inventory
+                        JOIN resets ON resets.timestamp = inventory.reset_time
+                        WHERE resets.id = current_epoch()''')
+
+
+def balances(order_id):
+    with db.engine.begin() as connection:
+        return dict(connection.execute(get_balances, {"order_id": order_id}).mappings().one())
+
+
+def small_red(quantity = 2):
+    return [barrels.Barrel(sku = "SMALL_RED_BARREL", ml_per_barrel = 500, potion_type = [1, 0, 0, 0], price = 100,
+                           quantity = quantity)]
+
+
+def test_recent_orders_keeps_the_most_recently_used():
+    recent = deliveries.RecentOrders(size = 2)
+    recent.put(("barrels", 1), "OK")
+    recent.put(("barrels", 2), "OK")
+    recent.get(("barrels", 1))
+    recent.put(("barrels", 3), "OK")
+
+    assert recent.get(("barrels", 2)) is None
+    assert recent.get(("barrels", 1)) == "OK"
+    assert recent.stats() == {"hits": 2, "size": 2, "capacity": 2}
+
+
+def test_duplicate_delivery_is_a_no_op(shop):
+    order_id = shop.order_id()
+    assert barrels.post_deliver_barrels(small_red(), order_id) == "OK"
+    delivered = balances(order_id)
+
+    assert barrels.post_deliver_barrels(small_red(), order_id) == "OK"
+
+    assert balances(order_id) == delivered
+    assert delivered["purchases"] == 1
+    assert delivered["red"] == 1000
+
+
+def test_replay_on_another_worker_returns_the_stored_result(shop, monkeypatch):
+    order_id = shop.order_id()
+    assert barrels.post_deliver_barrels(small_red(), order_id) == "OK"
+    delivered = balances(order_id)
+    monkeypatch.setattr(deliveries, "recent", deliveries.RecentOrders(size = 16))
+
+    # A different body under the same order id is still the first delivery's replay
+    assert barrels.post_deliver_barrels(small_red(quantity = 5), order_id) == "OK"
+
+    assert balances(order_id) == delivered
+    assert deliveries.recent.hits == 0
+
+
+def test_concurrent_duplicates_record_once(shop):
+    order_id = shop.order_id()
+    recorded = []
+
+    def record(connection):
+        recorded.append(order_id)
+        time.sleep(0.2)
+        return {"recorded": len(recorded)}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(deliveries.deliver("test", order_id, record)))
+               for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert recorded == [order_id]
+    assert sorted(delivered for _, delivered in results) == [False, False, True]
+    assert {str(result) for result, _ in results} == {str({"recorded": 1})}
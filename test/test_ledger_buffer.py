@@ -0,0 +1,85 @@
+import threading
+import pytest
+from src import ledger_buffer
+from src.api import carts
+
+
+def buffer():
+    # Long enough that the background thread never flushes during a test
+    return ledger_buffer.LedgerBuffer(interval = 60, max_items = 1000)
+
+
+def bought(cart_id):
+    return carts.checkout(cart_id, carts.CartCheckout(payment = "gold"))["total_potions_bought"]
+
+
+@pytest.mark.parametrize("setting, reason", [
+    ({}, None),
+    ({"WEB_CONCURRENCY": "1"}, None),
+    ({"WEB_CONCURRENCY": "4"}, "WEB_CONCURRENCY is 4"),
+    ({"VERCEL": "1"}, "serverless platform (VERCEL is set)"),
+    ({"AWS_LAMBDA_FUNCTION_NAME": "shop"}, "serverless platform (AWS_LAMBDA_FUNCTION_NAME is set)"),
+])
+def test_refuses_processes_that_share_requests(monkeypatch, setting, reason):
+    for name in ledger_buffer.SERVERLESS + ("WEB_CONCURRENCY",):
+        monkeypatch.delenv(name, raising = False)
+    for name, value in setting.items():
+        monkeypatch.setenv(name, value)
+
+    assert ledger_buffer.shared_process() == reason
+
+
+def test_flush_for_a_cart_with_nothing_queued_writes_nothing(monkeypatch):
+    items = buffer()
+    written = []
+    monkeypatch.setattr(items, "_write", written.append)
+    items.add(1, "red_potion", 1)
+
+    items.flush(cart_id = 2)
+    assert written == []
+
+    items.flush(cart_id = 1)
+    assert written == [[(1, "red_potion", 1)]]
+
+
+def test_flush_waits_for_a_write_under_way(monkeypatch):
+    items = buffer()
+    writing, release = threading.Event(), threading.Event()
+
+    def slow_write(queued):
+        writing.set()
+        release.wait(5)
+
+    monkeypatch.setattr(items, "_write", slow_write)
+    items.add(1, "red_potion", 1)
+    background = threading.Thread(target=items.flush)
+    background.start()
+    assert writing.wait(5)
+
+    # The cart's item has left the queue but isn't committed, so its checkout must wait for it
+    checkout = threading.Thread(target=items.flush, kwargs={"cart_id": 1})
+    checkout.start()
+    checkout.join(0.2)
+    assert checkout.is_alive()
+
+    release.set()
+    checkout.join(5)
+    background.join(5)
+    assert not checkout.is_alive()
+
+
+def test_short_flush_drops_items_without_overselling(shop):
+    shop.bottle(3)
+    first, short, last, unknown = (shop.cart() for _ in range(4))
+    items = buffer()
+
+    items.add(first, shop.red, 2)
+    items.add(short, shop.red, 2)           # only 1 left once the first cart's 2 are taken
+    items.add(last, shop.red, 1)
+    items.add(unknown, "no_such_potion", 1)
+    items.flush()
+
+    assert shop.available() == 0
+    assert [bought(cart_id) for cart_id in (first, short, last, unknown)] == [2, 0, 1, 0]
+    assert {key: items.stats()[key] for key in ("queued", "flushes", "written", "dropped")} == \
+        {"queued": 0, "flushes": 1, "written": 2, "dropped": 2}
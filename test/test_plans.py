@@ -0,0 +1,129 @@
+import numpy as np
+import pytest
+from src.planning import plans
+from src.planning.state import ShopStates, Strategy
+
+CATALOG = [
+    {"sku": "SMALL_GREEN_BARREL", "ml_per_barrel": 500, "potion_type": [0, 1, 0, 0], "price": 100, "quantity": 10},
+    {"sku": "MEDIUM_RED_BARREL", "ml_per_barrel": 2500, "potion_type": [1, 0, 0, 0], "price": 250, "quantity": 10},
+    {"sku": "SMALL_RED_BARREL", "ml_per_barrel": 500, "potion_type": [1, 0, 0, 0], "price": 100, "quantity": 10},
+]
+
+RED = {"type": [100, 0, 0, 0], "price": 50}
+GREEN = {"type": [0, 100, 0, 0], "price": 40}
+YELLOW = {"type": [50, 50, 0, 0], "price": 60}
+
+
+@pytest.fixture(autouse=True)
+def fresh_memo(monkeypatch):
+    '''
+    Every test solves from scratch rather than reading plans memoized by an earlier one.
+    '''
+    monkeypatch.setattr(plans, "memo", plans.PlanMemo(size = 256))
+
+
+def quantities(barrels):
+    return {barrel["sku"]: barrel["quantity"] for barrel in barrels}
+
+
+def test_barrel_plan_spends_gold_on_the_most_volume():
+    barrels = plans.barrel_plan(CATALOG, 1000, [0, 0, 0, 0], 10000, [100, 0, 0, 0], 1.0)
+
+    # Green is outside the target's ratios, and four medium barrels buy 10000 ml for the 1000 gold
+    assert quantities(barrels) == {"MEDIUM_RED_BARREL": 4}
+
+
+def test_barrel_plan_splits_volume_by_target_ratios():
+    barrels = plans.barrel_plan(CATALOG, 2400, [0, 0, 0, 0], 2000, [50, 50, 0, 0], 0.0)
+
+    assert quantities(barrels) == {"SMALL_RED_BARREL": 2, "SMALL_GREEN_BARREL": 2}
+
+
+def test_barrel_plan_buys_nothing_when_ratios_are_unaffordable():
+    assert plans.barrel_plan(CATALOG, 1100, [0, 0, 0, 0], 10000, [50, 50, 0, 0], 0.1) == []
+
+
+def test_bottle_plan_uses_volumes_on_hand():
+    bottles = plans.bottle_plan([RED, GREEN], [250, 120, 0, 0], 10)
+
+    assert bottles == [{"potion_type": RED["type"], "quantity": 2}, {"potion_type": GREEN["type"], "quantity": 1}]
+
+
+def test_bottle_plan_keeps_the_most_valuable_within_space():
+    bottles = plans.bottle_plan([RED, GREEN], [250, 120, 0, 0], 2)
+
+    assert bottles == [{"potion_type": RED["type"], "quantity": 2}]
+
+
+def test_bottle_plan_mixes_colors():
+    bottles = plans.bottle_plan([YELLOW, RED], [150, 50, 0, 0], 10)
+
+    assert bottles == [{"potion_type": YELLOW["type"], "quantity": 1}, {"potion_type": RED["type"], "quantity": 1}]
+
+
+def test_tick_plans_buys_barrels_for_what_it_bottles():
+    strategy = Strategy.from_potions([RED], 1.0)
+
+    [tick] = plans.tick_plans(CATALOG, ShopStates(1000, [0, 0, 0, 0], 0, 50, 10000), strategy)
+
+    assert quantities(tick["barrels"]) == {"MEDIUM_RED_BARREL": 4}
+    assert tick["bottles"] == [{"potion_type": RED["type"], "quantity": 50}]
+
+
+def test_tick_plans_serves_the_bottler_from_the_joint_solve():
+    strategy = Strategy.from_potions([RED], 1.0)
+    [tick] = plans.tick_plans(CATALOG, ShopStates(1000, [0, 0, 0, 0], 0, 50, 10000), strategy)
+    misses = plans.memo.misses
+
+    delivered = plans.delivered_volumes([0, 0, 0, 0], tick["barrels"])
+
+    assert plans.bottle_plan(strategy.potions, delivered, 50) == tick["bottles"]
+    assert plans.memo.misses == misses
+
+
+def test_tick_plans_bottles_on_hand_without_a_feasible_purchase():
+    strategy = Strategy.from_potions([RED], 0.0)
+
+    [tick] = plans.tick_plans(CATALOG, ShopStates(0, [300, 0, 0, 0], 0, 50, 10000), strategy)
+
+    assert tick == {"barrels": [], "bottles": [{"potion_type": RED["type"], "quantity": 3}]}
+
+
+STATES = ShopStates(gold = [1000, 0, 2400, 1000, 300],
+                    volumes = [[0, 0, 0, 0], [300, 0, 0, 0], [0, 0, 0, 0], [0, 0, 0, 0], [1200, 900, 0, 0]],
+                    num_potions = [0, 0, 10, 0, 45],
+                    potion_capacity = 50,
+                    volume_capacity = [10000, 10000, 2000, 10000, 10000])
+
+
+def test_tick_plans_batch_matches_single_states(monkeypatch):
+    strategy = Strategy.from_potions([YELLOW, RED, GREEN], 0.5, target = [50, 50, 0, 0])
+    batch = plans.tick_plans(CATALOG, STATES, strategy)
+
+    for index in range(len(STATES)):
+        monkeypatch.setattr(plans, "memo", plans.PlanMemo(size = 256))
+        assert plans.tick_plans(CATALOG, STATES[index], strategy) == [batch[index]]
+
+
+def test_barrel_rows_batch_matches_single_states():
+    rows, limits = plans.barrel_rows(CATALOG, STATES, [50, 50, 0, 0], 0.5)
+
+    for index in range(len(STATES)):
+        single_rows, single_limits = plans.barrel_rows(CATALOG, STATES[index], [50, 50, 0, 0], 0.5)
+        assert single_rows == rows
+        np.testing.assert_allclose(single_limits, limits[index:index + 1])
+
+
+def test_purchase_and_bottling_plans_match_single_states():
+    strategy = Strategy.from_potions([YELLOW, RED], 0.5)
+
+    purchases = plans.purchase_plans(CATALOG, STATES, strategy)
+    bottles = plans.bottling_plans(STATES, strategy)
+
+    for index in range(len(STATES)):
+        assert plans.purchase_plans(CATALOG, STATES[index], strategy) == [purchases[index]]
+        assert plans.bottling_plans(STATES[index], strategy) == [bottles[index]]
+
+
+def test_nothing_bought_without_a_strategy():
+    assert plans.purchase_plans(CATALOG, STATES, Strategy.from_today(None)) == [[]] * len(STATES)
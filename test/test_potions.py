@@ -0,0 +1,69 @@
+import contextlib
+import types
+import pytest
+from fastapi import HTTPException
+from src import potions
+
+RED = [100, 0, 0, 0]
+GREEN = [0, 100, 0, 0]
+
+
+class Catalog:
+    '''
+    Stands in for the engine: answers the potion id query from rows that a test can add to.
+    '''
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    @contextlib.contextmanager
+    def begin(self):
+        yield self
+
+    def execute(self, statement):
+        return types.SimpleNamespace(all=lambda: list(self.rows))
+
+
+@pytest.fixture
+def catalog(monkeypatch):
+    catalog = Catalog([(1, *RED)])
+    monkeypatch.setattr(potions, "db", types.SimpleNamespace(engine=catalog))
+    return catalog
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = types.SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(potions.time, "monotonic", lambda: clock.now)
+    return clock
+
+
+def test_loads_once_for_known_types(catalog, clock):
+    ids = potions.PotionIds(reload_after = 60)
+
+    assert [ids.get(RED) for _ in range(3)] == [1, 1, 1]
+    assert ids.loads == 1
+
+
+def test_misses_reuse_the_map_until_it_is_due_for_a_reload(catalog, clock):
+    ids = potions.PotionIds(reload_after = 60)
+    ids.get(RED)
+
+    clock.now += 30
+    assert [ids.get(GREEN) for _ in range(5)] == [None] * 5
+    assert ids.loads == 1
+
+    catalog.rows.append((2, *GREEN))
+    clock.now += 30
+    assert ids.get(GREEN) == 2
+    assert ids.loads == 2
+
+
+def test_unknown_type_is_a_404(catalog, clock):
+    ids = potions.PotionIds(reload_after = 60)
+
+    with pytest.raises(HTTPException) as raised:
+        ids.require(GREEN)
+
+    assert raised.value.status_code == 404
+    assert ids.require(RED) == 1
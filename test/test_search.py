@@ -0,0 +1,71 @@
+import base64
+import json
+from datetime import datetime, timezone
+import pytest
+from fastapi import HTTPException
+from src import queries
+from src.api import carts
+
+
+@pytest.mark.parametrize("direction, sort_value, ledger_id", [
+    ("next", "Bartholomew", 17),
+    ("prev", 250, 3),
+    ("next", None, 1),
+])
+def test_page_token_round_trip(direction, sort_value, ledger_id):
+    token = carts.encode_search_page(direction, sort_value, ledger_id)
+
+    assert "=" not in token
+    assert carts.decode_search_page(token) == (direction, sort_value, ledger_id)
+
+
+def test_page_token_carries_timestamps_as_iso_strings():
+    timestamp = datetime(2024, 3, 1, 12, 30, 15, 123456, tzinfo=timezone.utc)
+
+    token = carts.encode_search_page("next", timestamp, 42)
+
+    assert carts.decode_search_page(token) == ("next", timestamp.isoformat(), 42)
+
+
+def test_empty_token_is_the_first_page():
+    assert carts.decode_search_page("") is None
+
+
+def token_of(value):
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode()
+
+
+@pytest.mark.parametrize("token", [
+    "not a token!",
+    "e30",                                  # {} is not a position
+    token_of(["next", "a"]),                # too few fields
+    token_of(["sideways", "a", 1]),         # unknown direction
+    token_of(["next", "a", "1"]),           # ledger id must be an int
+])
+def test_invalid_token_is_a_400(token):
+    with pytest.raises(HTTPException) as raised:
+        carts.decode_search_page(token)
+
+    assert raised.value.status_code == 400
+
+
+def test_search_rejects_a_bad_token_before_querying():
+    with pytest.raises(HTTPException) as raised:
+        carts.search_orders(search_page="%%%")
+
+    assert raised.value.status_code == 400
+
+
+@pytest.mark.parametrize("by_name", [False, True])
+@pytest.mark.parametrize("by_sku", [False, True])
+def test_search_variants_carry_only_their_filters(by_name, by_sku):
+    for (_, _, keyset, name, sku), statement in queries.search_orders.items():
+        if (name, sku) != (by_name, by_sku):
+            continue
+        sql = statement.text
+
+        assert (":customer_name" in sql) == by_name
+        assert (":potion_sku" in sql) == by_sku
+        assert (":ledger_id" in sql) == keyset
+        assert " OR " not in sql
+        assert "epoch" not in sql               # search covers every reset epoch
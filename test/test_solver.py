@@ -0,0 +1,81 @@
+import math
+import random
+import pytest
+from src.planning import solver
+
+
+def objective_value(objective, quantities):
+    return sum(coefficient * quantity for coefficient, quantity in zip(objective, quantities))
+
+
+def satisfies(rows, limits, upper, quantities):
+    return (all(0 <= quantity <= bound for quantity, bound in zip(quantities, upper))
+            and all(sum(a * x for a, x in zip(row, quantities)) <= limit + 1e-6 for row, limit in zip(rows, limits)))
+
+
+def random_program(generator: random.Random):
+    '''
+    A small bounded integer program with mixed-sign rows, so some draws are infeasible.
+    '''
+    variables, constraints = generator.randint(1, 5), generator.randint(1, 4)
+    objective = [generator.randint(-3, 12) for _ in range(variables)]
+    rows = [[generator.randint(-6, 10) for _ in range(variables)] for _ in range(constraints)]
+    limits = [generator.randint(-15, 60) for _ in range(constraints)]
+    upper = [generator.randint(0, 12) for _ in range(variables)]
+    return objective, rows, limits, upper
+
+
+@pytest.mark.parametrize("seed", range(60))
+def test_matches_cbc_on_random_programs(seed):
+    objective, rows, limits, upper = random_program(random.Random(seed))
+
+    exact = solver.maximize(objective, rows, limits, upper)
+    cbc = solver.maximize_with_cbc(objective, rows, limits, upper)
+
+    assert (exact is None) == (cbc is None)
+    if exact is not None:
+        assert satisfies(rows, limits, upper, exact)
+        assert objective_value(objective, exact) == objective_value(objective, cbc)
+
+
+def test_knapsack():
+    # Filling the weight with the denser item alone (15) loses to mixing one heavy and three light (17)
+    quantities = solver.maximize([5, 4], [[3, 2]], [9], [10, 10])
+
+    assert quantities == [1, 3]
+
+
+def test_unbounded_variables_capped_by_rows():
+    quantities = solver.maximize([2, 3], [[1, 1], [1, 3]], [4, 6], [math.inf, math.inf])
+
+    assert objective_value([2, 3], quantities) == 9
+    assert satisfies([[1, 1], [1, 3]], [4, 6], [math.inf, math.inf], quantities)
+
+
+def test_lower_bound_rows():
+    # -x <= -3 forces at least three of the only item, which still fits the budget
+    quantities = solver.maximize([-1], [[-1], [2]], [-3, 10], [10])
+
+    assert quantities == [3]
+
+
+@pytest.mark.parametrize("rows, limits", [
+    ([[1, 1]], [-1]),                  # nonnegative row below zero, caught in presolve
+    ([[1, -1], [-1, 1]], [-1, -1]),    # x - y <= -1 and y - x <= -1, infeasible relaxation
+    ([[2, -2], [-2, 2]], [1, -1]),     # 2(x - y) = 1 has a relaxed point but no integer one
+])
+def test_infeasible(rows, limits):
+    assert solver.maximize([1, 1], rows, limits, [10, 10]) is None
+    assert solver.maximize_with_cbc([1, 1], rows, limits, [10, 10]) is None
+
+
+def test_unbounded():
+    objective, rows, limits, upper = [1, 0], [[1, -1]], [0], [math.inf, math.inf]
+
+    with pytest.raises(ValueError):
+        solver.maximize(objective, rows, limits, upper)
+    assert solver.maximize_with_cbc(objective, rows, limits, upper) is None
+
+
+def test_nothing_to_buy():
+    assert solver.maximize([4, 7], [[1, 1]], [10], [0, 0]) == [0, 0]
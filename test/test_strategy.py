@@ -0,0 +1,69 @@
+import contextlib
+import types
+import pytest
+from src import strategy
+
+MONDAY = [{"day_name": "Monday", "tolerance": 0.5, "deviation": 0.1, "ratios": [100, 0, 0, 0],
+           "type": [100, 0, 0, 0], "price": 50, "potion_id": 1}]
+
+
+class Days:
+    '''
+    Stands in for the engine: counts reads of today's strategy and answers them from rows.
+    '''
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.reads = 0
+
+    @contextlib.contextmanager
+    def begin(self):
+        yield self
+
+    def execute(self, statement, parameters = None):
+        if statement is strategy.queries.get_today:
+            self.reads += 1
+        return types.SimpleNamespace(mappings=lambda: types.SimpleNamespace(all=lambda: list(self.rows)))
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = types.SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(strategy.time, "monotonic", lambda: clock.now)
+    return clock
+
+
+def engine(monkeypatch, rows):
+    days = Days(rows)
+    monkeypatch.setattr(strategy, "db", types.SimpleNamespace(engine=days))
+    return days
+
+
+def test_holds_the_day_until_it_expires(monkeypatch, clock):
+    days = engine(monkeypatch, MONDAY)
+    daily = strategy.DailyStrategy(refresh = 300)
+
+    assert [daily.today()["day_name"] for _ in range(3)] == ["Monday"] * 3
+    assert days.reads == 1
+
+    clock.now += 300
+    daily.today()
+    assert days.reads == 2
+
+
+def test_holds_a_day_without_a_strategy(monkeypatch, clock):
+    days = engine(monkeypatch, [])
+    daily = strategy.DailyStrategy(refresh = 300)
+
+    assert [daily.today() for _ in range(3)] == [None] * 3
+    assert days.reads == 1
+
+
+def test_set_day_switches_without_another_read(monkeypatch, clock):
+    days = engine(monkeypatch, [])
+    daily = strategy.DailyStrategy(refresh = 300)
+
+    assert daily.set_day("Sunday")
+    assert not daily.set_day("Sunday")
+    assert daily.today() is None
+    assert days.reads == 1